@@ -1,21 +1,193 @@
+from threading import Lock
+import time
 from sqlalchemy import create_engine
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker, declarative_base
 from dotenv import load_dotenv
+from fastapi import Request
 import os
+from metrics import instrument_engine
+import profiling
 
 load_dotenv()  # loads backend/.env
 
-DATABASE_URL = os.getenv("DATABASE_URL")
-if not DATABASE_URL:
-    raise RuntimeError("DATABASE_URL is not set. Ensure backend/.env exists.")
+# Nothing here touches the database at import time. Engines (and their pools) are
+# created on first use, normally from the app's lifespan hook, so every worker
+# process builds its own pools after it has started, and tooling can import the
+# models without a DATABASE_URL. The schema is owned by the Alembic migrations;
+# DB_CREATE_ALL=1 makes startup run create_all instead (local development only).
+#
+# With DATABASE_REPLICA_URL set, read-only endpoints (get_read_db) use a replica
+# engine and everything else the primary. A client that has just written is sent
+# to the primary for REPLICA_STICKY_SECONDS so it reads its own writes; see
+# read_primary_until().
 
-engine = create_engine(DATABASE_URL, pool_pre_ping=True)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+PRIMARY, REPLICA = "primary", "replica"
+
+_lock = Lock()
+_engines = {}  # (role, is_async) -> engine
+_async_sessionmakers = {}  # role -> async_sessionmaker
+_sessionmaker = sessionmaker(autocommit=False, autoflush=False)
+
+def database_url():
+    url = os.getenv("DATABASE_URL")
+    if not url:
+        raise RuntimeError("DATABASE_URL is not set. Ensure backend/.env exists.")
+    return url
+
+def replica_url():
+    return os.getenv("DATABASE_REPLICA_URL") or None
+
+def replica_enabled():
+    return replica_url() is not None
+
+def sticky_seconds():
+    return float(os.getenv("REPLICA_STICKY_SECONDS", "5"))
+
+def pool_kwargs():
+    # Per-process pool sizing; each worker process gets its own pool of this size
+    # (per engine, so a replica doubles it)
+    return {
+        "pool_size": int(os.getenv("DB_POOL_SIZE", "5")),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "10")),
+        "pool_timeout": int(os.getenv("DB_POOL_TIMEOUT", "30")),
+    }
+
+def get_engine(role: str = PRIMARY):
+    # The replica role falls back to the primary when no replica is configured
+    if role == REPLICA and not replica_enabled():
+        role = PRIMARY
+    engine = _engines.get((role, False))
+    if engine is None:
+        with _lock:
+            engine = _engines.get((role, False))
+            if engine is None:
+                url = replica_url() if role == REPLICA else database_url()
+                engine = create_engine(url, pool_pre_ping=True, **pool_kwargs())
+                instrument_engine(engine)
+                profiling.instrument_engine(engine)
+                _engines[(role, False)] = engine
+    return engine
+
+def SessionLocal(role: str = PRIMARY):
+    return _sessionmaker(bind=get_engine(role))
+
+def dialect_insert(db):
+    # insert() with ON CONFLICT support for the session's database
+    name = db.get_bind().dialect.name
+    if name == "postgresql":
+        return postgresql.insert
+    if name == "sqlite":
+        return sqlite.insert
+    raise RuntimeError(f"ON CONFLICT inserts are not available on {name}")
+
+def create_all_enabled():
+    return os.getenv("DB_CREATE_ALL", "0") == "1"
+
+def init_db():
+    # Called from the lifespan hook: builds this process's engine(s) up front and, when
+    # DB_CREATE_ALL=1, creates missing tables
+    engine = get_engine()
+    get_engine(REPLICA)
+    if DB_ASYNC:
+        get_async_engine()
+        get_async_engine(REPLICA)
+    if create_all_enabled():
+        Base.metadata.create_all(bind=engine)
+
+async def dispose_db():
+    with _lock:
+        engines = dict(_engines)
+        _engines.clear()
+        _async_sessionmakers.clear()
+    for (_, is_async), engine in engines.items():
+        if is_async:
+            await engine.dispose()
+        else:
+            engine.dispose()
+
+def read_primary_until(request):
+    # Epoch seconds until which this client must read from the primary, from the
+    # X-Read-Primary-Until header or the read_primary_until cookie (set after writes).
+    # The client supplies it, so a time further ahead than a write would have set is
+    # ignored; otherwise any client could pin its reads to the primary for good.
+    value = request.headers.get("x-read-primary-until") or request.cookies.get("read_primary_until")
+    try:
+        until = float(value) if value else 0.0
+    except ValueError:
+        return 0.0
+    return until if until <= time.time() + sticky_seconds() else 0.0
+
+def read_role(request):
+    if not replica_enabled() or read_primary_until(request) > time.time():
+        return PRIMARY
+    request.state.read_replica = True
+    return REPLICA
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+def get_read_db(request: Request):
+    # For read-only endpoints: the replica when configured and the client has not just written
+    db = SessionLocal(read_role(request))
+    try:
+        yield db
+    finally:
+        db.close()
+
+# Optional asyncio path (DB_ASYNC=1): the read and payment endpoints run on an
+# AsyncSession over asyncpg / aiosqlite instead of the threadpool.
+DB_ASYNC = os.getenv("DB_ASYNC", "0") == "1"
+
+def async_url(url: str):
+    u = make_url(url)
+    if u.drivername in ("postgresql", "postgresql+psycopg2"):
+        query = dict(u.query)
+        query.pop("channel_binding", None)  # not understood by asyncpg
+        if "sslmode" in query:
+            query["ssl"] = query.pop("sslmode")
+        return u.set(drivername="postgresql+asyncpg", query=query)
+    if u.drivername in ("sqlite", "sqlite+pysqlite"):
+        return u.set(drivername="sqlite+aiosqlite")
+    return u
+
+def get_async_engine(role: str = PRIMARY):
+    if role == REPLICA and not replica_enabled():
+        role = PRIMARY
+    engine = _engines.get((role, True))
+    if engine is None:
+        from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+        with _lock:
+            engine = _engines.get((role, True))
+            if engine is None:
+                if role == REPLICA:
+                    url = os.getenv("ASYNC_DATABASE_REPLICA_URL") or async_url(replica_url())
+                else:
+                    url = os.getenv("ASYNC_DATABASE_URL") or async_url(database_url())
+                engine = create_async_engine(url, pool_pre_ping=True, **pool_kwargs())
+                instrument_engine(engine.sync_engine)
+                profiling.instrument_engine(engine.sync_engine)
+                _async_sessionmakers[role] = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+                _engines[(role, True)] = engine
+    return engine
+
+def async_session(role: str = PRIMARY):
+    get_async_engine(role)
+    if role == REPLICA and not replica_enabled():
+        role = PRIMARY
+    return _async_sessionmakers[role]()
+
+async def get_async_db():
+    async with async_session() as db:
+        yield db
+
+async def get_async_read_db(request: Request):
+    async with async_session(read_role(request)) as db:
+        yield db
@@ -0,0 +1,115 @@
+"""Load benchmark: threadpool (sync) endpoints vs. the DB_ASYNC=1 asyncio path.
+
+Seeds a database, then for each mode starts uvicorn in a subprocess and drives
+the read endpoints with many concurrent clients (httpx), reporting requests per
+second and latency percentiles. The response cache is disabled so every request
+reaches the database.
+
+    python bench_async.py --clients 200 --requests 4000
+    python bench_async.py --url postgresql://localhost/rentals_bench
+
+The target database is wiped first; never point it at real data.
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime
+
+parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+parser.add_argument("--url", help="database to benchmark (default: temporary SQLite file)")
+parser.add_argument("--houses", type=int, default=200)
+parser.add_argument("--clients", type=int, default=200)
+parser.add_argument("--requests", type=int, default=4000)
+parser.add_argument("--paths", default="/stats,/houses,/tenants")
+parser.add_argument("--port", type=int, default=8765)
+args = parser.parse_args()
+
+url = args.url or f"sqlite:///{tempfile.mkdtemp()}/bench_async.db"
+os.environ["DATABASE_URL"] = url
+
+import httpx
+from sqlalchemy import create_engine, insert
+from models import Base, House, Tenant, HouseTenant, Payment
+from utils import shift_month
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+def seed():
+    engine = create_engine(url)
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    today = date.today()
+    with engine.begin() as conn:
+        conn.execute(insert(House), [
+            {"id": n, "number": n, "type": "single", "monthly_rent": 3000, "is_active": True} for n in range(1, args.houses + 1)
+        ])
+        conn.execute(insert(Tenant), [
+            {"id": n, "full_name": f"Tenant {n}", "phone": f"+2547{n:08d}", "gov_id": str(n), "is_active": True}
+            for n in range(1, args.houses + 1)
+        ])
+        conn.execute(insert(HouseTenant), [
+            {"house_id": n, "tenant_id": n, "status": "active", "start_date": date(today.year - 1, 1, 1)}
+            for n in range(1, args.houses + 1)
+        ])
+        payments = []
+        for i in range(12):
+            y, m = shift_month(today.year, today.month, -i)
+            payments += [{
+                "house_id": n, "tenant_id": n, "method": "mpesa", "amount": 3000, "target_year": y, "target_month": m,
+                "paid_at": datetime(y, m, 3, 10), "status": "confirmed"
+            } for n in range(1, args.houses + 1)]
+        conn.execute(insert(Payment), payments)
+    engine.dispose()
+
+async def drive(base_url: str):
+    paths = args.paths.split(",")
+    latencies = []
+    counter = iter(range(args.requests))
+    limits = httpx.Limits(max_connections=args.clients, max_keepalive_connections=args.clients)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        async def worker():
+            for i in counter:
+                t0 = time.perf_counter()
+                r = await client.get(paths[i % len(paths)])
+                r.raise_for_status()
+                latencies.append(time.perf_counter() - t0)
+        t0 = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.clients)))
+        elapsed = time.perf_counter() - t0
+    latencies.sort()
+    pct = lambda p: latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000
+    return {"rps": len(latencies) / elapsed, "p50": pct(0.50), "p95": pct(0.95), "p99": pct(0.99)}
+
+def run_mode(db_async: bool):
+    env = {**os.environ, "DATABASE_URL": url, "DB_ASYNC": "1" if db_async else "0", "RESPONSE_CACHE_SIZE": "0"}
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.port), "--log-level", "warning", "--timeout-keep-alive", "120"],
+        cwd=HERE, env=env
+    )
+    try:
+        base_url = f"http://127.0.0.1:{args.port}"
+        for _ in range(100):
+            try:
+                httpx.get(base_url + "/")
+                break
+            except httpx.TransportError:
+                time.sleep(0.1)
+        return asyncio.run(drive(base_url))
+    finally:
+        proc.terminate()
+        proc.wait()
+
+def run():
+    seed()
+    results = {}
+    for label, db_async in (("threadpool", False), ("async", True)):
+        results[label] = run_mode(db_async)
+        r = results[label]
+        print(f"{label:>10}: {r['rps']:8.1f} req/s  p50 {r['p50']:7.1f} ms  p95 {r['p95']:7.1f} ms  p99 {r['p99']:7.1f} ms")
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,165 @@
+"""Endpoint benchmark: latency percentiles, SQL statements and peak memory per endpoint.
+
+Generates a synthetic estate with seed.generate(), then drives each endpoint
+in-process through FastAPI's TestClient with the response cache off, so every
+request reaches the database. Statement counts come from the X-Query-Count
+header; peak memory is the tracemalloc peak of one extra request. Results are
+written as JSON; pass --compare with an earlier file to print the change.
+
+    python bench_endpoints.py --houses 2000 --years 3 --out bench.json
+    python bench_endpoints.py --compare bench.json --out bench-new.json
+    python bench_endpoints.py --url postgresql://localhost/rentals_bench
+
+The target database is wiped first (unless --no-seed); never point it at real data.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+parser.add_argument("--url", help="database to benchmark (default: temporary SQLite file)")
+parser.add_argument("--houses", type=int, default=1000)
+parser.add_argument("--tenants-per-house", type=int, default=1)
+parser.add_argument("--years", type=int, default=2)
+parser.add_argument("--seed", type=int, default=42)
+parser.add_argument("--requests", type=int, default=50, help="requests per endpoint")
+parser.add_argument("--only", help="comma-separated endpoint names to run")
+parser.add_argument("--no-seed", action="store_true", help="reuse the data already in --url")
+parser.add_argument("--out", default="bench_endpoints.json")
+parser.add_argument("--compare", help="earlier results file to diff against")
+args = parser.parse_args()
+
+os.environ["DATABASE_URL"] = args.url or f"sqlite:///{tempfile.mkdtemp()}/bench_endpoints.db"
+os.environ["RESPONSE_CACHE_SIZE"] = "0"
+os.environ["METRICS_QUERY_COUNT_HEADER"] = "1"
+os.environ["SCHEDULER_ENABLED"] = "0"
+os.environ["DB_ASYNC"] = "0"
+
+from fastapi.testclient import TestClient
+from base import Base, get_engine
+import main
+import seed
+from utils import today_date
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+def endpoints(rng: random.Random, houses: int):
+    # name -> (method, make_path, make_json)
+    year = today_date().year
+    month = today_date().month
+    house = lambda: rng.randint(1, houses)
+
+    def payment():
+        h = house()
+        return {
+            "house_id": h, "tenant_id": (h - 1) * args.tenants_per_house + 1, "method": "cash",
+            "amount": rng.choice((1000, 3000, 9000)), "target_year": year, "target_month": month
+        }
+
+    return {
+        "GET /stats": ("GET", lambda: "/stats", None),
+        "GET /houses": ("GET", lambda: "/houses", None),
+        "GET /tenants": ("GET", lambda: "/tenants", None),
+        "GET /tenants/search": ("GET", lambda: f"/tenants/search?q={rng.choice(seed.LAST_NAMES)[:4]}", None),
+        "GET /payments": ("GET", lambda: "/payments?limit=50", None),
+        "GET /houses/{id}/ledger/{year}": ("GET", lambda: f"/houses/{house()}/ledger/{year}", None),
+        "GET /ledger/{year}": ("GET", lambda: f"/ledger/{year}", None),
+        "GET /reports/daily": ("GET", lambda: f"/reports/daily/{year}/{month}/1", None),
+        "GET /reports/monthly": ("GET", lambda: f"/reports/monthly/{year}/{month}", None),
+        "GET /reports/yearly": ("GET", lambda: f"/reports/yearly/{year}", None),
+        "POST /payments": ("POST", lambda: "/payments", payment),
+    }
+
+def percentile(sorted_values: list, p: float):
+    return sorted_values[min(len(sorted_values) - 1, int(p * len(sorted_values)))]
+
+def bench_endpoint(client: TestClient, method: str, make_path, make_json):
+    latencies, statements = [], []
+    for _ in range(args.requests):
+        path, body = make_path(), make_json() if make_json else None
+        t0 = time.perf_counter()
+        r = client.request(method, path, json=body)
+        latencies.append((time.perf_counter() - t0) * 1000)
+        r.raise_for_status()
+        statements.append(int(r.headers.get("x-query-count", 0)))
+    tracemalloc.start()
+    client.request(method, make_path(), json=make_json() if make_json else None)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    latencies.sort()
+    statements.sort()
+    return {
+        "requests": len(latencies),
+        "p50_ms": round(percentile(latencies, 0.50), 3),
+        "p95_ms": round(percentile(latencies, 0.95), 3),
+        "p99_ms": round(percentile(latencies, 0.99), 3),
+        "mean_ms": round(sum(latencies) / len(latencies), 3),
+        "sql_statements": statements[len(statements) // 2],
+        "sql_statements_max": statements[-1],
+        "peak_kib": round(peak / 1024, 1),
+    }
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def print_comparison(results: dict, previous: dict):
+    print(f"\nvs {previous['meta'].get('commit')} ({previous['meta'].get('generated_at')}):")
+    for name, r in results["endpoints"].items():
+        old = previous["endpoints"].get(name)
+        if not old:
+            continue
+        change = (r["p95_ms"] - old["p95_ms"]) / old["p95_ms"] * 100 if old["p95_ms"] else 0.0
+        print(f"{name:<32} p95 {old['p95_ms']:9.2f} -> {r['p95_ms']:9.2f} ms ({change:+6.1f}%)  "
+              f"sql {old['sql_statements']:>4} -> {r['sql_statements']:<4}  peak {old['peak_kib']:>9} -> {r['peak_kib']} KiB")
+
+def run():
+    counts = None
+    if not args.no_seed:
+        Base.metadata.drop_all(get_engine())
+        Base.metadata.create_all(get_engine())
+        t0 = time.perf_counter()
+        counts = seed.generate(args.houses, args.tenants_per_house, args.years, seed=args.seed)
+        print(f"Generated {counts} in {time.perf_counter() - t0:.1f}s")
+
+    rng = random.Random(args.seed)
+    selected = endpoints(rng, args.houses)
+    if args.only:
+        names = set(args.only.split(","))
+        selected = {k: v for k, v in selected.items() if k in names}
+
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "generated_at": datetime.now().isoformat(timespec="seconds"),
+            "dialect": get_engine().dialect.name,
+            "python": platform.python_version(),
+            "houses": args.houses, "tenants_per_house": args.tenants_per_house, "years": args.years,
+            "seed": args.seed, "requests": args.requests, "rows": counts,
+        },
+        "endpoints": {},
+    }
+    with TestClient(main.app) as client:
+        for name, (method, make_path, make_json) in selected.items():
+            r = results["endpoints"][name] = bench_endpoint(client, method, make_path, make_json)
+            print(f"{name:<32} p50 {r['p50_ms']:9.2f}  p95 {r['p95_ms']:9.2f}  p99 {r['p99_ms']:9.2f} ms  "
+                  f"sql {r['sql_statements']:>4}  peak {r['peak_kib']:>9} KiB")
+
+    with open(args.out, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Saved {args.out}")
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(results, json.load(f))
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,166 @@
+"""Query-plan and timing benchmark for the 0002 index migration.
+
+Builds a synthetic dataset at revision 0001 (no secondary indexes), times
+the hot lookups and prints their plans, then upgrades to head and repeats.
+
+    python bench_indexes.py --houses 1000 --years 5
+    python bench_indexes.py --url postgresql://localhost/rentals_bench
+
+The target database is wiped first; never point it at real data.
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import date, datetime
+
+parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+parser.add_argument("--url", help="database to benchmark (default: temporary SQLite file)")
+parser.add_argument("--houses", type=int, default=1000)
+parser.add_argument("--years", type=int, default=5)
+parser.add_argument("--repeat", type=int, default=20)
+args = parser.parse_args()
+
+url = args.url or f"sqlite:///{tempfile.mkdtemp()}/bench_indexes.db"
+os.environ["DATABASE_URL"] = url  # env.py and base.py read it; must beat backend/.env
+
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import create_engine, text, insert, MetaData
+from models import Base
+from utils import make_month, shift_month, due_date_for_month
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+QUERIES = {
+    "invoice by house+period": (
+        "SELECT id FROM invoices WHERE house_id = :house_id AND period_start = :start AND period_end = :end",
+        lambda ctx: {"house_id": ctx["house_id"], "start": ctx["start"], "end": ctx["end"]},
+    ),
+    "confirmed total for house": (
+        "SELECT SUM(amount) FROM payments WHERE house_id = :house_id AND status = 'confirmed'",
+        lambda ctx: {"house_id": ctx["house_id"]},
+    ),
+    "received in month (paid_at range)": (
+        "SELECT SUM(amount) FROM payments WHERE status = 'confirmed' AND paid_at >= :since AND paid_at < :until",
+        lambda ctx: {"since": ctx["since"], "until": ctx["until"]},
+    ),
+    "active assignment": (
+        "SELECT id FROM house_tenants WHERE house_id = :house_id AND tenant_id = :tenant_id AND status = 'active'",
+        lambda ctx: {"house_id": ctx["house_id"], "tenant_id": ctx["house_id"]},
+    ),
+    "invoice paid totals (join)": (
+        "SELECT i.id, SUM(p.amount) FROM invoices i LEFT JOIN payments p ON p.invoice_id = i.id AND p.status = 'confirmed' "
+        "WHERE i.house_id = :house_id GROUP BY i.id",
+        lambda ctx: {"house_id": ctx["house_id"]},
+    ),
+}
+
+def alembic_config():
+    cfg = Config(os.path.join(HERE, "alembic.ini"))
+    cfg.set_main_option("sqlalchemy.url", url.replace("%", "%%"))
+    return cfg
+
+def generate(engine):
+    # Inserts go through the reflected 0001 tables: the models describe head, which has
+    # columns this revision does not
+    meta = MetaData()
+    meta.reflect(engine)
+    House, Tenant, HouseTenant, Invoice, Payment = (
+        meta.tables[t] for t in ("houses", "tenants", "house_tenants", "invoices", "payments")
+    )
+    rng = random.Random(42)
+    today = date.today()
+    months = [shift_month(today.year, today.month, -i) for i in range(args.years * 12 - 1, -1, -1)]
+    with engine.begin() as conn:
+        conn.execute(insert(House), [
+            {"id": n, "number": n, "type": "single", "monthly_rent": 3000, "is_active": True}
+            for n in range(1, args.houses + 1)
+        ])
+        conn.execute(insert(Tenant), [
+            {"id": n, "full_name": f"Tenant {n}", "phone": f"+2547{n:08d}", "gov_id": str(n), "is_active": True}
+            for n in range(1, args.houses + 1)
+        ])
+        conn.execute(insert(HouseTenant), [
+            {"house_id": n, "tenant_id": n, "status": "active", "start_date": date(*months[0], 1)}
+            for n in range(1, args.houses + 1)
+        ])
+        inv_id = 0
+        for y, m in months:
+            start, end = make_month(y, m)
+            invoices, payments = [], []
+            for n in range(1, args.houses + 1):
+                inv_id += 1
+                invoices.append({
+                    "id": inv_id, "house_id": n, "period_start": start, "period_end": end, "amount_due": 3000,
+                    "due_date": due_date_for_month(start), "status": "paid", "created_at": datetime(y, m, 1)
+                })
+                for _ in range(rng.choice((1, 1, 1, 2))):
+                    payments.append({
+                        "invoice_id": inv_id, "house_id": n, "tenant_id": n, "method": rng.choice(("cash", "mpesa")),
+                        "amount": 1500, "target_year": y, "target_month": m,
+                        "paid_at": datetime(y, m, rng.randint(1, 28), rng.randint(6, 21)), "status": "confirmed"
+                    })
+            conn.execute(insert(Invoice), invoices)
+            conn.execute(insert(Payment), payments)
+    return months
+
+def explain(conn, sql, params):
+    if conn.dialect.name == "sqlite":
+        rows = conn.execute(text("EXPLAIN QUERY PLAN " + sql), params).all()
+        return [r[-1] for r in rows]
+    if conn.dialect.name == "postgresql":
+        return [r[0] for r in conn.execute(text("EXPLAIN ANALYZE " + sql), params).all()]
+    return []
+
+def measure(engine, months):
+    rng = random.Random(7)
+    out = {}
+    with engine.connect() as conn:
+        for name, (sql, make_params) in QUERIES.items():
+            timings = []
+            for _ in range(args.repeat):
+                y, m = rng.choice(months)
+                start, end = make_month(y, m)
+                ny, nm = shift_month(y, m, 1)
+                ctx = {
+                    "house_id": rng.randint(1, args.houses), "start": start, "end": end,
+                    "since": datetime(y, m, 1), "until": datetime(ny, nm, 1)
+                }
+                params = make_params(ctx)
+                t0 = time.perf_counter()
+                conn.execute(text(sql), params).all()
+                timings.append(time.perf_counter() - t0)
+            timings.sort()
+            out[name] = {"median_ms": timings[len(timings) // 2] * 1000, "plan": explain(conn, sql, params)}
+    return out
+
+def run():
+    engine = create_engine(url)
+    Base.metadata.drop_all(engine)
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE IF EXISTS alembic_version"))
+
+    cfg = alembic_config()
+    command.upgrade(cfg, "0001")
+    t0 = time.perf_counter()
+    months = generate(engine)
+    print(f"Generated {args.houses} houses x {len(months)} months in {time.perf_counter() - t0:.1f}s")
+
+    before = measure(engine, months)
+    t0 = time.perf_counter()
+    command.upgrade(cfg, "head")
+    print(f"Upgraded to head in {time.perf_counter() - t0:.1f}s")
+    engine.dispose()  # fresh connections, no statements prepared against the old schema
+    after = measure(engine, months)
+
+    for name in QUERIES:
+        b, a = before[name], after[name]
+        speedup = b["median_ms"] / a["median_ms"] if a["median_ms"] else float("inf")
+        print(f"\n{name}: {b['median_ms']:.3f} ms -> {a['median_ms']:.3f} ms ({speedup:.1f}x)")
+        print("  before: " + " | ".join(b["plan"]))
+        print("  after:  " + " | ".join(a["plan"]))
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,102 @@
+"""Cold-start benchmark: import time and time until a worker is live and ready.
+
+For each run, a fresh interpreter imports main and reports how long that took
+and whether the import created an engine; the import should not touch the
+database. Then uvicorn is started with --workers and polled until /healthz and
+/readyz answer 200. The database is migrated to head first so /readyz can pass.
+
+    python bench_startup.py --runs 5 --workers 4 --out startup.json
+    python bench_startup.py --compare startup.json
+
+The target database is migrated, not wiped.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+parser.add_argument("--url", help="database to start against (default: temporary SQLite file)")
+parser.add_argument("--runs", type=int, default=5)
+parser.add_argument("--workers", type=int, default=2)
+parser.add_argument("--port", type=int, default=8766)
+parser.add_argument("--out", default="bench_startup.json")
+parser.add_argument("--compare", help="earlier results file to diff against")
+args = parser.parse_args()
+
+url = args.url or f"sqlite:///{tempfile.mkdtemp()}/bench_startup.db"
+HERE = os.path.dirname(os.path.abspath(__file__))
+ENV = {**os.environ, "DATABASE_URL": url, "SCHEDULER_ENABLED": "0", "DB_CREATE_ALL": "0"}
+
+IMPORT_PROBE = (
+    "import time; t0 = time.perf_counter(); import main, base; "
+    "print(time.perf_counter() - t0, bool(base._engines))"
+)
+
+import httpx
+
+def median(values: list):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+def time_import():
+    out = subprocess.run([sys.executable, "-c", IMPORT_PROBE], cwd=HERE, env=ENV, capture_output=True, text=True, check=True)
+    elapsed, engine_created = out.stdout.split()
+    return float(elapsed), engine_created == "True"
+
+def time_boot():
+    # seconds from spawn until /healthz and /readyz first return 200
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.port), "--workers", str(args.workers), "--log-level", "warning"],
+        cwd=HERE, env=ENV
+    )
+    base_url = f"http://127.0.0.1:{args.port}"
+    live = ready = None
+    try:
+        while ready is None and time.perf_counter() - t0 < 60:
+            try:
+                if live is None and httpx.get(base_url + "/healthz").status_code == 200:
+                    live = time.perf_counter() - t0
+                if live is not None and httpx.get(base_url + "/readyz").status_code == 200:
+                    ready = time.perf_counter() - t0
+            except httpx.TransportError:
+                pass
+            time.sleep(0.01)
+    finally:
+        proc.terminate()
+        proc.wait()
+    return live, ready
+
+def run():
+    subprocess.run([sys.executable, "-m", "alembic", "upgrade", "head"], cwd=HERE, env=ENV, check=True, capture_output=True)
+    imports, engines, lives, readies = [], [], [], []
+    for _ in range(args.runs):
+        elapsed, engine_created = time_import()
+        imports.append(elapsed)
+        engines.append(engine_created)
+        live, ready = time_boot()
+        lives.append(live)
+        readies.append(ready)
+    results = {
+        "meta": {"generated_at": datetime.now().isoformat(timespec="seconds"), "runs": args.runs, "workers": args.workers},
+        "import_ms": round(median(imports) * 1000, 1),
+        "engine_created_at_import": any(engines),
+        "healthz_ms": round(median(lives) * 1000, 1) if None not in lives else None,
+        "readyz_ms": round(median(readies) * 1000, 1) if None not in readies else None,
+    }
+    print(json.dumps(results, indent=2))
+    with open(args.out, "w") as f:
+        json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+        for key in ("import_ms", "healthz_ms", "readyz_ms"):
+            print(f"{key:<12} {previous.get(key)} -> {results[key]}")
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,109 @@
+from collections import OrderedDict
+from threading import Lock
+import hashlib
+import json
+import os
+import secrets
+import time
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+import base
+
+# In-process response cache for the heavy read endpoints. Entries are tagged with the
+# data version current when they were computed; every committed write bumps the
+# version, which makes all older entries stale at once. The ETag is derived from the
+# version and the key, so If-None-Match can be answered without touching the cache or
+# the database. The version restarts at 0 in every process, so the tag also carries a
+# nonce drawn at startup: a tag from before a restart, or from another worker, never
+# matches, and the client gets a full response instead of a false 304.
+#
+# The version lives in this process: with several workers, a write handled by one
+# worker is not seen by the others' caches. So the cache is off unless
+# RESPONSE_CACHE_SIZE is set, which is only safe with a single worker.
+#
+# A body computed on the read replica shortly after a write may predate that write,
+# so it is served but not cached until the replica has had REPLICA_STICKY_SECONDS
+# to catch up.
+
+class ResponseCache:
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.lock = Lock()
+        self.entries = OrderedDict()  # key -> (version, etag, body)
+        self.version = 0
+        self.boot = secrets.token_hex(4)
+        self.bumped_at = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def bump(self):
+        with self.lock:
+            self.version += 1
+            self.bumped_at = time.monotonic()
+
+    def etag(self, key, version: int):
+        digest = hashlib.sha1(repr((self.boot, key, version)).encode()).hexdigest()[:16]
+        return f'W/"{self.boot}-{version}-{digest}"'
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] != self.version:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, version: int, etag: str, body: bytes):
+        if self.max_entries <= 0:
+            return
+        with self.lock:
+            if version != self.version:
+                return  # a write landed while computing; don't keep a stale body
+            self.entries[key] = (version, etag, body)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def respond(self, request: Request, key, compute):
+        # JSON response for `key`, 304 when the client already has the current version
+        if self.max_entries <= 0:
+            return compute()
+        version = self.version
+        etag = self.etag(key, version)
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if etag in request.headers.get("if-none-match", ""):
+            with self.lock:
+                self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+        entry = self.get(key)
+        if entry is not None:
+            return Response(entry[2], media_type="application/json", headers={**headers, "ETag": entry[1]})
+        body = json.dumps(jsonable_encoder(compute()), separators=(",", ":")).encode()
+        if getattr(request.state, "read_replica", False) and time.monotonic() - self.bumped_at < base.sticky_seconds():
+            return Response(body, media_type="application/json")  # possibly behind the primary
+        self.put(key, version, etag, body)
+        return Response(body, media_type="application/json", headers=headers)
+
+    def render_metrics(self):
+        with self.lock:
+            values = {"hits": self.hits, "misses": self.misses, "not_modified": self.not_modified}
+            size = len(self.entries)
+        lines = [
+            "# HELP response_cache_requests_total Cached endpoint lookups by outcome.",
+            "# TYPE response_cache_requests_total counter",
+        ]
+        lines += [f'response_cache_requests_total{{result="{k}"}} {v}' for k, v in values.items()]
+        lines += [
+            "# HELP response_cache_entries Entries currently held.",
+            "# TYPE response_cache_entries gauge",
+            f"response_cache_entries {size}",
+        ]
+        return "\n".join(lines) + "\n"
+
+response_cache = ResponseCache(int(os.getenv("RESPONSE_CACHE_SIZE", "0")))
+
+def bump():
+    response_cache.bump()
@@ -0,0 +1,192 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from fastapi.encoders import jsonable_encoder
+
+logger = logging.getLogger("rentals.events")
+
+# Live change events for the dashboard (GET /events, Server-Sent Events). Write paths
+# publish a small event after their commit (services.publish_change: the affected
+# houses as GET /houses lists them, the dashboard totals, the payment's month
+# allocations), and every open browser patches its state from it instead of
+# refetching /stats and /houses. Events are built off the request path, on one
+# thread with its own session, and only while someone is subscribed.
+#
+# Each event is encoded once into an SSE frame and the same bytes are queued for
+# every subscriber, so a publish costs one encode plus a put per subscriber. An idle
+# subscriber is a bounded queue and a suspended generator: no timer of its own (one
+# heartbeat task pings everyone) and no database session.
+#
+# Frames carry a sequence id. A reconnecting EventSource sends Last-Event-ID and is
+# replayed what it missed from the last EVENTS_HISTORY frames; if that is not enough
+# it gets a 'resync' event and should refetch. A subscriber that falls
+# EVENTS_QUEUE_SIZE frames behind is disconnected and recovers the same way; so is
+# every stream after EVENTS_STREAM_SECONDS, which bounds how long it holds up a
+# graceful shutdown.
+#
+# Like the response cache, the hub lives in this process: with several workers, a
+# write handled by one worker only reaches the subscribers connected to it.
+
+def env_int(name: str, default: int):
+    return int(os.getenv(name, str(default)))
+
+def frame(seq: int | None, data: dict):
+    head = f"id: {seq}\n" if seq is not None else ""
+    return f"{head}data: {json.dumps(jsonable_encoder(data), separators=(',', ':'))}\n\n".encode()
+
+class Subscriber:
+    def __init__(self, size: int):
+        self.queue = asyncio.Queue(size)
+        self.last = 0  # sequence id of the last frame queued
+        self.opened = time.monotonic()
+
+class EventHub:
+    def __init__(self):
+        self.lock = Lock()
+        self.loop = None
+        self.builder = ThreadPoolExecutor(max_workers=1, thread_name_prefix="events")
+        self.subscribers = set()
+        self.history = deque(maxlen=env_int("EVENTS_HISTORY", 256))  # (seq, frame)
+        self.seq = 0
+        self.published = 0
+        self.dropped = 0
+
+    def subscribe(self, last_event_id: int | None = None):
+        # Called on the event loop; None when EVENTS_MAX_SUBSCRIBERS are connected
+        loop = asyncio.get_running_loop()
+        if self.loop is not loop:
+            self.loop = loop
+            loop.create_task(self.heartbeat_forever())
+        if len(self.subscribers) >= env_int("EVENTS_MAX_SUBSCRIBERS", 1000):
+            return None
+        sub = Subscriber(env_int("EVENTS_QUEUE_SIZE", 64))
+        with self.lock:
+            sub.last = self.seq
+            if last_event_id is not None and last_event_id != self.seq:
+                missed = [f for seq, f in self.history if seq > last_event_id]
+                if last_event_id < self.seq and len(missed) == self.seq - last_event_id \
+                        and None not in missed and len(missed) < sub.queue.maxsize:
+                    for f in missed:
+                        sub.queue.put_nowait(f)
+                else:
+                    sub.queue.put_nowait(frame(self.seq, {"type": "resync"}))
+            self.subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscriber):
+        self.subscribers.discard(sub)
+
+    def publish(self, type_: str, build):
+        # Safe from any thread (request handlers run in the threadpool, jobs in the
+        # scheduler's); call after the commit. build() returns the event's fields; it
+        # runs on the hub's single builder thread, in publish order, so the write
+        # does not wait for it.
+        if self.loop is not None:
+            self.builder.submit(self.send, type_, build)
+
+    def send(self, type_: str, build):
+        # build() only runs when someone is subscribed; otherwise a gap is recorded, so
+        # a client resuming across it is told to resync. If build() fails, subscribers
+        # are told to resync.
+        data = None
+        if self.subscribers:
+            try:
+                data = build()
+            except Exception:
+                logger.exception("Could not build the %s event", type_)
+                type_, data = "resync", {}
+        with self.lock:
+            if data is None:
+                if not self.history or self.history[-1][1] is not None:
+                    self.seq += 1
+                    self.history.append((self.seq, None))
+                return
+            self.seq += 1
+            f = frame(self.seq, {"type": type_, "ts": round(time.time(), 3), **data})
+            self.history.append((self.seq, f))
+            try:
+                self.loop.call_soon_threadsafe(self.fanout, self.seq, f)
+            except RuntimeError:
+                return  # the loop has closed (shutdown)
+            self.published += 1
+
+    def fanout(self, seq: int, f: bytes):
+        for sub in list(self.subscribers):
+            if seq <= sub.last:
+                continue  # already replayed to it on subscribe
+            self.offer(sub, f)
+            sub.last = seq
+
+    def offer(self, sub: Subscriber, f: bytes):
+        try:
+            sub.queue.put_nowait(f)
+        except asyncio.QueueFull:
+            # Too far behind: close its stream; it reconnects with Last-Event-ID
+            self.dropped += 1
+            self.close(sub)
+
+    def close(self, sub: Subscriber):
+        # Ends the subscriber's stream after what is queued (or at once if its queue is full)
+        self.unsubscribe(sub)
+        try:
+            sub.queue.put_nowait(None)
+        except asyncio.QueueFull:
+            while not sub.queue.empty():
+                sub.queue.get_nowait()
+            sub.queue.put_nowait(None)
+
+    async def heartbeat_forever(self):
+        # Keeps idle connections from being timed out by proxies, and ends streams older
+        # than EVENTS_STREAM_SECONDS: the client resumes with Last-Event-ID, and a
+        # graceful server shutdown (which waits for open responses) waits no longer
+        ping = b": ping\n\n"
+        while True:
+            await asyncio.sleep(env_int("EVENTS_HEARTBEAT_SECONDS", 15))
+            oldest = time.monotonic() - env_int("EVENTS_STREAM_SECONDS", 300)
+            for sub in list(self.subscribers):
+                if sub.opened < oldest:
+                    self.close(sub)
+                else:
+                    self.offer(sub, ping)
+
+    async def stream(self, sub: Subscriber):
+        # SSE body for one subscriber; ends when it is dropped, and unsubscribes when
+        # the client goes away (the response cancels the generator)
+        try:
+            yield f"retry: {env_int('EVENTS_RETRY_MS', 3000)}\n\n".encode()
+            while True:
+                # everything queued goes out in one write: under load, fewer sends
+                frames = [await sub.queue.get()]
+                while not sub.queue.empty():
+                    frames.append(sub.queue.get_nowait())
+                if None in frames:
+                    yield b"".join(frames[:frames.index(None)])
+                    return
+                yield b"".join(frames)
+        finally:
+            self.unsubscribe(sub)
+
+    def render_metrics(self):
+        lines = [
+            "# HELP events_subscribers Open /events streams.",
+            "# TYPE events_subscribers gauge",
+            f"events_subscribers {len(self.subscribers)}",
+            "# HELP events_published_total Change events published.",
+            "# TYPE events_published_total counter",
+            f"events_published_total {self.published}",
+            "# HELP events_dropped_subscribers_total Streams closed for falling behind.",
+            "# TYPE events_dropped_subscribers_total counter",
+            f"events_dropped_subscribers_total {self.dropped}",
+        ]
+        return "\n".join(lines) + "\n"
+
+hub = EventHub()
+
+def refresh(reason: str):
+    # For changes too broad to describe (invoice runs, period close): clients refetch
+    hub.publish("refresh", lambda: {"reason": reason})
@@ -0,0 +1,203 @@
+"""Load test for GET /events: many idle subscribers, then a stream of writes.
+
+Generates an estate, starts uvicorn in a subprocess and opens --subscribers SSE
+streams (httpx, spread over --client-processes so the clients do not slow down the
+writer or each other), measuring the server's memory per idle subscriber. It then records
+--writes payments through POST /payments at --rate per second and reports how long
+each change event took to reach every subscriber (from publish to receipt), whether
+every subscriber saw every event in order, what the events added to the write
+latency and to the server's CPU time (against the same writes with nobody
+subscribed), and the bytes sent per change against the /stats and /houses refetch
+they replace. On a machine with few cores the clients compete with the server, so
+the latencies are an upper bound; the CPU figures are not affected.
+
+    python events_load.py --subscribers 500 --writes 200 --rate 20
+    python events_load.py --url postgresql://localhost/rentals_bench --houses 2000
+
+The target database is wiped first; never point it at real data.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+parser.add_argument("--url", help="database to test against (default: temporary SQLite file)")
+parser.add_argument("--houses", type=int, default=200)
+parser.add_argument("--subscribers", type=int, default=500)
+parser.add_argument("--client-processes", type=int, default=4)
+parser.add_argument("--writes", type=int, default=200, help="payments recorded per phase")
+parser.add_argument("--rate", type=float, default=20, help="payments per second")
+parser.add_argument("--port", type=int, default=8766)
+parser.add_argument("--seed", type=int, default=42)
+args = parser.parse_args()
+
+url = args.url or f"sqlite:///{tempfile.mkdtemp()}/events_load.db"
+os.environ["DATABASE_URL"] = url
+
+import httpx
+from base import Base, get_engine
+import seed
+from utils import today_date
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+def percentile(sorted_values: list, p: float):
+    return sorted_values[min(len(sorted_values) - 1, int(p * len(sorted_values)))] if sorted_values else 0.0
+
+def cpu_seconds(pid: int):
+    # user + system CPU time of the server process
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+def rss_kib(pid: int):
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+async def subscribe(client: httpx.AsyncClient, received: list, opened: list, n: int, ready):
+    # Reads one stream until cancelled; received gets (event id, ts, arrival, bytes) per event
+    async with client.stream("GET", "/events") as r:
+        r.raise_for_status()
+        opened.append(1)
+        if len(opened) == n:
+            ready.set()
+        event_id = None
+        async for line in r.aiter_lines():
+            if line.startswith("id: "):
+                event_id = int(line[4:])
+            elif line.startswith("data: "):
+                received.append((event_id, json.loads(line[6:])["ts"], time.time(), len(line)))
+
+def listen(base_url: str, n: int, ready, stop, out):
+    # Client process: holds n streams open until `stop`, then sends back what each received
+    async def main():
+        streams = [[] for _ in range(n)]
+        opened = []
+        limits = httpx.Limits(max_connections=n, max_keepalive_connections=0)
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=None) as client:
+            tasks = [asyncio.create_task(subscribe(client, received, opened, n, ready)) for received in streams]
+            await asyncio.get_running_loop().run_in_executor(None, stop.wait)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        return streams
+    out.send(asyncio.run(main()))
+
+async def write_payments(client: httpx.AsyncClient, payers: list, rng: random.Random):
+    # --writes payments at --rate; returns their latencies in ms
+    today = today_date()
+    latencies = []
+    start = time.perf_counter()
+    for i in range(args.writes):
+        delay = start + i / args.rate - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        house_id, tenant_id, rent = rng.choice(payers)
+        t0 = time.perf_counter()
+        r = await client.post("/payments", json={
+            "house_id": house_id, "tenant_id": tenant_id, "method": "cash", "amount": rent,
+            "target_year": today.year, "target_month": today.month
+        })
+        r.raise_for_status()
+        latencies.append((time.perf_counter() - t0) * 1000)
+    return sorted(latencies)
+
+async def drive(base_url: str, pid: int):
+    rng = random.Random(args.seed)
+    async with httpx.AsyncClient(base_url=base_url, timeout=None) as client:
+        houses = (await client.get("/houses")).json()
+        stats_bytes = len((await client.get("/stats")).content)
+        houses_bytes = len((await client.get("/houses")).content)
+        payers = [(h["id"], t["id"], h["monthly_rent"]) for h in houses for t in h["tenants"][:1] if h["monthly_rent"] > 0]
+
+        cpu0 = cpu_seconds(pid)
+        unsubscribed = await write_payments(client, payers, rng)
+        cpu_unsubscribed = cpu_seconds(pid) - cpu0
+
+        rss_before = rss_kib(pid)
+        stop = multiprocessing.Event()
+        clients = []
+        t0 = time.perf_counter()
+        for i in range(args.client_processes):
+            n = args.subscribers // args.client_processes + (i < args.subscribers % args.client_processes)
+            ready = multiprocessing.Event()
+            out, child_out = multiprocessing.Pipe(duplex=False)
+            proc = multiprocessing.Process(target=listen, args=(base_url, n, ready, stop, child_out))
+            proc.start()
+            clients.append((proc, ready, out))
+        for _, ready, _ in clients:
+            await asyncio.get_running_loop().run_in_executor(None, ready.wait)
+        connect_s = time.perf_counter() - t0
+        await asyncio.sleep(1)
+        rss_idle = rss_kib(pid)
+
+        cpu0 = cpu_seconds(pid)
+        subscribed = await write_payments(client, payers, rng)
+        await asyncio.sleep(1)
+        cpu_subscribed = cpu_seconds(pid) - cpu0
+        stop.set()
+        streams = [s for _, _, out in clients for s in out.recv()]
+        for proc, _, _ in clients:
+            proc.join()
+        metrics = (await client.get("/metrics")).text
+
+    ids = [e for e, _, _, _ in streams[0]]
+    complete = sum(1 for s in streams if [e for e, _, _, _ in s] == ids)
+    delays = sorted((arrived - ts) * 1000 for s in streams for _, ts, arrived, _ in s)
+    sizes = [size for _, _, _, size in streams[0]]
+    return {
+        "subscribers": args.subscribers, "connect_seconds": round(connect_s, 2),
+        "server_rss_kib_per_idle_subscriber": round((rss_idle - rss_before) / args.subscribers, 1),
+        "events": len(ids), "in_order_and_complete": f"{complete}/{args.subscribers}",
+        "delivery_ms": {"p50": round(percentile(delays, 0.50), 1), "p95": round(percentile(delays, 0.95), 1),
+                        "p99": round(percentile(delays, 0.99), 1), "max": round(delays[-1], 1) if delays else None},
+        "write_ms_p50": {"no_subscribers": round(percentile(unsubscribed, 0.5), 1), "subscribed": round(percentile(subscribed, 0.5), 1)},
+        "write_ms_p95": {"no_subscribers": round(percentile(unsubscribed, 0.95), 1), "subscribed": round(percentile(subscribed, 0.95), 1)},
+        "server_cpu_ms": {"per_write_no_subscribers": round(cpu_unsubscribed * 1000 / args.writes, 2),
+                          "per_write_subscribed": round(cpu_subscribed * 1000 / args.writes, 2),
+                          "per_event_delivered": round((cpu_subscribed - cpu_unsubscribed) * 1000 / max(len(delays), 1), 3)},
+        "bytes_per_change": {"event": round(sum(sizes) / len(sizes)) if sizes else None,
+                             "refetch_stats_and_houses": stats_bytes + houses_bytes},
+        "hub": [line for line in metrics.splitlines() if line.startswith("events_")],
+    }
+
+def run_server():
+    env = {**os.environ, "DATABASE_URL": url, "SCHEDULER_ENABLED": "0", "RESPONSE_CACHE_SIZE": "0",
+           "EVENTS_MAX_SUBSCRIBERS": str(args.subscribers + 10)}
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.port), "--log-level", "warning",
+         "--timeout-graceful-shutdown", "1"],
+        cwd=HERE, env=env
+    )
+
+def run():
+    engine = get_engine()
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    seed.generate(args.houses, 1, 1, seed=args.seed)
+    proc = run_server()
+    try:
+        base_url = f"http://127.0.0.1:{args.port}"
+        for _ in range(100):
+            try:
+                httpx.get(base_url + "/healthz")
+                break
+            except httpx.TransportError:
+                time.sleep(0.1)
+        print(json.dumps(asyncio.run(drive(base_url, proc.pid)), indent=2))
+    finally:
+        proc.terminate()
+        proc.wait()
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,157 @@
+import csv
+import io
+import json
+from datetime import date
+from sqlalchemy import select, and_, or_
+from base import SessionLocal
+from models import House, Tenant, HouseTenant, Invoice, Payment
+from ledger import ledger_cell
+from services import day_start
+
+# Full-table exports (GET /exports/...) as CSV or NDJSON. Rows are read with yield_per,
+# which on PostgreSQL runs the query on a server-side cursor, and written out one
+# partition at a time, so memory stays at a partition's worth of rows however long
+# the export is, and the first chunk goes out as soon as the first partition arrives.
+# Each export opens its own session: the response outlives the request's dependencies.
+
+YIELD_PER = 2000
+
+FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+PAYMENT_FIELDS = ("id", "paid_at", "house_number", "tenant_name", "amount", "method", "status",
+                  "tx_ref", "mpesa_msisdn", "for_month", "invoice_id")
+INVOICE_FIELDS = ("id", "house_number", "tenant_name", "period_start", "period_end", "due_date",
+                  "amount_due", "paid_total", "balance", "status")
+LEDGER_FIELDS = ("house_number", "year", "month", "state", "amount_due", "paid_total", "balance")
+
+def day_range(query, column, date_from: date | None, date_to: date | None):
+    if date_from is not None:
+        query = query.where(column >= day_start(date_from))
+    if date_to is not None:
+        query = query.where(column < day_start(date.fromordinal(date_to.toordinal() + 1)))
+    return query
+
+def payments_query(date_from: date | None = None, date_to: date | None = None, house_id: int | None = None, status: str | None = None):
+    # Oldest first, along ix_payments_paid_at_id
+    q = select(
+        Payment.id, Payment.paid_at, House.number, Tenant.full_name, Payment.amount, Payment.method, Payment.status,
+        Payment.tx_ref, Payment.mpesa_msisdn, Payment.target_year, Payment.target_month, Payment.invoice_id
+    ).join(House, House.id == Payment.house_id).join(Tenant, Tenant.id == Payment.tenant_id)
+    q = day_range(q, Payment.paid_at, date_from, date_to)
+    if house_id is not None:
+        q = q.where(Payment.house_id == house_id)
+    if status is not None:
+        q = q.where(Payment.status == status)
+    return q.order_by(Payment.paid_at.asc(), Payment.id.asc())
+
+def payment_record(row):
+    return {
+        "id": row.id, "paid_at": row.paid_at.strftime("%Y-%m-%d %H:%M:%S"),
+        "house_number": row.number, "tenant_name": row.full_name,
+        "amount": row.amount, "method": row.method, "status": row.status,
+        "tx_ref": row.tx_ref, "mpesa_msisdn": row.mpesa_msisdn,
+        "for_month": f"{row.target_year}-{str(row.target_month).zfill(2)}", "invoice_id": row.invoice_id,
+    }
+
+def invoices_query(date_from: date | None = None, date_to: date | None = None, house_id: int | None = None, status: str | None = None):
+    # The tenant is whoever was assigned to the house during the invoiced month (the
+    # latest to move in if several were), looked up per row by ix_house_tenants_house_tenant_status
+    tenant_name = select(Tenant.full_name).join(HouseTenant, HouseTenant.tenant_id == Tenant.id).where(
+        HouseTenant.house_id == Invoice.house_id,
+        HouseTenant.start_date <= Invoice.period_end,
+        or_(HouseTenant.end_date.is_(None), HouseTenant.end_date >= Invoice.period_start)
+    ).order_by(HouseTenant.start_date.desc(), HouseTenant.id.desc()).limit(1).correlate(Invoice).scalar_subquery()
+    q = select(
+        Invoice.id, House.number, tenant_name.label("tenant_name"), Invoice.period_start, Invoice.period_end,
+        Invoice.due_date, Invoice.amount_due, Invoice.paid_total, Invoice.balance, Invoice.status
+    ).join(House, House.id == Invoice.house_id)
+    if date_from is not None:
+        q = q.where(Invoice.period_start >= date_from)
+    if date_to is not None:
+        q = q.where(Invoice.period_start <= date_to)
+    if house_id is not None:
+        q = q.where(Invoice.house_id == house_id)
+    if status is not None:
+        q = q.where(Invoice.status == status)
+    return q.order_by(Invoice.period_start.asc(), House.number.asc())
+
+def invoice_record(row):
+    return {
+        "id": row.id, "house_number": row.number, "tenant_name": row.tenant_name,
+        "period_start": row.period_start.isoformat(), "period_end": row.period_end.isoformat(),
+        "due_date": row.due_date.isoformat(), "amount_due": row.amount_due,
+        "paid_total": row.paid_total, "balance": row.balance, "status": row.status,
+    }
+
+def ledger_query(year: int):
+    # Every house with its invoices for the year (none: a single row of NULLs)
+    return select(
+        House.id, House.number, House.monthly_rent, Invoice.period_start, Invoice.amount_due, Invoice.paid_total
+    ).outerjoin(Invoice, and_(
+        Invoice.house_id == House.id,
+        Invoice.period_start >= date(year, 1, 1),
+        Invoice.period_start < date(year + 1, 1, 1)
+    )).order_by(House.number.asc(), Invoice.period_start.asc())
+
+def ledger_records(rows, year: int):
+    # Same cells as ledger.ledger_matrix, one record per house and month; rows arrive
+    # grouped by house, so only the current house's invoices are held
+    def house_cells(house, invoices):
+        for month in range(1, 13):
+            amount_due, paid = invoices.get(month, (house.monthly_rent, 0))
+            yield {"house_number": house.number, **ledger_cell(year, month, amount_due, paid)}
+
+    house, invoices = None, {}
+    for row in rows:
+        if house is not None and row.id != house.id:
+            yield from house_cells(house, invoices)
+            invoices = {}
+        house = row
+        if row.period_start is not None:
+            invoices[row.period_start.month] = (row.amount_due, row.paid_total)
+    if house is not None:
+        yield from house_cells(house, invoices)
+
+def encode(records, fields: tuple, fmt: str, header: bool):
+    buf = io.StringIO()
+    if fmt == "csv":
+        writer = csv.DictWriter(buf, fieldnames=fields, extrasaction="ignore")
+        if header:
+            writer.writeheader()
+        writer.writerows(records)
+    else:
+        for r in records:
+            buf.write(json.dumps(r))
+            buf.write("\n")
+    return buf.getvalue()
+
+def stream_rows(query, to_record, fields: tuple, fmt: str, role: str, transform=None):
+    # Sync generator: StreamingResponse pulls each chunk in the threadpool
+    db = SessionLocal(role)
+    try:
+        result = db.execute(query.execution_options(yield_per=YIELD_PER))
+        records = (to_record(row) for row in result) if transform is None else transform(result)
+        header = True
+        while True:
+            chunk = []
+            for r in records:
+                chunk.append(r)
+                if len(chunk) == YIELD_PER:
+                    break
+            if not chunk and not header:
+                return
+            yield encode(chunk, fields, fmt, header)
+            header = False
+            if len(chunk) < YIELD_PER:
+                return
+    finally:
+        db.close()
+
+def export_payments(fmt: str, role: str, **filters):
+    return stream_rows(payments_query(**filters), payment_record, PAYMENT_FIELDS, fmt, role)
+
+def export_invoices(fmt: str, role: str, **filters):
+    return stream_rows(invoices_query(**filters), invoice_record, INVOICE_FIELDS, fmt, role)
+
+def export_ledger(fmt: str, role: str, year: int):
+    return stream_rows(ledger_query(year), None, LEDGER_FIELDS, fmt, role, transform=lambda rows: ledger_records(rows, year))
@@ -0,0 +1,50 @@
+import os
+from threading import Lock
+from sqlalchemy import text
+from base import get_engine, create_all_enabled, replica_enabled, REPLICA
+
+# Readiness (GET /readyz): the database (and the read replica, if configured)
+# answers and its schema is at the newest migration. Liveness (GET /healthz) needs neither and is answered in main.py.
+# The migration heads are read from the scripts once per process; alembic is imported
+# on the first probe rather than with the app.
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+_heads = None
+_heads_lock = Lock()
+
+def migration_heads():
+    global _heads
+    with _heads_lock:
+        if _heads is None:
+            from alembic.config import Config
+            from alembic.script import ScriptDirectory
+            script = ScriptDirectory.from_config(Config(os.path.join(HERE, "alembic.ini")))
+            _heads = sorted(script.get_heads())
+        return _heads
+
+def readiness():
+    # (ready, details)
+    from alembic.runtime.migration import MigrationContext
+    details = {"database": "ok"}
+    try:
+        with get_engine().connect() as conn:
+            conn.execute(text("SELECT 1"))
+            current = sorted(MigrationContext.configure(conn).get_current_heads())
+    except Exception as e:
+        details["database"] = f"unreachable: {type(e).__name__}"
+        return False, details
+    if replica_enabled():
+        try:
+            with get_engine(REPLICA).connect() as conn:
+                conn.execute(text("SELECT 1"))
+            details["replica"] = "ok"
+        except Exception as e:
+            details["replica"] = f"unreachable: {type(e).__name__}"
+            return False, details
+    head = migration_heads()
+    details["migrations"] = {"current": current, "head": head}
+    if create_all_enabled():
+        details["migrations"]["managed_by"] = "create_all"
+        return True, details
+    return current == head, details
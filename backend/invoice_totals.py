@@ -0,0 +1,73 @@
+"""Verify (and optionally repair) the maintained invoice totals.
+
+invoices.paid_total and invoices.balance are kept up to date by the payment write
+paths. This recomputes both from the confirmed payments in one set-wise query,
+reports every invoice that has drifted and, with --repair, fixes them (and their
+status) in one UPDATE.
+
+    python invoice_totals.py
+    python invoice_totals.py --repair
+"""
+import argparse
+import json
+from sqlalchemy import select, func, case, or_, update
+from sqlalchemy.orm import Session
+from models import Invoice, Payment
+from services import invoice_status_sql
+
+def expected_paid():
+    return select(func.coalesce(func.sum(Payment.amount), 0)).where(
+        Payment.invoice_id == Invoice.id,
+        Payment.status == "confirmed"
+    ).correlate(Invoice).scalar_subquery()
+
+def drift_condition(paid):
+    balance = case((Invoice.amount_due > paid, Invoice.amount_due - paid), else_=0)
+    return or_(Invoice.paid_total != paid, Invoice.balance != balance), balance
+
+def find_drift(db: Session, limit: int = 100):
+    # {"drifted": n, "sample": [...]} with up to `limit` drifted invoices
+    paid = expected_paid()
+    drifted, balance = drift_condition(paid)
+    count = db.query(func.count(Invoice.id)).filter(drifted).scalar()
+    rows = db.query(
+        Invoice.id, Invoice.house_id, Invoice.period_start, Invoice.amount_due,
+        Invoice.paid_total, Invoice.balance, paid.label("expected_paid"), balance.label("expected_balance")
+    ).filter(drifted).order_by(Invoice.id.asc()).limit(limit).all()
+    return {"drifted": count, "sample": [{
+        "invoice_id": r.id, "house_id": r.house_id, "period_start": r.period_start.isoformat(),
+        "amount_due": r.amount_due, "paid_total": r.paid_total, "balance": r.balance,
+        "expected_paid_total": int(r.expected_paid), "expected_balance": int(r.expected_balance)
+    } for r in rows]}
+
+def repair(db: Session):
+    # Rewrites paid_total, balance and status of drifted invoices. Returns rows updated.
+    # Does not commit.
+    paid = expected_paid()
+    drifted, balance = drift_condition(paid)
+    stmt = update(Invoice).where(drifted).values(
+        paid_total=paid,
+        balance=balance,
+        status=invoice_status_sql(paid)
+    ).execution_options(synchronize_session=False)
+    return db.execute(stmt).rowcount
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repair", action="store_true", help="fix drifted invoices")
+    parser.add_argument("--limit", type=int, default=100, help="drifted invoices to list")
+    args = parser.parse_args()
+
+    from base import SessionLocal
+    db = SessionLocal()
+    try:
+        report = find_drift(db, args.limit)
+        if args.repair and report["drifted"]:
+            report["repaired"] = repair(db)
+            db.commit()
+        print(json.dumps(report, indent=2))
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+from datetime import date, timedelta
+import logging
+import os
+from sqlalchemy import select, update, literal, true
+from sqlalchemy.orm import Session
+from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
+from base import SessionLocal, dialect_insert
+import cache
+import events
+import notifications
+import mpesa
+import period_close
+from models import House, Invoice
+from utils import make_month, due_date_for_month, now_ts, today_date, shift_month
+
+logger = logging.getLogger("rentals.jobs")
+
+# Set-based invoice jobs: one INSERT ... SELECT for a month's invoices and one UPDATE
+# for the overdue sweep. Both are idempotent, so running them from several workers
+# (or re-running a backfill) is harmless.
+
+def generate_month_invoices(db: Session, year: int, month: int):
+    # Creates the month's invoice for every active house that does not have one yet.
+    # Returns the number of invoices created. Does not commit.
+    start, end = make_month(year, month)
+    rows = select(
+        House.id, literal(start), literal(end), House.monthly_rent, literal(0), House.monthly_rent,
+        literal(due_date_for_month(start)), literal("pending"), literal(now_ts())
+    ).where(House.is_active == true())
+    stmt = dialect_insert(db)(Invoice).from_select(
+        ["house_id", "period_start", "period_end", "amount_due", "paid_total", "balance", "due_date", "status", "created_at"], rows
+    ).on_conflict_do_nothing(index_elements=["house_id", "period_start"])
+    return db.execute(stmt).rowcount
+
+def mark_overdue(db: Session, as_of: date):
+    # Flips unpaid invoices whose due date (plus OVERDUE_DAYS_AFTER grace days) has
+    # passed to 'overdue'. Returns the number of invoices updated. Does not commit.
+    grace = int(os.getenv("OVERDUE_DAYS_AFTER", "0"))
+    stmt = update(Invoice).where(
+        Invoice.status.in_(("pending", "partially_paid")),
+        Invoice.due_date < as_of - timedelta(days=grace)
+    ).values(status="overdue").execution_options(synchronize_session=False)
+    return db.execute(stmt).rowcount
+
+def backfill(db: Session, from_year: int, from_month: int, to_year: int, to_month: int, as_of: date):
+    created = []
+    year, month = from_year, from_month
+    while (year, month) <= (to_year, to_month):
+        created.append({"year": year, "month": month, "created": generate_month_invoices(db, year, month)})
+        year, month = shift_month(year, month, 1)
+    overdue = mark_overdue(db, as_of)
+    filled = [date(m["year"], m["month"], 1) for m in created if m["created"]]
+    if filled:
+        period_close.reclose_all(db, min(filled))
+    db.commit()
+    cache.bump()
+    events.refresh("invoices")
+    return {"months": created, "marked_overdue": overdue}
+
+def run_monthly_invoices():
+    today = today_date()
+    db = SessionLocal()
+    try:
+        n = generate_month_invoices(db, today.year, today.month)
+        db.commit()
+        cache.bump()
+        if n:
+            events.refresh("invoices")
+        logger.info("Generated %d invoices for %d-%02d", n, today.year, today.month)
+    finally:
+        db.close()
+
+def run_overdue_sweep():
+    db = SessionLocal()
+    try:
+        n = mark_overdue(db, today_date())
+        db.commit()
+        cache.bump()
+        if n:
+            events.refresh("overdue")
+        logger.info("Marked %d invoices overdue", n)
+    finally:
+        db.close()
+
+def run_period_close():
+    db = SessionLocal()
+    try:
+        closed = period_close.close_periods(db)
+        db.commit()
+        cache.bump()
+        logger.info("Closed %d month(s)%s", len(closed), f" through {closed[-1]:%Y-%m}" if closed else "")
+    finally:
+        db.close()
+
+def scheduler_enabled():
+    return os.getenv("SCHEDULER_ENABLED", "0") == "1"
+
+def create_scheduler():
+    # Current month's invoices on the 1st (and once at startup, which catches up if the
+    # process was down on the 1st); last month's period close after them (also caught up
+    # at startup); overdue sweep nightly; staged M-Pesa callbacks and the SMS outbox
+    # every few seconds.
+    scheduler = BackgroundScheduler()
+    scheduler.add_job(run_monthly_invoices, CronTrigger(day=1, hour=0, minute=5), id="monthly_invoices",
+                      next_run_time=now_ts(), coalesce=True, max_instances=1, replace_existing=True)
+    scheduler.add_job(run_period_close, CronTrigger(day=1, hour=0, minute=30), id="period_close",
+                      next_run_time=now_ts(), coalesce=True, max_instances=1, replace_existing=True)
+    scheduler.add_job(run_overdue_sweep, CronTrigger(hour=0, minute=15), id="overdue_sweep",
+                      coalesce=True, max_instances=1, replace_existing=True)
+    scheduler.add_job(mpesa.run_worker, IntervalTrigger(seconds=int(os.getenv("MPESA_WORKER_INTERVAL_SECONDS", "2"))),
+                      id="mpesa_worker", coalesce=True, max_instances=1, replace_existing=True)
+    scheduler.add_job(notifications.run_dispatcher, IntervalTrigger(seconds=int(os.getenv("SMS_DISPATCH_INTERVAL_SECONDS", "10"))),
+                      id="sms_dispatcher", coalesce=True, max_instances=1, replace_existing=True)
+    return scheduler
@@ -0,0 +1,114 @@
+from datetime import date
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from models import House, Tenant, HouseTenant, Invoice, Payment
+from utils import shift_month
+
+# House x month rent ledger. The whole matrix comes from three queries (houses, first
+# join dates, invoices with their maintained paid_total) plus one query for
+# payment details when asked for, however many houses and months are covered.
+# Months without an invoice are shown as not paid against the house's current rent.
+
+def ledger_cell(year: int, month: int, amount_due: int, paid_total: int):
+    balance = max(amount_due - paid_total, 0)
+    state = "paid" if balance == 0 and paid_total >= amount_due else ("partially_paid" if paid_total > 0 else "not_paid")
+    return {"year": year, "month": month, "state": state, "amount_due": amount_due, "paid_total": paid_total, "balance": balance}
+
+def load_payment_details(db: Session, from_year: int, to_year: int, house_ids=None):
+    # {invoice_id: [detail, ...]} for confirmed payments on the invoices of from_year..to_year,
+    # oldest first. Selected through the invoices' period range, not an invoice id list,
+    # which over many houses and years would pass the drivers' bind parameter limits.
+    q = db.query(Payment.invoice_id, Tenant.full_name, Payment.amount, Payment.method, Payment.paid_at).join(
+        Invoice, Invoice.id == Payment.invoice_id
+    ).join(Tenant, Tenant.id == Payment.tenant_id).filter(
+        Invoice.period_start >= date(from_year, 1, 1),
+        Invoice.period_start < date(to_year + 1, 1, 1),
+        Payment.status == "confirmed"
+    )
+    if house_ids is not None:
+        q = q.filter(Invoice.house_id.in_(house_ids))
+    rows = q.order_by(Payment.id.asc()).all()
+    details = {}
+    for invoice_id, payer, amount, method, paid_at in rows:
+        details.setdefault(invoice_id, []).append({
+            "payer": payer,
+            "amount": amount,
+            "method": method,
+            "paid_at": paid_at.strftime("%Y-%m-%d %H:%M:%S")
+        })
+    return details
+
+def ledger_matrix(db: Session, from_year: int, to_year: int, house_ids=None, details: bool = False):
+    # One entry per house (by number) with a cell per month of from_year..to_year
+    houses = db.query(House.id, House.number, House.monthly_rent, House.is_active)
+    if house_ids is not None:
+        houses = houses.filter(House.id.in_(house_ids))
+    houses = houses.order_by(House.number.asc()).all()
+    if not houses:
+        return []
+    # the whole estate needs no id list, which grows with the houses
+    ids = [h.id for h in houses] if house_ids is not None else None
+
+    joined = db.query(HouseTenant.house_id, func.min(HouseTenant.start_date))
+    if ids is not None:
+        joined = joined.filter(HouseTenant.house_id.in_(ids))
+    joined = dict(joined.group_by(HouseTenant.house_id).all())
+
+    invoices = db.query(Invoice.id, Invoice.house_id, Invoice.period_start, Invoice.amount_due, Invoice.paid_total).filter(
+        Invoice.period_start >= date(from_year, 1, 1),
+        Invoice.period_start < date(to_year + 1, 1, 1)
+    )
+    if ids is not None:
+        invoices = invoices.filter(Invoice.house_id.in_(ids))
+    by_month = {(house_id, ps.year, ps.month): (inv_id, amount_due, paid) for inv_id, house_id, ps, amount_due, paid in invoices.all()}
+    payment_details = load_payment_details(db, from_year, to_year, ids) if details else {}
+
+    months = []
+    year, month = from_year, 1
+    while year <= to_year:
+        months.append((year, month))
+        year, month = shift_month(year, month, 1)
+
+    out = []
+    for h in houses:
+        items = []
+        for y, m in months:
+            inv = by_month.get((h.id, y, m))
+            if inv is None:
+                cell = ledger_cell(y, m, h.monthly_rent, 0)
+            else:
+                cell = ledger_cell(y, m, inv[1], inv[2])
+            if details:
+                cell["details"] = payment_details.get(inv[0], []) if inv else []
+            items.append(cell)
+        first = joined.get(h.id)
+        out.append({
+            "house_id": h.id,
+            "house_number": h.number,
+            "is_active": h.is_active,
+            "first_tenant_joined": first.isoformat() if first else None,
+            "items": items,
+        })
+    return out
+
+def column_totals(rows: list):
+    # Column sums of the matrix: [{year, month, amount_due, paid_total, balance}]
+    totals = {}
+    for row in rows:
+        for cell in row["items"]:
+            t = totals.setdefault((cell["year"], cell["month"]), {"year": cell["year"], "month": cell["month"], "amount_due": 0, "paid_total": 0, "balance": 0})
+            for k in ("amount_due", "paid_total", "balance"):
+                t[k] += cell[k]
+    return list(totals.values())
+
+def estate_ledger(db: Session, from_year: int, to_year: int, details: bool = False):
+    rows = ledger_matrix(db, from_year, to_year, details=details)
+    return {"from_year": from_year, "to_year": to_year, "houses": rows, "totals": column_totals(rows)}
+
+def house_ledger(db: Session, house_id: int, year: int):
+    # Single-house view (GET /houses/{id}/ledger/{year}); None if the house does not exist
+    rows = ledger_matrix(db, year, year, house_ids=[house_id], details=True)
+    if not rows:
+        return None
+    row = rows[0]
+    return {"house_number": row["house_number"], "first_tenant_joined": row["first_tenant_joined"], "items": row["items"]}
@@ -1,31 +1,133 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, APIRouter, Depends, HTTPException, Request, Header
+from fastapi.routing import APIRoute
+from fastapi.responses import PlainTextResponse, StreamingResponse, JSONResponse, Response, FileResponse
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.datastructures import MutableHeaders
 from sqlalchemy.orm import Session
-from base import Base, engine, get_db
-from models import House, Tenant, HouseTenant, Invoice, Payment
-from services import get_or_create_invoice_by_year_month, allocate_payment, house_total_received
+from sqlalchemy.ext.asyncio import AsyncSession
+from base import get_db, get_read_db, get_async_db, get_async_read_db, init_db, dispose_db, DB_ASYNC
+import base
+from models import House, Tenant, HouseTenant, MpesaCallback
+from services import (
+    allocate_payment, received_by_month, recent_payments,
+    load_house_summaries, list_payments, reverse_payment, month_totals, load_tenant_rows, publish_change
+)
 from pydantic import BaseModel
 from datetime import date
-from utils import today_date, make_month
-import calendar
+from utils import today_date, shift_month, normalize_phone
+import metrics
+import profiling
+import health
+import payment_import
+import jobs
+import notifications
+import mpesa
+import events
+import reports
+import ledger
+import invoice_totals
+import period_close
+import exports
+import tenant_search
+import cache
+from cache import response_cache
+from contextlib import asynccontextmanager
+import json
+import math
+import time
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # The engine and pool are created here, in each worker process, not at import
+    init_db()
+    scheduler = jobs.create_scheduler() if jobs.scheduler_enabled() else None
+    if scheduler:
+        scheduler.start()
+    yield
+    if scheduler:
+        scheduler.shutdown(wait=False)
+    await dispose_db()
 
-app = FastAPI(title="Murithi's Homes API")
+app = FastAPI(title="Murithi's Homes API", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
 #    allow_origins=["http://localhost:5174"],
-    allow_origins=["https://murithis-rentals.netlify.app/"]
+    allow_origins=["https://murithis-rentals.netlify.app/"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Read-Primary-Until", "X-Profile-Id"],
 )
 
-Base.metadata.create_all(bind=engine)
+app.add_middleware(metrics.RequestMetricsMiddleware)
+
+# Read-your-writes with a replica: after a successful write, tell the client (header
+# for the SPA to echo back, cookie for everything else) to read from the primary for
+# the next REPLICA_STICKY_SECONDS. Pure ASGI, like the metrics middleware.
+class ReadYourWritesMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] in ("GET", "HEAD", "OPTIONS") or not base.replica_enabled():
+            return await self.app(scope, receive, send)
+
+        async def send_with_sticky(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                seconds = base.sticky_seconds()
+                until = f"{time.time() + seconds:.3f}"
+                cookie = Response()
+                cookie.set_cookie("read_primary_until", until, max_age=math.ceil(seconds), httponly=True, samesite="lax")
+                headers = MutableHeaders(scope=message)
+                headers.append("X-Read-Primary-Until", until)
+                headers.append("set-cookie", cookie.headers["set-cookie"])
+            await send(message)
+
+        await self.app(scope, receive, send_with_sticky)
+
+app.add_middleware(ReadYourWritesMiddleware)
+
+# Opt-in request profiling (PROFILE_TOKEN / PROFILE_SAMPLE_RATE, see profiling.py);
+# not installed at all otherwise
+if profiling.enabled():
+    app.add_middleware(profiling.ProfilingMiddleware)
 
 @app.get("/")
 def root():
     return {"name": "Murithi's Homes API", "status": "ok"}
 
+# Liveness: the process is up and serving; does not touch the database
+@app.get("/healthz")
+def healthz():
+    return {"status": "ok"}
+
+# Readiness: the database is reachable and migrated to head; 503 otherwise
+@app.get("/readyz")
+def readyz():
+    ready, details = health.readiness()
+    return JSONResponse({"status": "ready" if ready else "not_ready", **details}, status_code=200 if ready else 503)
+
+# Prometheus text exposition of per-route request, SQL and pool metrics
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint():
+    return PlainTextResponse(metrics.registry.render() + response_cache.render_metrics() + events.hub.render_metrics(), media_type="text/plain; version=0.0.4")
+
+# Live change events (Server-Sent Events) for the dashboard: one JSON object per write,
+# see events.py. Last-Event-ID (sent by a reconnecting EventSource, or ?last_event_id=)
+# resumes after that event.
+@app.get("/events")
+async def events_stream(request: Request, last_event_id: int | None = None):
+    header = request.headers.get("last-event-id")
+    if header and header.isdigit():
+        last_event_id = int(header)
+    sub = events.hub.subscribe(last_event_id)
+    if sub is None:
+        raise HTTPException(503, "Too many event subscribers")
+    return StreamingResponse(events.hub.stream(sub), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache", "X-Accel-Buffering": "no"
+    })
+
 # DTOs
 class HouseCreate(BaseModel):
     number: int
@@ -41,6 +143,16 @@ class TenantCreate(BaseModel):
 class HouseTenantAdd(BaseModel):
     tenant_id: int
 
+class InvoiceBackfill(BaseModel):
+    from_year: int
+    from_month: int
+    to_year: int | None = None
+    to_month: int | None = None
+
+class CallbackPin(BaseModel):
+    house_id: int
+    tenant_id: int
+
 class PaymentCreate(BaseModel):
     house_id: int
     tenant_id: int
@@ -53,101 +165,33 @@ class PaymentCreate(BaseModel):
 
 # Finance dashboard
 @app.get("/stats")
-def stats(db: Session = Depends(get_db)):
-    houses = db.query(House).filter(House.is_active == True).all()
-    units = len(houses)
-    expected = sum(h.monthly_rent for h in houses)
-
-    start = today_date().replace(day=1)
-    payments = db.query(Payment).all()
-    received = sum(p.amount for p in payments if p.status == "confirmed" and p.paid_at.date() >= start)
-    outstanding = max(expected - received, 0)
-
-    # Top houses (month-to-date)
-    house_sums = []
-    for h in houses:
-        month_received = sum(p.amount for p in db.query(Payment).filter(Payment.house_id == h.id, Payment.status == "confirmed").all() if p.paid_at.date() >= start)
-        house_sums.append({"house_number": h.number, "received": month_received})
-    top_houses = sorted(house_sums, key=lambda x: x["received"], reverse=True)[:3]
+def stats(request: Request, db: Session = Depends(get_read_db)):
+    return response_cache.respond(request, ("stats", today_date()), lambda: compute_stats(db))
+
+def compute_stats(db: Session):
+    today = today_date()
+    totals = month_totals(db, today)
 
     # Recent payments with timestamps and target month
-    recent = []
-    for p in db.query(Payment).order_by(Payment.paid_at.desc()).limit(10).all():
-        h = db.query(House).get(p.house_id)
-        t = db.query(Tenant).get(p.tenant_id)
-        recent.append({
-            "house_number": h.number, "tenant_name": t.full_name,
-            "amount": p.amount, "method": p.method,
-            "paid_at": p.paid_at.strftime("%Y-%m-%d %H:%M:%S"),
-            "for_month": f"{p.target_year}-{str(p.target_month).zfill(2)}"
-        })
+    recent = recent_payments(db, 10)
 
     # Trend: last 6 months totals
-    trend = []
-    today = today_date()
-    for i in range(5, -1, -1):
-        year = (today.year if today.month - i > 0 else today.year - 1) if (today.month - i) <= 0 else today.year
-        month = ((today.month - i - 1) % 12) + 1
-        m_start = date(year, month, 1)
-        m_end = date(year, month, calendar.monthrange(year, month)[1])
-        m_received = sum(p.amount for p in db.query(Payment).all() if p.status == "confirmed" and m_start <= p.paid_at.date() <= m_end)
-        trend.append({"year": year, "month": month, "received": m_received})
+    months = [shift_month(today.year, today.month, -i) for i in range(5, -1, -1)]
+    ny, nm = shift_month(today.year, today.month, 1)
+    by_month = received_by_month(db, date(*months[0], 1), date(ny, nm, 1))
+    trend = [{"year": y, "month": m, "received": by_month.get((y, m), 0)} for y, m in months]
 
     return {
-        "units": units,
-        "expected": expected,
-        "received": received,
-        "outstanding": outstanding,
-        "top_houses": top_houses,
+        **totals,
         "recent_payments": recent,
         "trend": trend
     }
 
 # Houses with today summary and unpaid months
 @app.get("/houses")
-def list_houses(db: Session = Depends(get_db)):
-    cur_year = today_date().year
+def list_houses(request: Request, db: Session = Depends(get_read_db)):
     today = today_date()
-    houses = db.query(House).order_by(House.number.asc()).all()
-    out = []
-    for h in houses:
-        rels = db.query(HouseTenant).filter(HouseTenant.house_id == h.id, HouseTenant.status == "active").all()
-        tenants = []
-        for rel in rels:
-            t = db.query(Tenant).get(rel.tenant_id)
-            tenants.append({"id": t.id, "full_name": t.full_name, "phone": t.phone, "gov_id": t.gov_id, "email": t.email})
-        total_received = house_total_received(db, h.id)
-
-        # today's summary
-        today_payments = [p for p in db.query(Payment).filter(Payment.house_id == h.id).all() if p.paid_at.date() == today and p.status == "confirmed"]
-        today_received = sum(p.amount for p in today_payments)
-        paid_names = [db.query(Tenant).get(p.tenant_id).full_name for p in today_payments]
-        tenant_names = [x["full_name"] for x in tenants]
-        unpaid_names = [n for n in tenant_names if n not in paid_names]
-
-        # unpaid months current year
-        unpaid_months = []
-        for m in range(1, 13):
-            start, end = make_month(cur_year, m)
-            inv = db.query(Invoice).filter(Invoice.house_id == h.id, Invoice.period_start == start, Invoice.period_end == end).first()
-            if not inv:
-                unpaid_months.append(m)
-                continue
-            paid_total = sum(p.amount for p in inv.payments if p.status == "confirmed")
-            if paid_total < inv.amount_due:
-                unpaid_months.append(m)
-
-        out.append({
-            "id": h.id, "number": h.number, "type": h.type,
-            "monthly_rent": h.monthly_rent, "tenants": tenants,
-            "total_received": total_received,
-            "today_received": today_received,
-            "today_paid": paid_names,
-            "today_unpaid": unpaid_names,
-            "unpaid_months_year": cur_year,
-            "unpaid_months": unpaid_months
-        })
-    return out
+    return response_cache.respond(request, ("houses", today), lambda: load_house_summaries(db, today))
 
 @app.post("/houses")
 def create_house(payload: HouseCreate, db: Session = Depends(get_db)):
@@ -156,6 +200,8 @@ def create_house(payload: HouseCreate, db: Session = Depends(get_db)):
         raise HTTPException(400, "House number exists")
     h = House(number=payload.number, type=payload.type, monthly_rent=payload.monthly_rent, is_active=True)
     db.add(h); db.commit(); db.refresh(h)
+    cache.bump()
+    publish_change("house_created", [h.id])
     return {"id": h.id}
 
 @app.post("/houses/{house_id}/tenants")
@@ -169,6 +215,8 @@ def add_tenant_to_house(house_id: int, payload: HouseTenantAdd, db: Session = De
         raise HTTPException(400, "Tenant already assigned to this house")
     rel = HouseTenant(house_id=house_id, tenant_id=payload.tenant_id, status="active", start_date=today_date(), end_date=None)
     db.add(rel); db.commit(); db.refresh(rel)
+    cache.bump()
+    publish_change("tenant_assigned", [house_id], [payload.tenant_id])
     return {"id": rel.id, "status": "assigned"}
 
 @app.delete("/houses/{house_id}/tenants/{tenant_id}")
@@ -179,48 +227,33 @@ def remove_tenant_from_house(house_id: int, tenant_id: int, db: Session = Depend
     rel.status = "ended"
     rel.end_date = today_date()
     db.commit()
+    cache.bump()
+    publish_change("tenant_removed", [house_id], [tenant_id])
     return {"status": "ended"}
 
 # Tenants
 @app.post("/tenants")
 def create_tenant(payload: TenantCreate, db: Session = Depends(get_db)):
-    t = Tenant(full_name=payload.full_name, phone=payload.phone, gov_id=payload.gov_id, email=payload.email, is_active=True)
+    t = Tenant(full_name=payload.full_name, phone=payload.phone, phone_normalized=normalize_phone(payload.phone),
+               gov_id=payload.gov_id, email=payload.email, is_active=True)
     db.add(t); db.commit(); db.refresh(t)
+    cache.bump()
+    publish_change("tenant_created", tenant_ids=[t.id])
     return {"id": t.id}
 
 @app.get("/tenants")
-def list_tenants(db: Session = Depends(get_db)):
-    rels = db.query(HouseTenant).all()
-    merged = []
-    for rel in rels:
-        t = db.query(Tenant).get(rel.tenant_id)
-        h = db.query(House).get(rel.house_id)
-        merged.append({
-            "id": t.id,
-            "full_name": t.full_name,
-            "phone": t.phone,
-            "gov_id": t.gov_id,
-            "email": t.email,
-            "status": rel.status,
-            "house_number": h.number,
-            "start_date": rel.start_date.isoformat(),
-            "end_date": rel.end_date.isoformat() if rel.end_date else None
-        })
-    assigned_ids = {m["id"] for m in merged}
-    unassigned = db.query(Tenant).filter(Tenant.id.notin_(assigned_ids)).all()
-    for t in unassigned:
-        merged.append({
-            "id": t.id,
-            "full_name": t.full_name,
-            "phone": t.phone,
-            "gov_id": t.gov_id,
-            "email": t.email,
-            "status": "unassigned",
-            "house_number": None,
-            "start_date": None,
-            "end_date": None
-        })
-    return merged
+def list_tenants(request: Request, db: Session = Depends(get_read_db)):
+    return response_cache.respond(request, ("tenants",), lambda: load_tenant_rows(db))
+
+# Search by name (prefix or substring), phone (any of the +2547.../07.../7... forms,
+# by prefix) or exact gov_id; best matches first, paged with limit/offset
+@app.get("/tenants/search")
+def search_tenants(q: str, limit: int = 20, offset: int = 0, db: Session = Depends(get_read_db)):
+    if not q.strip():
+        raise HTTPException(400, "q must not be empty")
+    if not 1 <= limit <= 100 or offset < 0:
+        raise HTTPException(400, "limit must be between 1 and 100 and offset non-negative")
+    return tenant_search.search_tenants(db, q, limit, offset)
 
 @app.delete("/tenants/{tenant_id}")
 def soft_delete_tenant(tenant_id: int, db: Session = Depends(get_db)):
@@ -229,10 +262,14 @@ def soft_delete_tenant(tenant_id: int, db: Session = Depends(get_db)):
         raise HTTPException(404, "Tenant not found")
     t.is_active = False
     rels = db.query(HouseTenant).filter(HouseTenant.tenant_id == tenant_id, HouseTenant.status == "active").all()
+    house_ids = []
     for rel in rels:
         rel.status = "ended"
         rel.end_date = today_date()
+        house_ids.append(rel.house_id)
     db.commit()
+    cache.bump()
+    publish_change("tenant_deactivated", house_ids, [tenant_id])
     return {"status": "inactive"}
 
 # Payments (with allocation)
@@ -244,10 +281,8 @@ def record_payment(payload: PaymentCreate, db: Session = Depends(get_db)):
     t = db.query(Tenant).get(payload.tenant_id)
     if not h or not t:
         raise HTTPException(404, "House or tenant not found")
-    rel = db.query(HouseTenant).filter(HouseTenant.house_id == h.id, HouseTenant.tenant_id == t.id, HouseTenant.status == "active").first()
-    if not rel:
-        raise HTTPException(400, "Tenant is not assigned to this house")
 
+    # allocate_payment checks the assignment and raises ValueError when it is missing
     try:
         allocations = allocate_payment(
             db, house_id=h.id, tenant_id=t.id, method=payload.method,
@@ -259,49 +294,332 @@ def record_payment(payload: PaymentCreate, db: Session = Depends(get_db)):
 
     return {"allocations": allocations}
 
+# Reverse a confirmed payment (e.g. a bounced M-Pesa transaction); its invoice balance reopens
+@app.post("/payments/{payment_id}/reverse")
+def reverse_payment_endpoint(payment_id: int, db: Session = Depends(get_db)):
+    try:
+        out = reverse_payment(db, payment_id)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    if out is None:
+        raise HTTPException(404, "Payment not found")
+    return out
+
+# Payments listing, newest first; pass next_cursor back as cursor for the next page
+@app.get("/payments")
+def payments_listing(limit: int = 50, cursor: str | None = None, house_id: int | None = None, tenant_id: int | None = None,
+                     method: str | None = None, status: str | None = None, date_from: date | None = None,
+                     date_to: date | None = None, db: Session = Depends(get_read_db)):
+    if not 1 <= limit <= 500:
+        raise HTTPException(400, "limit must be between 1 and 500")
+    try:
+        return list_payments(db, limit, cursor, house_id, tenant_id, method, status, date_from, date_to)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+# Bulk import of M-Pesa statements / cash ledgers. Body is CSV (with a header row) or
+# NDJSON using the POST /payments fields plus optional paid_at; rows whose tx_ref was
+# already imported are skipped. Streams back one NDJSON result per row and a summary.
+@app.post("/payments/bulk")
+async def bulk_import_payments(request: Request, format: str | None = None, batch_size: int = 500, notify: bool = False):
+    fmt = format or ("csv" if "csv" in request.headers.get("content-type", "") else "ndjson")
+    if fmt not in ("csv", "ndjson"):
+        raise HTTPException(400, "Unsupported format")
+    if not 1 <= batch_size <= 5000:
+        raise HTTPException(400, "batch_size must be between 1 and 5000")
+    spool = await payment_import.spool_upload(request.stream())
+    return StreamingResponse(
+        payment_import.stream_import(spool, fmt, batch_size, notify),
+        media_type="application/x-ndjson"
+    )
+
+# M-Pesa C2B confirmation callback (register this URL with ?token=<MPESA_CALLBACK_TOKEN>;
+# refused while no token is configured, see mpesa.check_token). The payment is only staged here; the M-Pesa worker
+# allocates it. A retried callback for a staged TransID is acknowledged again.
+@app.post("/mpesa/c2b/confirmation")
+async def mpesa_c2b_confirmation(request: Request, token: str | None = None):
+    if not mpesa.check_token(token):
+        return JSONResponse({"ResultCode": 1, "ResultDesc": "Forbidden"}, status_code=403)
+    try:
+        values = mpesa.parse_callback(await request.body())
+    except mpesa.CallbackError as e:
+        return JSONResponse({"ResultCode": 1, "ResultDesc": str(e)}, status_code=400)
+    await mpesa.staging.stage(values)
+    return {"ResultCode": 0, "ResultDesc": "Accepted"}
+
+# Admin: (back)fill invoices for a month range and run the overdue sweep
+@app.post("/admin/invoices/generate")
+def admin_generate_invoices(payload: InvoiceBackfill, db: Session = Depends(get_db)):
+    today = today_date()
+    to_year = payload.to_year or payload.from_year
+    to_month = payload.to_month or payload.from_month
+    if not (1 <= payload.from_month <= 12 and 1 <= to_month <= 12):
+        raise HTTPException(400, "Invalid month")
+    if (to_year, to_month) < (payload.from_year, payload.from_month):
+        raise HTTPException(400, "Range end is before its start")
+    if (to_year - payload.from_year) * 12 + to_month - payload.from_month >= 120:
+        raise HTTPException(400, "Range is limited to 120 months")
+    return jobs.backfill(db, payload.from_year, payload.from_month, to_year, to_month, today)
+
+@app.post("/admin/invoices/mark-overdue")
+def admin_mark_overdue(db: Session = Depends(get_db)):
+    n = jobs.mark_overdue(db, today_date())
+    db.commit()
+    cache.bump()
+    if n:
+        events.refresh("overdue")
+    return {"marked_overdue": n}
+
+# Admin: recompute invoice paid_total/balance from payments; repair=true fixes drift
+@app.post("/admin/invoices/verify-totals")
+def admin_verify_invoice_totals(repair: bool = False, limit: int = 100, db: Session = Depends(get_db)):
+    report = invoice_totals.find_drift(db, limit)
+    if repair and report["drifted"]:
+        report["repaired"] = invoice_totals.repair(db)
+        db.commit()
+        cache.bump()
+        events.refresh("invoice_totals")
+    return report
+
+# Admin: close every finished month up to year/month (default: last month) that is not
+# closed yet; the scheduler does the same on the 1st
+@app.post("/admin/periods/close")
+def admin_close_periods(year: int | None = None, month: int | None = None, db: Session = Depends(get_db)):
+    if (year is None) != (month is None):
+        raise HTTPException(400, "Pass both year and month, or neither")
+    try:
+        closed = period_close.close_periods(db, date(year, month, 1) if year else None)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    db.commit()
+    cache.bump()
+    through = period_close.closed_through(db)
+    return {"closed": [p.isoformat() for p in closed], "closed_through": through.isoformat() if through else None}
+
+# Admin: allocate staged M-Pesa callbacks now; list them by status; pin an
+# unmatched one to a house and tenant (allocated on the next run)
+@app.post("/admin/mpesa/process")
+def admin_process_mpesa():
+    return mpesa.process_staged()
+
+@app.get("/admin/mpesa/callbacks")
+def admin_list_mpesa_callbacks(status: str = "unmatched", limit: int = 100, db: Session = Depends(get_db)):
+    if not 1 <= limit <= 500:
+        raise HTTPException(400, "limit must be between 1 and 500")
+    rows = db.query(MpesaCallback).filter(MpesaCallback.status == status).order_by(MpesaCallback.id.desc()).limit(limit).all()
+    return [mpesa.callback_record(cb) for cb in rows]
+
+@app.post("/admin/mpesa/callbacks/{callback_id}/pin")
+def admin_pin_mpesa_callback(callback_id: int, payload: CallbackPin, db: Session = Depends(get_db)):
+    try:
+        cb = mpesa.pin_callback(db, callback_id, payload.house_id, payload.tenant_id)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    if cb is None:
+        raise HTTPException(404, "Callback not found")
+    db.commit()
+    return mpesa.callback_record(cb)
+
+# Request profiles, newest first (see profiling.py). Download one as JSON, or as folded
+# stacks (?format=folded) for flamegraph.pl or speedscope. Both need the
+# X-Profile: <PROFILE_TOKEN> header: profiles hold routes, query strings and SQL.
+def require_profile_token(x_profile: str | None = Header(None)):
+    if not profiling.check_token(x_profile):
+        raise HTTPException(403, "Forbidden")
+
+@app.get("/admin/profiles", dependencies=[Depends(require_profile_token)])
+def admin_list_profiles(limit: int = 50):
+    return profiling.store.list(limit)
+
+@app.get("/admin/profiles/{profile_id}", dependencies=[Depends(require_profile_token)])
+def admin_download_profile(profile_id: str, format: str = "json"):
+    path = profiling.store.path(profile_id)
+    if path is None:
+        raise HTTPException(404, "Profile not found")
+    if format == "folded":
+        with open(path) as f:
+            return PlainTextResponse("\n".join(json.load(f)["stacks"]) + "\n")
+    if format != "json":
+        raise HTTPException(400, "Unsupported format")
+    return FileResponse(path, media_type="application/json", filename=f"profile-{profile_id}.json")
+
+# Admin: send queued notifications now instead of waiting for the scheduler
+@app.post("/admin/notifications/dispatch")
+def admin_dispatch_notifications():
+    return notifications.dispatch_pending()
+
+# Reports
+def report_date(year: int, month: int, day: int = 1):
+    try:
+        return date(year, month, day)
+    except ValueError:
+        raise HTTPException(400, "Invalid date")
+
+@app.get("/reports/daily/{year}/{month}/{day}")
+def daily_report(year: int, month: int, day: int, db: Session = Depends(get_read_db)):
+    return reports.daily_report(db, report_date(year, month, day))
+
+@app.get("/reports/monthly/{year}/{month}")
+def monthly_report(year: int, month: int, db: Session = Depends(get_read_db)):
+    report_date(year, month)
+    return reports.monthly_report(db, year, month)
+
+@app.get("/reports/yearly/{year}")
+def yearly_report(year: int, db: Session = Depends(get_read_db)):
+    report_date(year, 1)
+    return reports.yearly_report(db, year)
+
+# Balances and arrears as of a day (default today) over all years, from the latest
+# month-end snapshot plus what happened since
+@app.get("/houses/{house_id}/balance")
+def house_balance(house_id: int, as_of: date | None = None, db: Session = Depends(get_read_db)):
+    out = period_close.house_balance(db, house_id, as_of or today_date())
+    if out is None:
+        raise HTTPException(404, "House not found")
+    return out
+
+@app.get("/tenants/{tenant_id}/balance")
+def tenant_balance(tenant_id: int, as_of: date | None = None, db: Session = Depends(get_read_db)):
+    out = period_close.tenant_balance(db, tenant_id, as_of or today_date())
+    if out is None:
+        raise HTTPException(404, "Tenant not found")
+    return out
+
+# Arrears aging across the estate: each owing house's balance split by days overdue
+# (not_due, 0-30, 31-60, 61-90, 90+)
+@app.get("/reports/arrears")
+def arrears_report(as_of: date | None = None, db: Session = Depends(get_read_db)):
+    return period_close.arrears_aging(db, as_of or today_date())
+
 # House yearly ledger: month-by-month status, remaining, and earliest join date
 @app.get("/houses/{house_id}/ledger/{year}")
-def house_year_ledger(house_id: int, year: int, db: Session = Depends(get_db)):
-    h = db.query(House).get(house_id)
-    if not h:
+def house_year_ledger(house_id: int, year: int, request: Request, db: Session = Depends(get_read_db)):
+    return response_cache.respond(request, ("ledger", house_id, year), lambda: compute_house_ledger(db, house_id, year))
+
+def compute_house_ledger(db: Session, house_id: int, year: int):
+    out = ledger.house_ledger(db, house_id, year)
+    if out is None:
         raise HTTPException(404, "House not found")
+    return out
+
+# Whole-estate ledger: house x month matrix for one year, or for from_year..to_year;
+# details=true adds each month's confirmed payments
+@app.get("/ledger/{year}")
+def estate_year_ledger(year: int, request: Request, details: bool = False, db: Session = Depends(get_read_db)):
+    return response_cache.respond(request, ("estate_ledger", year, year, details), lambda: ledger.estate_ledger(db, year, year, details))
+
+@app.get("/ledger")
+def estate_range_ledger(from_year: int, to_year: int, request: Request, details: bool = False, db: Session = Depends(get_read_db)):
+    if to_year < from_year:
+        raise HTTPException(400, "Range end is before its start")
+    if to_year - from_year >= 10:
+        raise HTTPException(400, "Range is limited to 10 years")
+    return response_cache.respond(request, ("estate_ledger", from_year, to_year, details), lambda: ledger.estate_ledger(db, from_year, to_year, details))
+
+# Exports: the whole history as a download, format=csv (default) or ndjson, streamed
+# in constant memory; date_from/date_to filter on paid_at (payments) or the invoiced
+# month (invoices). Not cached, and read from the replica when there is one.
+def export_response(rows, fmt: str, name: str):
+    return StreamingResponse(rows, media_type=exports.FORMATS[fmt], headers={
+        "Content-Disposition": f'attachment; filename="{name}.{fmt}"'
+    })
+
+def check_export(fmt: str, date_from: date | None, date_to: date | None):
+    if fmt not in exports.FORMATS:
+        raise HTTPException(400, "Unsupported format")
+    if date_from and date_to and date_to < date_from:
+        raise HTTPException(400, "Range end is before its start")
+
+@app.get("/exports/payments")
+def export_payments(request: Request, format: str = "csv", date_from: date | None = None, date_to: date | None = None,
+                    house_id: int | None = None, status: str | None = None):
+    check_export(format, date_from, date_to)
+    rows = exports.export_payments(format, base.read_role(request), date_from=date_from, date_to=date_to, house_id=house_id, status=status)
+    return export_response(rows, format, "payments")
+
+@app.get("/exports/invoices")
+def export_invoices(request: Request, format: str = "csv", date_from: date | None = None, date_to: date | None = None,
+                    house_id: int | None = None, status: str | None = None):
+    check_export(format, date_from, date_to)
+    rows = exports.export_invoices(format, base.read_role(request), date_from=date_from, date_to=date_to, house_id=house_id, status=status)
+    return export_response(rows, format, "invoices")
+
+@app.get("/exports/ledger/{year}")
+def export_ledger(year: int, request: Request, format: str = "csv"):
+    check_export(format, None, None)
+    return export_response(exports.export_ledger(format, base.read_role(request), year), format, f"ledger-{year}")
+
+# Async variants (DB_ASYNC=1). Each one runs the sync handler above on the request's
+# AsyncSession via run_sync, so queries are awaited on the event loop instead of
+# occupying a threadpool worker, while the query code itself stays shared.
+async_router = APIRouter()
+
+@async_router.get("/stats")
+async def stats_async(request: Request, db: AsyncSession = Depends(get_async_read_db)):
+    return await db.run_sync(lambda s: stats(request, s))
+
+@async_router.get("/houses")
+async def list_houses_async(request: Request, db: AsyncSession = Depends(get_async_read_db)):
+    return await db.run_sync(lambda s: list_houses(request, s))
+
+@async_router.get("/tenants")
+async def list_tenants_async(request: Request, db: AsyncSession = Depends(get_async_read_db)):
+    return await db.run_sync(lambda s: list_tenants(request, s))
+
+@async_router.get("/tenants/search")
+async def search_tenants_async(q: str, limit: int = 20, offset: int = 0, db: AsyncSession = Depends(get_async_read_db)):
+    return await db.run_sync(lambda s: search_tenants(q, limit, offset, s))
+
+@async_router.get("/houses/{house_id}/balance")
+async def house_balance_async(house_id: int, as_of: date | None = None, db: AsyncSession = Depends(get_async_read_db)):
+    return await db.run_sync(lambda s: house_balance(house_id, as_of, s))
+
+@async_router.get("/tenants/{tenant_id}/balance")
+async def tenant_balance_async(tenant_id: int, as_of: date | None = None, db: AsyncSession = Depends(get_async_read_db)):
+    return await db.run_sync(lambda s: tenant_balance(tenant_id, as_of, s))
+
+@async_router.get("/reports/arrears")
+async def arrears_report_async(as_of: date | None = None, db: AsyncSession = Depends(get_async_read_db)):
+    return await db.run_sync(lambda s: arrears_report(as_of, s))
+
+@async_router.get("/houses/{house_id}/ledger/{year}")
+async def house_year_ledger_async(house_id: int, year: int, request: Request, db: AsyncSession = Depends(get_async_read_db)):
+    return await db.run_sync(lambda s: house_year_ledger(house_id, year, request, s))
+
+@async_router.get("/ledger/{year}")
+async def estate_year_ledger_async(year: int, request: Request, details: bool = False, db: AsyncSession = Depends(get_async_read_db)):
+    return await db.run_sync(lambda s: estate_year_ledger(year, request, details, s))
+
+@async_router.get("/ledger")
+async def estate_range_ledger_async(from_year: int, to_year: int, request: Request, details: bool = False, db: AsyncSession = Depends(get_async_read_db)):
+    return await db.run_sync(lambda s: estate_range_ledger(from_year, to_year, request, details, s))
+
+@async_router.get("/reports/daily/{year}/{month}/{day}")
+async def daily_report_async(year: int, month: int, day: int, db: AsyncSession = Depends(get_async_read_db)):
+    return await db.run_sync(lambda s: daily_report(year, month, day, s))
+
+@async_router.get("/reports/monthly/{year}/{month}")
+async def monthly_report_async(year: int, month: int, db: AsyncSession = Depends(get_async_read_db)):
+    return await db.run_sync(lambda s: monthly_report(year, month, s))
+
+@async_router.get("/reports/yearly/{year}")
+async def yearly_report_async(year: int, db: AsyncSession = Depends(get_async_read_db)):
+    return await db.run_sync(lambda s: yearly_report(year, s))
+
+@async_router.get("/payments")
+async def payments_listing_async(limit: int = 50, cursor: str | None = None, house_id: int | None = None, tenant_id: int | None = None,
+                                 method: str | None = None, status: str | None = None, date_from: date | None = None,
+                                 date_to: date | None = None, db: AsyncSession = Depends(get_async_read_db)):
+    return await db.run_sync(lambda s: payments_listing(limit, cursor, house_id, tenant_id, method, status, date_from, date_to, s))
+
+@async_router.post("/payments")
+async def record_payment_async(payload: PaymentCreate, db: AsyncSession = Depends(get_async_db)):
+    return await db.run_sync(lambda s: record_payment(payload, s))
 
-    # earliest tenant start date on this house
-    rels_all = db.query(HouseTenant).filter(HouseTenant.house_id == h.id).all()
-    earliest = None
-    for rel in rels_all:
-        if earliest is None or rel.start_date < earliest:
-            earliest = rel.start_date
-    earliest_str = earliest.isoformat() if earliest else None
-
-    items = []
-    for m in range(1, 13):
-        start, end = make_month(year, m)
-        inv = db.query(Invoice).filter(Invoice.house_id == h.id, Invoice.period_start == start, Invoice.period_end == end).first()
-        if not inv:
-            # no invoice means not paid/never generated
-            items.append({
-                "year": year, "month": m,
-                "state": "not_paid",
-                "amount_due": h.monthly_rent, "paid_total": 0, "balance": h.monthly_rent,
-                "details": []
-            })
-            continue
-        paid_total = sum(p.amount for p in inv.payments if p.status == "confirmed")
-        balance = max(inv.amount_due - paid_total, 0)
-        state = "paid" if balance == 0 and paid_total >= inv.amount_due else ("partially_paid" if paid_total > 0 else "not_paid")
-        # payment details for this invoice
-        details = [{
-            "payer": db.query(Tenant).get(p.tenant_id).full_name,
-            "amount": p.amount,
-            "method": p.method,
-            "paid_at": p.paid_at.strftime("%Y-%m-%d %H:%M:%S")
-        } for p in inv.payments if p.status == "confirmed"]
-        items.append({
-            "year": year, "month": m,
-            "state": state,
-            "amount_due": inv.amount_due, "paid_total": paid_total, "balance": balance,
-            "details": details
-        })
-
-    return {"house_number": h.number, "first_tenant_joined": earliest_str, "items": items}
+if DB_ASYNC:
+    async_routes = {(r.path, m) for r in async_router.routes for m in r.methods}
+    app.router.routes = [
+        r for r in app.router.routes
+        if not (isinstance(r, APIRoute) and any((r.path, m) in async_routes for m in r.methods))
+    ]
+    app.include_router(async_router)
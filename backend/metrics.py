@@ -0,0 +1,168 @@
+from contextvars import ContextVar
+from threading import Lock
+import logging
+import os
+import time
+from sqlalchemy import event
+from starlette.datastructures import MutableHeaders
+
+logger = logging.getLogger("rentals.metrics")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+# Per-request accumulator; sync routes run in the threadpool with a copy of
+# this context, so they see (and mutate) the same RequestStats object.
+current_request = ContextVar("current_request", default=None)
+
+class RequestStats:
+    __slots__ = ("statements", "db_time", "pool_wait")
+
+    def __init__(self):
+        self.statements = 0
+        self.db_time = 0.0
+        self.pool_wait = 0.0
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.n = 0
+
+    def observe(self, value):
+        for i, b in enumerate(self.buckets):
+            if value <= b:
+                self.counts[i] += 1
+                break
+        self.total += value
+        self.n += 1
+
+class Registry:
+    def __init__(self):
+        self.lock = Lock()
+        self.requests = {}      # (method, route, status) -> count
+        self.latency = {}       # (method, route) -> Histogram
+        self.statements = {}    # (method, route) -> Histogram
+        self.db_time = {}       # (method, route) -> seconds
+        self.pool_wait = {}     # (method, route) -> seconds
+
+    def record(self, method: str, route: str, status: int, elapsed: float, stats: RequestStats):
+        key = (method, route)
+        with self.lock:
+            self.requests[(method, route, status)] = self.requests.get((method, route, status), 0) + 1
+            self.latency.setdefault(key, Histogram(LATENCY_BUCKETS)).observe(elapsed)
+            self.statements.setdefault(key, Histogram(STATEMENT_BUCKETS)).observe(stats.statements)
+            self.db_time[key] = self.db_time.get(key, 0.0) + stats.db_time
+            self.pool_wait[key] = self.pool_wait.get(key, 0.0) + stats.pool_wait
+
+    def render(self):
+        lines = []
+        with self.lock:
+            lines.append("# HELP http_requests_total Requests handled, by route and status.")
+            lines.append("# TYPE http_requests_total counter")
+            for (method, route, status), n in sorted(self.requests.items()):
+                lines.append(f'http_requests_total{{method="{method}",route="{route}",status="{status}"}} {n}')
+            _render_histograms(lines, "http_request_duration_seconds", "Request latency in seconds.", self.latency)
+            _render_histograms(lines, "db_statements_per_request", "SQL statements executed per request.", self.statements)
+            _render_counters(lines, "db_time_seconds_total", "Time spent executing SQL statements.", self.db_time)
+            _render_counters(lines, "db_pool_wait_seconds_total", "Time spent waiting for a pooled connection.", self.pool_wait)
+        return "\n".join(lines) + "\n"
+
+def _render_counters(lines, name, help_, values):
+    lines.append(f"# HELP {name} {help_}")
+    lines.append(f"# TYPE {name} counter")
+    for (method, route), v in sorted(values.items()):
+        lines.append(f'{name}{{method="{method}",route="{route}"}} {v:.6f}')
+
+def _render_histograms(lines, name, help_, hists):
+    lines.append(f"# HELP {name} {help_}")
+    lines.append(f"# TYPE {name} histogram")
+    for (method, route), h in sorted(hists.items()):
+        labels = f'method="{method}",route="{route}"'
+        cumulative = 0
+        for b, c in zip(h.buckets, h.counts):
+            cumulative += c
+            lines.append(f'{name}_bucket{{{labels},le="{b}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {h.n}')
+        lines.append(f"{name}_sum{{{labels}}} {h.total:.6f}")
+        lines.append(f"{name}_count{{{labels}}} {h.n}")
+
+registry = Registry()
+
+def query_count_header_enabled():
+    return os.getenv("METRICS_QUERY_COUNT_HEADER", "0") == "1"
+
+def statement_budget():
+    # 0 disables the over-budget log line
+    return int(os.getenv("SQL_STATEMENT_BUDGET", "0"))
+
+def instrument_engine(engine):
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        stats = current_request.get()
+        if stats is not None:
+            stats.statements += 1
+            stats.db_time += elapsed
+
+    # The pool has no "before checkout" event, so time Pool.connect itself
+    pool = engine.pool
+    connect = pool.connect
+
+    def timed_connect():
+        start = time.perf_counter()
+        try:
+            return connect()
+        finally:
+            stats = current_request.get()
+            if stats is not None:
+                stats.pool_wait += time.perf_counter() - start
+
+    pool.connect = timed_connect
+
+class RequestMetricsMiddleware:
+    # Pure ASGI rather than @app.middleware("http"): BaseHTTPMiddleware relays every
+    # body chunk through extra tasks, which long-lived streams (/events) pay per event.
+    # Latency is measured to the response head, so a stream counts its setup only.
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        stats = RequestStats()
+        token = current_request.set(stats)
+        start = time.perf_counter()
+        recorded = False
+
+        def record(status: int):
+            nonlocal recorded
+            recorded = True
+            elapsed = time.perf_counter() - start
+            route_path = getattr(scope.get("route"), "path", "unmatched")
+            registry.record(scope["method"], route_path, status, elapsed, stats)
+            budget = statement_budget()
+            if budget and stats.statements > budget:
+                logger.warning(
+                    "%s %s ran %d SQL statements (budget %d) in %.1f ms",
+                    scope["method"], route_path, stats.statements, budget, elapsed * 1000
+                )
+
+        async def send_with_metrics(message):
+            if message["type"] == "http.response.start" and not recorded:
+                record(message["status"])
+                if query_count_header_enabled():
+                    MutableHeaders(scope=message).append("X-Query-Count", str(stats.statements))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            current_request.reset(token)
+            if not recorded:
+                record(500)
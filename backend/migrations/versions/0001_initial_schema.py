@@ -0,0 +1,103 @@
+"""initial schema
+
+Tables as previously created by Base.metadata.create_all. Databases that
+were bootstrapped that way already have them, so existing tables are left
+alone and only missing ones are created.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0001"
+down_revision: Union[str, Sequence[str], None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    existing = set(sa.inspect(op.get_bind()).get_table_names())
+    if "houses" not in existing:
+        op.create_table(
+            "houses",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("number", sa.Integer(), nullable=False, unique=True),
+            sa.Column("type", sa.String(20), nullable=False),
+            sa.Column("monthly_rent", sa.Integer(), nullable=False),
+            sa.Column("is_active", sa.Boolean(), nullable=False),
+        )
+    if "tenants" not in existing:
+        op.create_table(
+            "tenants",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("full_name", sa.String(120), nullable=False),
+            sa.Column("phone", sa.String(20), nullable=False),
+            sa.Column("gov_id", sa.String(40), nullable=False),
+            sa.Column("email", sa.String(120)),
+            sa.Column("is_active", sa.Boolean(), nullable=False),
+        )
+    if "house_tenants" not in existing:
+        op.create_table(
+            "house_tenants",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("house_id", sa.Integer(), sa.ForeignKey("houses.id"), nullable=False),
+            sa.Column("tenant_id", sa.Integer(), sa.ForeignKey("tenants.id"), nullable=False),
+            sa.Column("status", sa.String(20), nullable=False),
+            sa.Column("start_date", sa.Date(), nullable=False),
+            sa.Column("end_date", sa.Date()),
+        )
+    if "invoices" not in existing:
+        op.create_table(
+            "invoices",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("house_id", sa.Integer(), sa.ForeignKey("houses.id"), nullable=False),
+            sa.Column("period_start", sa.Date(), nullable=False),
+            sa.Column("period_end", sa.Date(), nullable=False),
+            sa.Column("amount_due", sa.Integer(), nullable=False),
+            sa.Column("due_date", sa.Date(), nullable=False),
+            sa.Column("status", sa.String(20), nullable=False),
+            sa.Column("created_at", sa.TIMESTAMP(), nullable=False),
+        )
+    if "payments" not in existing:
+        op.create_table(
+            "payments",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("invoice_id", sa.Integer(), sa.ForeignKey("invoices.id")),
+            sa.Column("house_id", sa.Integer(), sa.ForeignKey("houses.id"), nullable=False),
+            sa.Column("tenant_id", sa.Integer(), sa.ForeignKey("tenants.id"), nullable=False),
+            sa.Column("method", sa.String(20), nullable=False),
+            sa.Column("amount", sa.Integer(), nullable=False),
+            sa.Column("tx_ref", sa.String(80)),
+            sa.Column("mpesa_msisdn", sa.String(20)),
+            sa.Column("target_year", sa.Integer(), nullable=False),
+            sa.Column("target_month", sa.Integer(), nullable=False),
+            sa.Column("paid_at", sa.TIMESTAMP(), nullable=False),
+            sa.Column("status", sa.String(20), nullable=False),
+            sa.Column("notes", sa.Text()),
+        )
+    if "notifications" not in existing:
+        op.create_table(
+            "notifications",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("tenant_id", sa.Integer(), sa.ForeignKey("tenants.id"), nullable=False),
+            sa.Column("type", sa.String(30), nullable=False),
+            sa.Column("channel", sa.String(20), nullable=False),
+            sa.Column("message", sa.Text(), nullable=False),
+            sa.Column("status", sa.String(20), nullable=False),
+            sa.Column("ref_entity", sa.String(40)),
+            sa.Column("sent_at", sa.TIMESTAMP(), nullable=False),
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table in ("notifications", "payments", "invoices", "house_tenants", "tenants", "houses"):
+        op.drop_table(table)
@@ -0,0 +1,52 @@
+"""composite indexes for hot lookups, unique invoice per house-month
+
+Duplicate invoices for the same house and month (left behind by racing
+payments) are merged into the oldest one before the unique constraint is
+added: their payments are re-pointed and the extra rows deleted.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0002"
+down_revision: Union[str, Sequence[str], None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    dup_ids = "SELECT id FROM invoices WHERE id NOT IN (SELECT MIN(id) FROM invoices GROUP BY house_id, period_start)"
+    op.execute(f"""
+        UPDATE payments SET invoice_id = (
+            SELECT MIN(i2.id) FROM invoices i1 JOIN invoices i2
+              ON i2.house_id = i1.house_id AND i2.period_start = i1.period_start
+            WHERE i1.id = payments.invoice_id
+        )
+        WHERE invoice_id IN ({dup_ids})
+    """)
+    op.execute(f"DELETE FROM invoices WHERE id IN ({dup_ids})")
+    with op.batch_alter_table("invoices") as batch:
+        batch.create_unique_constraint("uq_invoices_house_period_start", ["house_id", "period_start"])
+    op.create_index("ix_payments_house_status", "payments", ["house_id", "status"])
+    op.create_index("ix_payments_paid_at", "payments", ["paid_at"])
+    op.create_index("ix_payments_invoice_id", "payments", ["invoice_id"])
+    op.create_index("ix_house_tenants_house_tenant_status", "house_tenants", ["house_id", "tenant_id", "status"])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_house_tenants_house_tenant_status", table_name="house_tenants")
+    op.drop_index("ix_payments_invoice_id", table_name="payments")
+    op.drop_index("ix_payments_paid_at", table_name="payments")
+    op.drop_index("ix_payments_house_status", table_name="payments")
+    with op.batch_alter_table("invoices") as batch:
+        batch.drop_constraint("uq_invoices_house_period_start", type_="unique")
@@ -0,0 +1,36 @@
+"""keyset pagination indexes for the payments listing
+
+(paid_at, id) replaces the single-column paid_at index: it serves the same
+range scans and also the newest-first cursor order. (house_id, paid_at, id)
+serves a house's statement.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0003"
+down_revision: Union[str, Sequence[str], None] = "0002"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index("ix_payments_paid_at_id", "payments", ["paid_at", "id"])
+    op.create_index("ix_payments_house_paid_at_id", "payments", ["house_id", "paid_at", "id"])
+    op.drop_index("ix_payments_paid_at", table_name="payments")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.create_index("ix_payments_paid_at", "payments", ["paid_at"])
+    op.drop_index("ix_payments_house_paid_at_id", table_name="payments")
+    op.drop_index("ix_payments_paid_at_id", table_name="payments")
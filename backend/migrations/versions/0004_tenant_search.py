@@ -0,0 +1,54 @@
+"""tenant search: normalized phone column and lookup indexes
+
+Adds tenants.phone_normalized (backfilled with utils.normalize_phone) with
+indexes on it and on gov_id. On Postgres, a pg_trgm GIN index on
+lower(full_name) serves both prefix and substring name matching; SQLite uses
+the in-process index in tenant_search.py instead.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from utils import normalize_phone
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0004"
+down_revision: Union[str, Sequence[str], None] = "0003"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table("tenants") as batch:
+        batch.add_column(sa.Column("phone_normalized", sa.String(20)))
+    bind = op.get_bind()
+    tenants = sa.table("tenants", sa.column("id", sa.Integer), sa.column("phone", sa.String), sa.column("phone_normalized", sa.String))
+    rows = bind.execute(sa.select(tenants.c.id, tenants.c.phone)).all()
+    if rows:
+        bind.execute(
+            tenants.update().where(tenants.c.id == sa.bindparam("tid")).values(phone_normalized=sa.bindparam("norm")),
+            [{"tid": r.id, "norm": normalize_phone(r.phone)} for r in rows]
+        )
+    op.create_index("ix_tenants_phone_normalized", "tenants", ["phone_normalized"])
+    op.create_index("ix_tenants_gov_id", "tenants", ["gov_id"])
+    if bind.dialect.name == "postgresql":
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        op.execute("CREATE INDEX ix_tenants_full_name_trgm ON tenants USING gin (lower(full_name) gin_trgm_ops)")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name == "postgresql":
+        op.execute("DROP INDEX IF EXISTS ix_tenants_full_name_trgm")
+    op.drop_index("ix_tenants_gov_id", table_name="tenants")
+    op.drop_index("ix_tenants_phone_normalized", table_name="tenants")
+    with op.batch_alter_table("tenants") as batch:
+        batch.drop_column("phone_normalized")
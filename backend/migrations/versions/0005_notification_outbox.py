@@ -0,0 +1,49 @@
+"""notification outbox: queue columns on notifications
+
+Notifications are now written as 'queued' with the payment and sent later by
+the dispatcher (notifications.py), so sent_at becomes nullable and the table
+gains attempt bookkeeping plus an index the dispatcher claims batches from.
+Existing rows keep their status; created_at is backfilled from sent_at.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0005"
+down_revision: Union[str, Sequence[str], None] = "0004"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table("notifications") as batch:
+        batch.add_column(sa.Column("attempts", sa.Integer(), nullable=False, server_default="0"))
+        batch.add_column(sa.Column("next_attempt_at", sa.TIMESTAMP()))
+        batch.add_column(sa.Column("last_error", sa.Text()))
+        batch.add_column(sa.Column("created_at", sa.TIMESTAMP()))
+        batch.alter_column("sent_at", existing_type=sa.TIMESTAMP(), nullable=True)
+    with op.batch_alter_table("notifications") as batch:
+        batch.alter_column("attempts", existing_type=sa.Integer(), server_default=None)
+    op.execute("UPDATE notifications SET created_at = sent_at")
+    op.create_index("ix_notifications_status_next_attempt", "notifications", ["status", "next_attempt_at"])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_notifications_status_next_attempt", table_name="notifications")
+    op.execute("UPDATE notifications SET sent_at = created_at WHERE sent_at IS NULL")
+    with op.batch_alter_table("notifications") as batch:
+        batch.alter_column("sent_at", existing_type=sa.TIMESTAMP(), nullable=False)
+        batch.drop_column("created_at")
+        batch.drop_column("last_error")
+        batch.drop_column("next_attempt_at")
+        batch.drop_column("attempts")
@@ -0,0 +1,46 @@
+"""maintained paid_total and balance on invoices
+
+Both columns are kept current by the payment write paths so read paths no
+longer sum payments per invoice. They are backfilled here with the same
+set-wise recompute that invoice_totals.py uses to verify them.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0006"
+down_revision: Union[str, Sequence[str], None] = "0005"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table("invoices") as batch:
+        batch.add_column(sa.Column("paid_total", sa.Integer(), nullable=False, server_default="0"))
+        batch.add_column(sa.Column("balance", sa.Integer(), nullable=False, server_default="0"))
+    with op.batch_alter_table("invoices") as batch:
+        batch.alter_column("paid_total", existing_type=sa.Integer(), server_default=None)
+        batch.alter_column("balance", existing_type=sa.Integer(), server_default=None)
+    op.execute("""
+        UPDATE invoices SET paid_total = COALESCE((
+            SELECT SUM(payments.amount) FROM payments
+            WHERE payments.invoice_id = invoices.id AND payments.status = 'confirmed'
+        ), 0)
+    """)
+    op.execute("UPDATE invoices SET balance = CASE WHEN amount_due > paid_total THEN amount_due - paid_total ELSE 0 END")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table("invoices") as batch:
+        batch.drop_column("balance")
+        batch.drop_column("paid_total")
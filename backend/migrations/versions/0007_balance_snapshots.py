@@ -0,0 +1,64 @@
+"""month-end balance snapshots per house and per tenant
+
+Written by the period close (period_close.py). Balance and arrears queries
+start from the latest snapshot and add only the invoices and payments since.
+The tables start empty; the first close fills them from the full history.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0007"
+down_revision: Union[str, Sequence[str], None] = "0006"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "house_balance_snapshots",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("period", sa.Date(), nullable=False),
+        sa.Column("house_id", sa.Integer(), nullable=False),
+        sa.Column("charged", sa.Integer(), nullable=False),
+        sa.Column("paid", sa.Integer(), nullable=False),
+        sa.Column("balance", sa.Integer(), nullable=False),
+        sa.Column("closed_at", sa.TIMESTAMP(), nullable=False),
+        sa.ForeignKeyConstraint(["house_id"], ["houses.id"]),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("house_id", "period", name="uq_house_balance_snapshots_house_period"),
+    )
+    op.create_index("ix_house_balance_snapshots_period", "house_balance_snapshots", ["period"])
+    op.create_table(
+        "tenant_balance_snapshots",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("period", sa.Date(), nullable=False),
+        sa.Column("house_id", sa.Integer(), nullable=False),
+        sa.Column("tenant_id", sa.Integer(), nullable=False),
+        sa.Column("charged", sa.Integer(), nullable=False),
+        sa.Column("paid", sa.Integer(), nullable=False),
+        sa.Column("balance", sa.Integer(), nullable=False),
+        sa.Column("closed_at", sa.TIMESTAMP(), nullable=False),
+        sa.ForeignKeyConstraint(["house_id"], ["houses.id"]),
+        sa.ForeignKeyConstraint(["tenant_id"], ["tenants.id"]),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("tenant_id", "house_id", "period", name="uq_tenant_balance_snapshots_tenant_house_period"),
+    )
+    op.create_index("ix_tenant_balance_snapshots_period", "tenant_balance_snapshots", ["period"])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_tenant_balance_snapshots_period", table_name="tenant_balance_snapshots")
+    op.drop_table("tenant_balance_snapshots")
+    op.drop_index("ix_house_balance_snapshots_period", table_name="house_balance_snapshots")
+    op.drop_table("house_balance_snapshots")
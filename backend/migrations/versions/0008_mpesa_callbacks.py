@@ -0,0 +1,56 @@
+"""staging table for M-Pesa C2B callbacks
+
+The callback endpoint only inserts here and acknowledges; the worker in
+mpesa.py allocates staged rows in batches. tx_ref is unique so a callback
+the provider retries is staged once. payments.tx_ref gets a (non-unique)
+index for the duplicate checks made before allocating.
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-18
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0008"
+down_revision: Union[str, Sequence[str], None] = "0007"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "mpesa_callbacks",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("tx_ref", sa.String(length=80), nullable=False),
+        sa.Column("msisdn", sa.String(length=20), nullable=False),
+        sa.Column("amount", sa.Integer(), nullable=False),
+        sa.Column("bill_ref", sa.String(length=80)),
+        sa.Column("trans_time", sa.TIMESTAMP(), nullable=False),
+        sa.Column("payload", sa.Text(), nullable=False),
+        sa.Column("status", sa.String(length=20), nullable=False),
+        sa.Column("house_id", sa.Integer()),
+        sa.Column("tenant_id", sa.Integer()),
+        sa.Column("last_error", sa.Text()),
+        sa.Column("received_at", sa.TIMESTAMP(), nullable=False),
+        sa.Column("processed_at", sa.TIMESTAMP()),
+        sa.ForeignKeyConstraint(["house_id"], ["houses.id"]),
+        sa.ForeignKeyConstraint(["tenant_id"], ["tenants.id"]),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("tx_ref", name="uq_mpesa_callbacks_tx_ref"),
+    )
+    op.create_index("ix_mpesa_callbacks_status_id", "mpesa_callbacks", ["status", "id"])
+    op.create_index("ix_payments_tx_ref", "payments", ["tx_ref"])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_payments_tx_ref", table_name="payments")
+    op.drop_index("ix_mpesa_callbacks_status_id", table_name="mpesa_callbacks")
+    op.drop_table("mpesa_callbacks")
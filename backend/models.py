@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, Date, ForeignKey, Text, TIMESTAMP
+from sqlalchemy import Column, Integer, String, Boolean, Date, ForeignKey, Text, TIMESTAMP, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from base import Base
 
@@ -15,9 +15,14 @@ class House(Base):
 
 class Tenant(Base):
     __tablename__ = "tenants"
+    __table_args__ = (
+        Index("ix_tenants_phone_normalized", "phone_normalized"),
+        Index("ix_tenants_gov_id", "gov_id"),
+    )
     id = Column(Integer, primary_key=True)
     full_name = Column(String(120), nullable=False)
     phone = Column(String(20), nullable=False)  # +2547xxxxxxx
+    phone_normalized = Column(String(20))  # 2547xxxxxxxx, see utils.normalize_phone
     gov_id = Column(String(40), nullable=False)  # government ID
     email = Column(String(120))
     is_active = Column(Boolean, default=True, nullable=False)
@@ -26,6 +31,9 @@ class Tenant(Base):
 
 class HouseTenant(Base):
     __tablename__ = "house_tenants"
+    __table_args__ = (
+        Index("ix_house_tenants_house_tenant_status", "house_id", "tenant_id", "status"),
+    )
     id = Column(Integer, primary_key=True)
     house_id = Column(Integer, ForeignKey("houses.id"), nullable=False)
     tenant_id = Column(Integer, ForeignKey("tenants.id"), nullable=False)
@@ -37,11 +45,16 @@ class HouseTenant(Base):
 
 class Invoice(Base):
     __tablename__ = "invoices"
+    __table_args__ = (
+        UniqueConstraint("house_id", "period_start", name="uq_invoices_house_period_start"),
+    )
     id = Column(Integer, primary_key=True)
     house_id = Column(Integer, ForeignKey("houses.id"), nullable=False)
     period_start = Column(Date, nullable=False)  # first day of month
     period_end = Column(Date, nullable=False)    # last day of month
     amount_due = Column(Integer, nullable=False)
+    paid_total = Column(Integer, nullable=False, default=0)  # confirmed payments allocated here
+    balance = Column(Integer, nullable=False, default=lambda ctx: ctx.get_current_parameters()["amount_due"])  # max(amount_due - paid_total, 0)
     due_date = Column(Date, nullable=False)
     status = Column(String(20), nullable=False)  # 'pending','partially_paid','paid','overdue'
     created_at = Column(TIMESTAMP, nullable=False)
@@ -50,6 +63,13 @@ class Invoice(Base):
 
 class Payment(Base):
     __tablename__ = "payments"
+    __table_args__ = (
+        Index("ix_payments_house_status", "house_id", "status"),
+        Index("ix_payments_paid_at_id", "paid_at", "id"),
+        Index("ix_payments_house_paid_at_id", "house_id", "paid_at", "id"),
+        Index("ix_payments_invoice_id", "invoice_id"),
+        Index("ix_payments_tx_ref", "tx_ref"),  # not unique: a payment split over months shares its ref
+    )
     id = Column(Integer, primary_key=True)
     invoice_id = Column(Integer, ForeignKey("invoices.id"))
     house_id = Column(Integer, ForeignKey("houses.id"), nullable=False)
@@ -69,11 +89,71 @@ class Payment(Base):
 
 class Notification(Base):
     __tablename__ = "notifications"
+    __table_args__ = (
+        Index("ix_notifications_status_next_attempt", "status", "next_attempt_at"),
+    )
     id = Column(Integer, primary_key=True)
     tenant_id = Column(Integer, ForeignKey("tenants.id"), nullable=False)
     type = Column(String(30), nullable=False)  # 'receipt','due','overdue','reminder'
     channel = Column(String(20), nullable=False)  # 'sms'
     message = Column(Text, nullable=False)
-    status = Column(String(20), nullable=False)  # 'sent','failed'
+    status = Column(String(20), nullable=False)  # 'queued','sending','sent','failed'
     ref_entity = Column(String(40))
-    sent_at = Column(TIMESTAMP, nullable=False)
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(TIMESTAMP)  # when queued: due time; when sending: lease expiry
+    last_error = Column(Text)
+    created_at = Column(TIMESTAMP)
+    sent_at = Column(TIMESTAMP)
+
+# Month-end closing balances written by period_close.py. charged and paid are running
+# totals up to the end of `period` (first day of the month); balance = charged - paid.
+class HouseBalanceSnapshot(Base):
+    __tablename__ = "house_balance_snapshots"
+    __table_args__ = (
+        UniqueConstraint("house_id", "period", name="uq_house_balance_snapshots_house_period"),
+        Index("ix_house_balance_snapshots_period", "period"),
+    )
+    id = Column(Integer, primary_key=True)
+    period = Column(Date, nullable=False)
+    house_id = Column(Integer, ForeignKey("houses.id"), nullable=False)
+    charged = Column(Integer, nullable=False)
+    paid = Column(Integer, nullable=False)
+    balance = Column(Integer, nullable=False)
+    closed_at = Column(TIMESTAMP, nullable=False)
+
+class TenantBalanceSnapshot(Base):
+    __tablename__ = "tenant_balance_snapshots"
+    __table_args__ = (
+        UniqueConstraint("tenant_id", "house_id", "period", name="uq_tenant_balance_snapshots_tenant_house_period"),
+        Index("ix_tenant_balance_snapshots_period", "period"),
+    )
+    id = Column(Integer, primary_key=True)
+    period = Column(Date, nullable=False)
+    house_id = Column(Integer, ForeignKey("houses.id"), nullable=False)
+    tenant_id = Column(Integer, ForeignKey("tenants.id"), nullable=False)
+    charged = Column(Integer, nullable=False)  # the house's invoices for months the tenant lived there
+    paid = Column(Integer, nullable=False)     # the tenant's own payments on the house
+    balance = Column(Integer, nullable=False)
+    closed_at = Column(TIMESTAMP, nullable=False)
+
+# M-Pesa C2B confirmations as received, before allocation (mpesa.py). tx_ref is the
+# provider's TransID; the unique constraint is what makes retried callbacks harmless.
+class MpesaCallback(Base):
+    __tablename__ = "mpesa_callbacks"
+    __table_args__ = (
+        UniqueConstraint("tx_ref", name="uq_mpesa_callbacks_tx_ref"),
+        Index("ix_mpesa_callbacks_status_id", "status", "id"),
+    )
+    id = Column(Integer, primary_key=True)
+    tx_ref = Column(String(80), nullable=False)
+    msisdn = Column(String(20), nullable=False)
+    amount = Column(Integer, nullable=False)
+    bill_ref = Column(String(80))  # account number the payer typed
+    trans_time = Column(TIMESTAMP, nullable=False)
+    payload = Column(Text, nullable=False)  # raw callback JSON
+    status = Column(String(20), nullable=False)  # 'staged','allocated','duplicate','unmatched','error','failed'
+    house_id = Column(Integer, ForeignKey("houses.id"))    # resolved, or pinned by an admin
+    tenant_id = Column(Integer, ForeignKey("tenants.id"))
+    last_error = Column(Text)
+    received_at = Column(TIMESTAMP, nullable=False)
+    processed_at = Column(TIMESTAMP)
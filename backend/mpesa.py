@@ -0,0 +1,376 @@
+import asyncio
+import hmac
+import json
+import logging
+import os
+import re
+import time
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from threading import Lock
+from sqlalchemy import func, update
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from base import SessionLocal, dialect_insert
+import cache
+from models import House, Tenant, HouseTenant, Invoice, Payment, MpesaCallback
+from services import lock_houses, allocate_batch, receipt_message, save_notification, publish_payments
+from utils import normalize_phone, now_ts
+
+logger = logging.getLogger("rentals.mpesa")
+
+# M-Pesa C2B confirmations (POST /mpesa/c2b/confirmation). The callback is validated,
+# inserted into mpesa_callbacks and acknowledged once committed; nothing else happens
+# on the request path, and concurrent callbacks share a commit (StagingQueue).
+# tx_ref (TransID) is unique there, so a retried callback is acknowledged again
+# without being staged twice.
+#
+# The worker (scheduler, or POST /admin/mpesa/process) claims staged rows in batches
+# (FOR UPDATE SKIP LOCKED), skips tx_refs already on a payment, resolves each payer's
+# house and tenant from the MSISDN through an in-process index of active tenants'
+# phones, and allocates the whole batch with allocate_batch() in one transaction, from
+# each house's oldest unpaid month. Payers the index cannot place (unknown number, or
+# one number on several houses with no matching account number) are left 'unmatched'
+# for an admin to pin to a house and tenant. If a batch fails, its callbacks are retried
+# one per transaction and the one that still fails is marked 'failed' with its error,
+# so it cannot hold up the rows behind it.
+
+TRANS_TIME = "%Y%m%d%H%M%S"
+
+class CallbackError(ValueError):
+    pass
+
+def env_int(name: str, default: int):
+    return int(os.getenv(name, str(default)))
+
+def check_token(token: str | None):
+    # The callback URL registered with the provider must carry ?token=<MPESA_CALLBACK_TOKEN>.
+    # Without a token configured every callback is refused, unless
+    # MPESA_ALLOW_UNAUTHENTICATED=1 (local development only: anyone could post payments)
+    expected = os.getenv("MPESA_CALLBACK_TOKEN") or ""
+    if not expected:
+        return os.getenv("MPESA_ALLOW_UNAUTHENTICATED", "0") == "1"
+    return hmac.compare_digest(expected, token or "")
+
+def parse_callback(body: bytes):
+    # Daraja C2B confirmation JSON -> MpesaCallback column values
+    try:
+        raw = json.loads(body)
+    except ValueError:
+        raise CallbackError("Body is not JSON")
+    if not isinstance(raw, dict):
+        raise CallbackError("Body is not a JSON object")
+    tx_ref = str(raw.get("TransID") or "").strip()
+    msisdn = str(raw.get("MSISDN") or "").strip()
+    if not tx_ref or len(tx_ref) > 80:
+        raise CallbackError("Missing or invalid TransID")
+    if not msisdn or len(msisdn) > 20:
+        raise CallbackError("Missing or invalid MSISDN")
+    try:
+        amount = Decimal(str(raw.get("TransAmount")))
+        trans_time = datetime.strptime(str(raw.get("TransTime")), TRANS_TIME)
+    except (InvalidOperation, ValueError):
+        raise CallbackError("Invalid TransAmount or TransTime")
+    if amount <= 0 or amount != amount.to_integral_value():
+        raise CallbackError("TransAmount must be a positive whole number of shillings")
+    bill_ref = str(raw.get("BillRefNumber") or "").strip()[:80] or None
+    return {
+        "tx_ref": tx_ref, "msisdn": msisdn, "amount": int(amount), "bill_ref": bill_ref,
+        "trans_time": trans_time, "payload": json.dumps(raw, separators=(",", ":")),
+    }
+
+def insert_staged(rows: list):
+    # One multi-row INSERT and one commit for a group of callbacks; tx_refs already
+    # staged (or repeated within the group) are skipped by the unique constraint
+    db = SessionLocal()
+    try:
+        ts = now_ts()
+        stmt = dialect_insert(db)(MpesaCallback).on_conflict_do_nothing(index_elements=["tx_ref"])
+        db.execute(stmt, [{**values, "status": "staged", "received_at": ts} for values in rows])
+        db.commit()
+    finally:
+        db.close()
+
+class StagingQueue:
+    # Group commit for the callback endpoint. Each request queues its row and waits;
+    # a single flusher per event loop writes everything queued so far in one
+    # transaction, then releases those requests. Under load, callbacks that arrive
+    # while a commit is in flight share the next one, so acknowledgements stay
+    # durable without costing a commit each; when idle, a row is written at once.
+    def __init__(self):
+        self.loop = None
+        self.queue = None
+        self.flusher = None  # the loop only keeps a weak reference to its tasks
+
+    async def stage(self, values: dict):
+        loop = asyncio.get_running_loop()
+        if self.loop is not loop:
+            self.loop, self.queue = loop, asyncio.Queue()
+            self.flusher = loop.create_task(self.flush_forever(self.queue))
+        done = loop.create_future()
+        await self.queue.put((values, done))
+        await done
+
+    async def flush_forever(self, queue: asyncio.Queue):
+        limit = env_int("MPESA_STAGE_BATCH", 500)
+        while True:
+            batch = [await queue.get()]
+            while len(batch) < limit and not queue.empty():
+                batch.append(queue.get_nowait())
+            try:
+                await run_in_threadpool(insert_staged, [values for values, _ in batch])
+            except Exception as e:
+                for _, done in batch:
+                    if not done.done():
+                        done.set_exception(e)
+            else:
+                for _, done in batch:
+                    if not done.done():
+                        done.set_result(None)
+
+staging = StagingQueue()
+
+class MsisdnIndex:
+    # normalized phone -> [(house_id, tenant_id, house_number, full_name)] over active
+    # assignments, so resolving a batch costs no query per callback. Payments do not
+    # change it, so it is not tied to the data version: the worker checks the resolved
+    # assignments are still active (one query per batch) and rebuilds the index when a
+    # batch has payers it cannot place or whose assignment has ended, at most every
+    # MPESA_INDEX_MIN_AGE_SECONDS, and in any case after MPESA_INDEX_MAX_AGE_SECONDS.
+    def __init__(self):
+        self.lock = Lock()
+        self.built_at = None
+        self.entries = {}
+
+    def refresh(self, db: Session, force: bool = False):
+        # Rebuilds if due; returns whether it did
+        with self.lock:
+            if self.built_at is not None:
+                age = time.monotonic() - self.built_at
+                if age < env_int("MPESA_INDEX_MAX_AGE_SECONDS", 300) and not (force and age >= env_int("MPESA_INDEX_MIN_AGE_SECONDS", 5)):
+                    return False
+        entries = {}
+        for house_id, tenant_id, number, name, phone in db.query(
+            HouseTenant.house_id, HouseTenant.tenant_id, House.number, Tenant.full_name, Tenant.phone_normalized
+        ).join(House, House.id == HouseTenant.house_id).join(Tenant, Tenant.id == HouseTenant.tenant_id).filter(
+            HouseTenant.status == "active", Tenant.is_active == True
+        ).order_by(HouseTenant.id.asc()).all():
+            if phone:
+                entries.setdefault(phone, []).append((house_id, tenant_id, number, name))
+        with self.lock:
+            self.entries, self.built_at = entries, time.monotonic()
+        return True
+
+    def resolve(self, msisdn: str, bill_ref: str | None):
+        # (house_id, tenant_id, house_number, full_name), or an error string
+        with self.lock:
+            candidates = self.entries.get(normalize_phone(msisdn), [])
+        if not candidates:
+            return "No active tenant with this phone number"
+        if len(candidates) == 1:
+            return candidates[0]
+        account = re.sub(r"\D", "", bill_ref or "")
+        matching = [c for c in candidates if account and str(c[2]) == account]
+        if len(matching) == 1:
+            return matching[0]
+        return "Phone number is on several houses; account number does not pick one"
+
+msisdn_index = MsisdnIndex()
+
+def claim_batch(db: Session, size: int, ids: list | None = None):
+    # Staged rows (of ids, if given), oldest first; locked until the caller's transaction
+    # ends. Does not commit.
+    if db.get_bind().dialect.name == "sqlite":
+        # No row locks on SQLite: take the database write lock before reading
+        db.execute(update(MpesaCallback).where(MpesaCallback.id == -1).values(status=MpesaCallback.status))
+    q = db.query(MpesaCallback).filter(MpesaCallback.status == "staged")
+    if ids is not None:
+        q = q.filter(MpesaCallback.id.in_(ids))
+    return q.order_by(MpesaCallback.id.asc()).limit(size).with_for_update(skip_locked=True).all()
+
+def resolve_batch(db: Session, rows: list):
+    # {callback id: (house_id, tenant_id, house_number, full_name) or error string}
+    def resolve_all():
+        out = {}
+        for r in rows:
+            if r.house_id is not None and r.tenant_id is not None:
+                out[r.id] = (r.house_id, r.tenant_id)  # pinned by an admin
+            else:
+                out[r.id] = msisdn_index.resolve(r.msisdn, r.bill_ref)
+        return out
+
+    def active(resolved):
+        pairs = {v[:2] for v in resolved.values() if isinstance(v, tuple)}
+        if not pairs:
+            return set()
+        return {tuple(r) for r in db.query(HouseTenant.house_id, HouseTenant.tenant_id).filter(
+            HouseTenant.status == "active", HouseTenant.tenant_id.in_({t for _, t in pairs})
+        ).all()}
+
+    msisdn_index.refresh(db)
+    resolved = resolve_all()
+    current = active(resolved)
+    stale = [k for k, v in resolved.items() if not isinstance(v, tuple) or v[:2] not in current]
+    if stale and msisdn_index.refresh(db, force=True):
+        resolved = resolve_all()
+        current = active(resolved)
+    for k, v in resolved.items():
+        if isinstance(v, tuple) and v[:2] not in current:
+            resolved[k] = "Tenant is not assigned to this house"
+    return resolved
+
+def oldest_unpaid_months(db: Session, house_ids):
+    # {house_id: first day of its oldest invoice with a balance}
+    return dict(db.query(Invoice.house_id, func.min(Invoice.period_start)).filter(
+        Invoice.house_id.in_(house_ids), Invoice.balance > 0
+    ).group_by(Invoice.house_id).all())
+
+def process_batch(db: Session, size: int):
+    # Claims, resolves and allocates one batch in one transaction. Returns counts by
+    # outcome (empty when nothing was staged). Commits.
+    rows = claim_batch(db, size)
+    if not rows:
+        db.commit()
+        return {}
+    ts = now_ts()
+    ids = [r.id for r in rows]
+    try:
+        items, allocations, outcome = allocate_claimed(db, rows, ts)
+        db.commit()
+    except Exception:
+        db.rollback()
+        logger.exception("M-Pesa batch of %d callbacks failed; retrying them one at a time", len(ids))
+        items, allocations, outcome = allocate_one_by_one(db, ids, ts)
+    counts = {}
+    for status, *_ in outcome.values():
+        counts[status] = counts.get(status, 0) + 1
+    if counts.get("allocated"):
+        cache.bump()
+        publish_payments(items, allocations, ts)
+    return counts
+
+def allocate_one_by_one(db: Session, ids: list, ts):
+    # After a failed batch: each callback in its own transaction, so the one that fails
+    # is marked 'failed' with its error instead of being claimed again on every run
+    items, allocations, outcome = [], [], {}
+    for cid in ids:
+        try:
+            rows = claim_batch(db, 1, [cid])
+            if rows:
+                row_items, row_allocations, row_outcome = allocate_claimed(db, rows, ts)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.exception("M-Pesa callback %d failed", cid)
+            error = f"{type(e).__name__}: {e}"[:1000]
+            db.execute(update(MpesaCallback).where(MpesaCallback.id == cid, MpesaCallback.status == "staged").values(
+                status="failed", last_error=error, processed_at=ts
+            ))
+            db.commit()
+            outcome[cid] = ("failed", error, None, None)
+            continue
+        if rows:
+            items += row_items
+            allocations += row_allocations
+            outcome.update(row_outcome)
+    return items, allocations, outcome
+
+def allocate_claimed(db: Session, rows: list, ts):
+    # Resolves and allocates claimed rows and records each one's outcome, in the
+    # caller's transaction. Returns (payment items, their allocations, outcomes by
+    # callback id). Does not commit.
+    items, allocations = [], []
+    outcome = {}  # callback id -> (status, error, house_id, tenant_id)
+    seen = {r[0] for r in db.query(Payment.tx_ref).filter(Payment.tx_ref.in_([r.tx_ref for r in rows])).distinct().all()}
+    pending = []
+    for r in rows:
+        if r.tx_ref in seen:
+            outcome[r.id] = ("duplicate", "tx_ref already on a payment", r.house_id, r.tenant_id)
+        else:
+            pending.append(r)
+
+    resolved = resolve_batch(db, pending) if pending else {}
+    todo = []
+    for r in pending:
+        target = resolved[r.id]
+        if isinstance(target, str):
+            outcome[r.id] = ("unmatched", target, r.house_id, r.tenant_id)
+        else:
+            todo.append((r, target))
+
+    if todo:
+        houses = lock_houses(db, [t[0] for _, t in todo])
+        starts = oldest_unpaid_months(db, list(houses))
+        placed = []
+        for r, target in todo:
+            house_id, tenant_id = target[:2]
+            house = houses.get(house_id)
+            if house is None or house.monthly_rent <= 0:
+                outcome[r.id] = ("error", "House has no rent to allocate against", house_id, tenant_id)
+                continue
+            start = starts.get(house_id) or date(r.trans_time.year, r.trans_time.month, 1)
+            items.append({
+                "house_id": house_id, "tenant_id": tenant_id, "method": "mpesa", "amount": r.amount,
+                "start_year": start.year, "start_month": start.month, "tx_ref": r.tx_ref, "msisdn": r.msisdn,
+                "paid_at": r.trans_time
+            })
+            placed.append((r, house_id, tenant_id, target[3] if len(target) > 2 else None))
+        if items:
+            allocations = allocate_batch(db, items, houses, ts)
+            pinned = [tenant_id for _, _, tenant_id, name in placed if name is None]
+            names = dict(db.query(Tenant.id, Tenant.full_name).filter(Tenant.id.in_(pinned)).all()) if pinned else {}
+            for (r, house_id, tenant_id, name), allocs in zip(placed, allocations):
+                msg = receipt_message(houses[house_id].number, name if name is not None else names.get(tenant_id, ""), allocs, r.tx_ref, r.trans_time)
+                save_notification(db, tenant_id, msg, "receipt", f"house:{house_id}")
+                outcome[r.id] = ("allocated", None, house_id, tenant_id)
+
+    db.execute(update(MpesaCallback), [{
+        "id": cid, "status": status, "last_error": error, "house_id": house_id, "tenant_id": tenant_id, "processed_at": ts
+    } for cid, (status, error, house_id, tenant_id) in outcome.items()])
+    return items, allocations, outcome
+
+def process_staged(batch_size: int | None = None, max_batches: int = 100):
+    # Allocates everything staged, one batch at a time. Returns totals by outcome.
+    batch_size = batch_size or env_int("MPESA_BATCH_SIZE", 200)
+    totals = {"claimed": 0, "allocated": 0, "duplicate": 0, "unmatched": 0, "error": 0, "failed": 0}
+    for _ in range(max_batches):
+        db = SessionLocal()
+        try:
+            counts = process_batch(db, batch_size)
+        finally:
+            db.close()
+        claimed = sum(counts.values())
+        totals["claimed"] += claimed
+        for k, v in counts.items():
+            totals[k] += v
+        if claimed < batch_size:
+            break
+    return totals
+
+def run_worker():
+    totals = process_staged()
+    if totals["claimed"]:
+        logger.info("Processed M-Pesa callbacks: %s", totals)
+
+def pin_callback(db: Session, callback_id: int, house_id: int, tenant_id: int):
+    # Admin fix for an unmatched (or errored, or failed) callback: allocate it to this
+    # house and tenant on the next worker run. Returns None if there is no such callback.
+    # Does not commit.
+    cb = db.query(MpesaCallback).get(callback_id)
+    if cb is None:
+        return None
+    if cb.status not in ("unmatched", "error", "failed"):
+        raise ValueError(f"Callback is {cb.status}")
+    if not db.query(HouseTenant.id).filter(HouseTenant.house_id == house_id, HouseTenant.tenant_id == tenant_id, HouseTenant.status == "active").first():
+        raise ValueError("Tenant is not assigned to this house")
+    cb.house_id, cb.tenant_id, cb.status, cb.last_error = house_id, tenant_id, "staged", None
+    return cb
+
+def callback_record(cb: MpesaCallback):
+    return {
+        "id": cb.id, "tx_ref": cb.tx_ref, "msisdn": cb.msisdn, "amount": cb.amount, "bill_ref": cb.bill_ref,
+        "trans_time": cb.trans_time.strftime("%Y-%m-%d %H:%M:%S"), "status": cb.status,
+        "house_id": cb.house_id, "tenant_id": cb.tenant_id, "last_error": cb.last_error,
+        "received_at": cb.received_at.strftime("%Y-%m-%d %H:%M:%S"),
+        "processed_at": cb.processed_at.strftime("%Y-%m-%d %H:%M:%S") if cb.processed_at else None,
+    }
@@ -0,0 +1,167 @@
+"""Replay M-Pesa C2B callbacks: acknowledgement latency, then allocation throughput.
+
+A fake provider builds Daraja-shaped confirmations for the estate's tenants (by
+their phone numbers), with a share of retried deliveries (same TransID again)
+and of payers no tenant matches, and posts them to /mpesa/c2b/confirmation with
+--concurrency requests in flight: in process (httpx over ASGI) against a
+generated estate, or to a running API with --url. The staged callbacks are then
+drained by the worker and, in process, every TransID is checked to have become
+payments exactly once.
+
+    python mpesa_replay.py --callbacks 5000 --houses 500
+    python mpesa_replay.py --callbacks 50000 --direct
+    python mpesa_replay.py --url http://127.0.0.1:8000 --callbacks 20000 --concurrency 64
+
+--direct skips HTTP and calls the endpoint's parse and staging functions, which
+measures the staging path alone (in process, client and server share one
+interpreter, so the HTTP stack dominates otherwise). In process the database is
+a temporary SQLite file (or --db-url, which is wiped).
+With --url the payments land in that API's database; never point it at real data.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+from datetime import datetime
+
+parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+parser.add_argument("--url", help="base URL of a running API (default: in process)")
+parser.add_argument("--db-url", help="in process: database to generate the estate in (wiped)")
+parser.add_argument("--houses", type=int, default=500)
+parser.add_argument("--callbacks", type=int, default=5000, help="distinct transactions to send")
+parser.add_argument("--retries", type=float, default=0.1, help="share of transactions delivered twice")
+parser.add_argument("--unknown", type=float, default=0.02, help="share from numbers no tenant has")
+parser.add_argument("--concurrency", type=int, default=32, help="requests in flight")
+parser.add_argument("--direct", action="store_true", help="in process: stage without going through HTTP")
+parser.add_argument("--seed", type=int, default=42)
+parser.add_argument("--token", default=os.getenv("MPESA_CALLBACK_TOKEN") or None)
+args = parser.parse_args()
+
+if args.url and args.direct:
+    parser.error("--direct runs in process; drop --url")
+if not args.url:
+    os.environ["DATABASE_URL"] = args.db_url or f"sqlite:///{tempfile.mkdtemp()}/mpesa_replay.db"
+    os.environ["SCHEDULER_ENABLED"] = "0"
+    os.environ["DB_ASYNC"] = "0"
+    if not args.token:
+        os.environ["MPESA_ALLOW_UNAUTHENTICATED"] = "1"
+
+class FakeC2B:
+    # Builds confirmations the way Daraja sends them
+    def __init__(self, rng: random.Random, payers: list):
+        self.rng = rng
+        self.payers = payers  # [(msisdn, house_number)]
+        self.n = 0
+
+    def confirmation(self, unknown: bool = False):
+        self.n += 1
+        if unknown:
+            msisdn, account = f"2547{self.rng.randint(90000000, 99999999)}", "0"
+        else:
+            phone, number = self.rng.choice(self.payers)
+            msisdn, account = phone.lstrip("+"), str(number)
+        return {
+            "TransactionType": "Pay Bill", "TransID": f"RPL{self.n:09d}",
+            "TransTime": datetime.now().strftime("%Y%m%d%H%M%S"),
+            "TransAmount": str(self.rng.choice((1000, 2500, 3500, 4000, 7000))),
+            "BusinessShortCode": "600000", "BillRefNumber": account, "InvoiceNumber": "",
+            "OrgAccountBalance": "", "ThirdPartyTransID": "", "MSISDN": msisdn,
+            "FirstName": "Replay", "MiddleName": "", "LastName": "Payer",
+        }
+
+def deliveries(fake: FakeC2B, rng: random.Random):
+    # Every transaction once, a share of them again later (a provider retry)
+    out = [fake.confirmation(unknown=rng.random() < args.unknown) for _ in range(args.callbacks)]
+    out += [rng.choice(out[:i + 1]) for i in range(len(out)) if rng.random() < args.retries]
+    rng.shuffle(out)
+    return out
+
+def percentile(sorted_values: list, p: float):
+    return sorted_values[min(len(sorted_values) - 1, int(p * len(sorted_values)))]
+
+async def send_all(client, events: list):
+    path = "/mpesa/c2b/confirmation" + (f"?token={args.token}" if args.token else "")
+    limit = asyncio.Semaphore(args.concurrency)
+    if args.direct:
+        import mpesa
+
+    async def one(event):
+        async with limit:
+            t0 = time.perf_counter()
+            if args.direct:
+                await mpesa.staging.stage(mpesa.parse_callback(json.dumps(event).encode()))
+                status = 200
+            else:
+                status = (await client.post(path, json=event)).status_code
+            return (time.perf_counter() - t0) * 1000, status
+
+    t0 = time.perf_counter()
+    results = await asyncio.gather(*(one(e) for e in events))
+    elapsed = time.perf_counter() - t0
+    latencies = sorted(ms for ms, _ in results)
+    failed = sum(1 for _, status in results if status != 200)
+    return {
+        "sent": len(events), "failed": failed, "concurrency": args.concurrency, "direct": args.direct,
+        "per_second": round(len(events) / elapsed),
+        "ack_p50_ms": round(percentile(latencies, 0.50), 3), "ack_p95_ms": round(percentile(latencies, 0.95), 3),
+        "ack_p99_ms": round(percentile(latencies, 0.99), 3),
+    }
+
+def verify(events: list):
+    # Each TransID staged once; each allocated one turned into payments summing to its amount
+    from sqlalchemy import func
+    from base import SessionLocal
+    from models import Payment, MpesaCallback
+    db = SessionLocal()
+    try:
+        sent = {e["TransID"]: int(e["TransAmount"]) for e in events}
+        staged = db.query(func.count(MpesaCallback.id)).scalar()
+        by_status = dict(db.query(MpesaCallback.status, func.count()).group_by(MpesaCallback.status).all())
+        paid = dict(db.query(Payment.tx_ref, func.sum(Payment.amount)).filter(Payment.tx_ref.like("RPL%")).group_by(Payment.tx_ref).all())
+        wrong = [ref for ref, amount in paid.items() if amount != sent.get(ref)]
+        return {"distinct_sent": len(sent), "staged": staged, "by_status": by_status, "paid_refs": len(paid), "wrong_totals": len(wrong)}
+    finally:
+        db.close()
+
+async def replay():
+    import httpx
+    rng = random.Random(args.seed)
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=30)
+    else:
+        from base import Base, get_engine
+        import main
+        import seed
+        Base.metadata.drop_all(get_engine())
+        Base.metadata.create_all(get_engine())
+        seed.generate(args.houses, 1, 1, seed=args.seed)
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://replay", timeout=30)
+    async with client:
+        payers = [(t["phone"], t["house_number"]) for t in (await client.get("/tenants")).json() if t["status"] == "active"]
+        events = deliveries(FakeC2B(rng, payers), rng)
+        results = {"ack": await send_all(client, events)}
+        print(json.dumps(results["ack"]))
+
+        t0 = time.perf_counter()
+        totals = {}
+        while True:
+            batch = (await client.post("/admin/mpesa/process")).json()
+            for k, v in batch.items():
+                totals[k] = totals.get(k, 0) + v
+            if not batch["claimed"]:
+                break
+        elapsed = time.perf_counter() - t0
+    results["worker"] = {**totals, "seconds": round(elapsed, 2), "per_second": round(totals.get("claimed", 0) / elapsed) if elapsed else None}
+    print(json.dumps(results["worker"]))
+    if not args.url:
+        results["verify"] = verify(events)
+        print(json.dumps(results["verify"]))
+
+def run():
+    asyncio.run(replay())
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,193 @@
+import asyncio
+import importlib
+from abc import ABC, abstractmethod
+import logging
+import os
+import random
+from datetime import timedelta
+from threading import Lock, Thread
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+from base import SessionLocal
+from models import Tenant, Notification
+from utils import now_ts
+
+logger = logging.getLogger("rentals.notifications")
+
+# Notification outbox. save_notification() only adds a 'queued' row to the caller's
+# transaction, so a payment and its receipt commit (or roll back) together and the
+# request never waits on the SMS provider. The dispatcher below runs from the
+# scheduler: it claims a batch of due rows (FOR UPDATE SKIP LOCKED, so several
+# workers can dispatch side by side), marks them 'sending' with a lease, sends them
+# concurrently through the configured provider and writes all outcomes back in one
+# bulk UPDATE. Failed sends are retried with exponential backoff up to
+# SMS_MAX_ATTEMPTS; a row left 'sending' by a crashed worker is reclaimed once its
+# lease expires, so the lease must outlast a provider call. Every batch is sent on one
+# event loop that lives as long as the process (SendLoop), so a provider may keep an
+# async client, and its connections, across batches.
+
+def env_int(name: str, default: int):
+    return int(os.getenv(name, str(default)))
+
+class SendError(Exception):
+    def __init__(self, detail: str, retryable: bool = True):
+        super().__init__(detail)
+        self.retryable = retryable
+
+class SmsProvider(ABC):
+    # Implementations raise SendError; any other exception counts as retryable
+    @abstractmethod
+    async def send(self, phone: str, message: str):
+        ...
+
+class LogProvider(SmsProvider):
+    # Default: writes the message to the log instead of sending it
+    async def send(self, phone: str, message: str):
+        logger.info("SMS to %s: %s", phone, message)
+
+class FakeProvider(SmsProvider):
+    # Local stand-in for tests and load runs: records what was sent, with optional
+    # latency (SMS_FAKE_LATENCY_MS) and random failures (SMS_FAKE_FAILURE_RATE)
+    def __init__(self, latency: float | None = None, failure_rate: float | None = None):
+        self.latency = latency if latency is not None else env_int("SMS_FAKE_LATENCY_MS", 0) / 1000
+        self.failure_rate = failure_rate if failure_rate is not None else float(os.getenv("SMS_FAKE_FAILURE_RATE", "0"))
+        self.sent = []
+
+    async def send(self, phone: str, message: str):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if random.random() < self.failure_rate:
+            raise SendError("fake provider failure")
+        self.sent.append((phone, message))
+
+def load_provider(name: str):
+    # 'log', 'fake', or 'package.module:ClassName' for a real integration
+    if name == "log":
+        return LogProvider()
+    if name == "fake":
+        return FakeProvider()
+    module, _, attr = name.partition(":")
+    return getattr(importlib.import_module(module), attr)()
+
+_provider = None
+_provider_lock = Lock()
+
+def get_provider():
+    global _provider
+    with _provider_lock:
+        if _provider is None:
+            _provider = load_provider(os.getenv("SMS_PROVIDER", "log"))
+        return _provider
+
+def set_provider(provider: SmsProvider):
+    global _provider
+    with _provider_lock:
+        _provider = provider
+
+class SendLoop:
+    # The dispatcher's event loop, on a daemon thread, started on first use. Callers
+    # (the scheduler's thread, the admin endpoint's threadpool worker) block on the result.
+    def __init__(self):
+        self.lock = Lock()
+        self.loop = None
+
+    def run(self, coro):
+        with self.lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                Thread(target=self.loop.run_forever, name="sms-send", daemon=True).start()
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+send_loop = SendLoop()
+
+def retry_delay(attempts: int):
+    base = env_int("SMS_RETRY_BASE_SECONDS", 30)
+    return timedelta(seconds=min(base * 2 ** (attempts - 1), 3600) * random.uniform(0.8, 1.2))
+
+def claim_batch(db: Session, size: int, now):
+    # Due rows: queued ones whose retry time has come, and 'sending' ones whose lease ran out.
+    # Does not commit.
+    if db.get_bind().dialect.name == "sqlite":
+        # No row locks on SQLite: take the database write lock before reading
+        db.execute(update(Notification).where(Notification.id == -1).values(status=Notification.status))
+    rows = db.query(Notification.id, Notification.attempts, Notification.message, Tenant.phone).join(
+        Tenant, Tenant.id == Notification.tenant_id
+    ).filter(
+        Notification.status.in_(("queued", "sending")),
+        Notification.next_attempt_at <= now
+    ).order_by(Notification.next_attempt_at.asc(), Notification.id.asc()).limit(size).with_for_update(
+        skip_locked=True, of=Notification
+    ).all()
+    if rows:
+        db.execute(update(Notification).where(Notification.id.in_([r.id for r in rows])).values(
+            status="sending", next_attempt_at=now + timedelta(seconds=env_int("SMS_LEASE_SECONDS", 300))
+        ).execution_options(synchronize_session=False))
+    return rows
+
+async def send_batch(provider: SmsProvider, rows: list, concurrency: int):
+    # [(row, error_or_None, retryable)] in row order
+    limit = asyncio.Semaphore(concurrency)
+
+    async def send_one(row):
+        async with limit:
+            try:
+                await provider.send(row.phone, row.message)
+                return row, None, False
+            except SendError as e:
+                return row, str(e), e.retryable
+            except Exception as e:
+                return row, f"{type(e).__name__}: {e}", True
+
+    return await asyncio.gather(*(send_one(r) for r in rows))
+
+def record_results(db: Session, results: list, now):
+    # One bulk UPDATE by primary key for the whole batch. Returns counts by outcome.
+    max_attempts = env_int("SMS_MAX_ATTEMPTS", 5)
+    counts = {"sent": 0, "retrying": 0, "failed": 0}
+    values = []
+    for row, error, retryable in results:
+        attempts = row.attempts + 1
+        if error is None:
+            status, next_at, sent_at = "sent", None, now
+        elif retryable and attempts < max_attempts:
+            status, next_at, sent_at = "queued", now + retry_delay(attempts), None
+        else:
+            status, next_at, sent_at = "failed", None, None
+        counts["retrying" if status == "queued" else status] += 1
+        values.append({
+            "id": row.id, "status": status, "attempts": attempts, "next_attempt_at": next_at,
+            "last_error": error, "sent_at": sent_at
+        })
+    if values:
+        db.execute(update(Notification), values)
+    return counts
+
+def dispatch_pending(provider: SmsProvider | None = None, batch_size: int | None = None, max_batches: int = 100):
+    # Sends everything due, one claimed batch at a time. Returns totals by outcome.
+    provider = provider or get_provider()
+    batch_size = batch_size or env_int("SMS_BATCH_SIZE", 100)
+    concurrency = env_int("SMS_CONCURRENCY", 10)
+    totals = {"claimed": 0, "sent": 0, "retrying": 0, "failed": 0}
+    for _ in range(max_batches):
+        db = SessionLocal()
+        try:
+            rows = claim_batch(db, batch_size, now_ts())
+            db.commit()
+            if not rows:
+                break
+            results = send_loop.run(send_batch(provider, rows, concurrency))
+            counts = record_results(db, results, now_ts())
+            db.commit()
+        finally:
+            db.close()
+        totals["claimed"] += len(rows)
+        for k, v in counts.items():
+            totals[k] += v
+        if len(rows) < batch_size:
+            break
+    return totals
+
+def run_dispatcher():
+    totals = dispatch_pending()
+    if totals["claimed"]:
+        logger.info("Dispatched notifications: %s", totals)
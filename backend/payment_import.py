@@ -0,0 +1,206 @@
+import csv
+import io
+import json
+import logging
+import tempfile
+from itertools import islice
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+from starlette.concurrency import run_in_threadpool
+from base import SessionLocal
+import cache
+from models import House, Tenant, HouseTenant, Payment
+from services import lock_houses, allocate_batch, receipt_message, save_notification, publish_payments
+from utils import now_ts, today_date
+
+logger = logging.getLogger("rentals.payment_import")
+
+# Bulk payment import (POST /payments/bulk): the upload is spooled to a temp file, then
+# read back row by row and processed in fixed-size batches, one transaction per batch,
+# so memory depends on the batch size rather than on the statement length. Results stream back as NDJSON,
+# one line per input row followed by a summary line.
+
+SPOOL_MAX_BYTES = 8 * 1024 * 1024
+
+REQUIRED = ("house_id", "tenant_id", "method", "amount", "target_year", "target_month")
+FIRST_YEAR = 2000       # earliest target year and paid_at accepted
+YEARS_AHEAD = 5         # latest target year, relative to this year
+
+def load_context(notify: bool):
+    # Everything row validation needs, loaded once per import
+    db = SessionLocal()
+    try:
+        ctx = {
+            "houses": {h.id: h.monthly_rent for h in db.query(House.id, House.monthly_rent).all()},
+            "assignments": set(db.query(HouseTenant.house_id, HouseTenant.tenant_id).filter(HouseTenant.status == "active").all()),
+            "tenant_names": {},
+            "house_numbers": {},
+        }
+        if notify:
+            ctx["tenant_names"] = dict(db.query(Tenant.id, Tenant.full_name).all())
+            ctx["house_numbers"] = dict(db.query(House.id, House.number).all())
+        return ctx
+    finally:
+        db.close()
+
+def parse_record(raw: dict, ctx: dict):
+    missing = [k for k in REQUIRED if raw.get(k) in (None, "")]
+    if missing:
+        raise ValueError(f"Missing fields: {', '.join(missing)}")
+    try:
+        item = {
+            "house_id": int(raw["house_id"]),
+            "tenant_id": int(raw["tenant_id"]),
+            "method": str(raw["method"]).strip().lower(),
+            "amount": int(raw["amount"]),
+            "start_year": int(raw["target_year"]),
+            "start_month": int(raw["target_month"]),
+            "tx_ref": (str(raw["tx_ref"]).strip() or None) if raw.get("tx_ref") not in (None, "") else None,
+            "msisdn": str(raw["msisdn"]).strip() if raw.get("msisdn") not in (None, "") else None,
+            "paid_at": datetime.fromisoformat(str(raw["paid_at"])) if raw.get("paid_at") not in (None, "") else None,
+        }
+    except (TypeError, ValueError):
+        raise ValueError("Malformed field value")
+    if item["method"] not in ("cash", "mpesa"):
+        raise ValueError("Invalid method")
+    if item["amount"] <= 0:
+        raise ValueError("Amount must be positive")
+    if not 1 <= item["start_month"] <= 12:
+        raise ValueError("Invalid target month")
+    if not FIRST_YEAR <= item["start_year"] <= today_date().year + YEARS_AHEAD:
+        raise ValueError("Invalid target year")
+    paid_at = item["paid_at"]
+    if paid_at is not None:
+        if paid_at.tzinfo is not None:
+            # stored as local time, like now_ts()
+            paid_at = item["paid_at"] = paid_at.astimezone().replace(tzinfo=None)
+        if not datetime(FIRST_YEAR, 1, 1) <= paid_at <= now_ts() + timedelta(days=1):
+            raise ValueError("paid_at is out of range")
+    rent = ctx["houses"].get(item["house_id"])
+    if rent is None:
+        raise ValueError("House not found")
+    if (item["house_id"], item["tenant_id"]) not in ctx["assignments"]:
+        raise ValueError("Tenant is not assigned to this house")
+    if rent <= 0:
+        raise ValueError("House has no rent to allocate against")
+    return item
+
+def import_batch(rows: list, ctx: dict, notify: bool, attempts: int = 3):
+    # rows: [(row_number, raw_dict_or_parse_error)]. Returns one result dict per row.
+    results, valid = {}, []
+    for n, raw in rows:
+        if isinstance(raw, str):
+            results[n] = {"row": n, "status": "error", "detail": raw}
+            continue
+        try:
+            valid.append((n, parse_record(raw, ctx)))
+        except ValueError as e:
+            results[n] = {"row": n, "status": "error", "detail": str(e)}
+
+    # Any failure fails the batch's valid rows, with the reason, and the import goes on
+    # with the next batch; conflicts (a concurrent import of the same tx_ref) are retried
+    done, error = None, None
+    db = SessionLocal()
+    try:
+        for attempt in range(attempts):
+            try:
+                ts = now_ts()
+                done = allocate_valid(db, valid, ctx, notify, ts)
+                db.commit()
+                break
+            except IntegrityError as e:
+                db.rollback()
+                error = e.orig
+            except Exception as e:
+                db.rollback()
+                logger.exception("Payment import batch failed")
+                error = e
+                break
+    finally:
+        db.close()
+    if done is None:
+        for n, item in valid:
+            results[n] = {"row": n, "status": "error", "tx_ref": item["tx_ref"], "detail": f"Batch failed: {error}"}
+        return [results[n] for n, _ in rows]
+    cache.bump()
+    results.update(done)
+    imported = [(item, done[n]["allocations"]) for n, item in valid if done[n]["status"] == "imported"]
+    if imported:
+        publish_payments([item for item, _ in imported], [allocs for _, allocs in imported], ts)
+    return [results[n] for n, _ in rows]
+
+def allocate_valid(db, valid: list, ctx: dict, notify: bool, ts):
+    results = {}
+    refs = {item["tx_ref"] for _, item in valid if item["tx_ref"]}
+    seen = set()
+    if refs:
+        seen = {r[0] for r in db.query(Payment.tx_ref).filter(Payment.tx_ref.in_(refs)).distinct().all()}
+    todo = []
+    for n, item in valid:
+        if item["tx_ref"] and item["tx_ref"] in seen:
+            results[n] = {"row": n, "status": "skipped", "tx_ref": item["tx_ref"], "detail": "tx_ref already imported"}
+            continue
+        if item["tx_ref"]:
+            seen.add(item["tx_ref"])
+        todo.append((n, item))
+    if not todo:
+        return results
+
+    houses = lock_houses(db, [item["house_id"] for _, item in todo])
+    allocations = allocate_batch(db, [item for _, item in todo], houses, ts)
+    for (n, item), allocs in zip(todo, allocations):
+        results[n] = {"row": n, "status": "imported", "tx_ref": item["tx_ref"], "allocations": allocs}
+        if notify:
+            msg = receipt_message(ctx["house_numbers"][item["house_id"]], ctx["tenant_names"].get(item["tenant_id"], ""), allocs, item["tx_ref"], item["paid_at"] or ts)
+            save_notification(db, item["tenant_id"], msg, "receipt", f"house:{item['house_id']}")
+    return results
+
+async def spool_upload(stream):
+    # Copies the request body to a spooled temp file (in memory up to SPOOL_MAX_BYTES,
+    # then on disk). The body has to be fully received before the streamed response
+    # starts: StreamingResponse listens for client disconnects on the same channel.
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+    async for chunk in stream:
+        spool.write(chunk)
+    spool.seek(0)
+    return spool
+
+def iter_records(spool, fmt: str):
+    # Yields (row_number, raw_dict_or_error_string); row numbers count data rows from 1
+    text = io.TextIOWrapper(spool, encoding="utf-8-sig", newline="")
+    if fmt == "csv":
+        reader = csv.DictReader(text)
+        reader.fieldnames = [h.strip() for h in reader.fieldnames or []]
+        for n, raw in enumerate(reader, start=1):
+            yield n, ("Unparseable row" if None in raw else raw)
+        return
+    n = 0
+    for line in text:
+        if not line.strip():
+            continue
+        n += 1
+        try:
+            raw = json.loads(line)
+        except ValueError:
+            raw = None
+        yield n, (raw if isinstance(raw, dict) else "Unparseable row")
+
+def take(records, size: int):
+    return list(islice(records, size))
+
+async def stream_import(spool, fmt: str, batch_size: int, notify: bool):
+    counts = {"imported": 0, "skipped": 0, "error": 0}
+    try:
+        ctx = await run_in_threadpool(load_context, notify)
+        records = iter_records(spool, fmt)
+        while True:
+            batch = await run_in_threadpool(take, records, batch_size)
+            if not batch:
+                break
+            results = await run_in_threadpool(import_batch, batch, ctx, notify)
+            for r in results:
+                counts[r["status"]] += 1
+            yield "".join(json.dumps(r) + "\n" for r in results)
+    finally:
+        spool.close()
+    yield json.dumps({"summary": counts}) + "\n"
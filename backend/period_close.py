@@ -0,0 +1,326 @@
+from datetime import date, datetime, time, timedelta
+from sqlalchemy import func, extract, and_, or_, select, delete, insert
+from sqlalchemy.orm import Session
+from models import House, Tenant, HouseTenant, Invoice, Payment, HouseBalanceSnapshot, TenantBalanceSnapshot
+from utils import make_month, shift_month, now_ts, today_date
+
+# Month-end period close. For every finished month, each house gets a snapshot of what
+# it has been charged (invoices whose month has started) and what has been paid (confirmed
+# payments by paid_at) up to the end of that month; each (house, tenant) pair gets the
+# same for the months the tenant lived there and the tenant's own payments. A balance
+# "as of" any day is the latest snapshot before it plus the invoices and payments since,
+# so it never walks a tenant's whole history. Closing a month starts from the previous
+# month's snapshot and adds that month's movements.
+#
+# Writes that land in an already closed month (a back-dated import, a reversal, an
+# invoice created for a past month) call reclose() in their own transaction, which
+# rewrites only the affected houses' snapshots from that month on.
+
+BUCKETS = ("not_due", "0-30", "31-60", "61-90", "90+")
+
+def month_of(d: date, delta: int = 0):
+    y, m = shift_month(d.year, d.month, delta)
+    return date(y, m, 1)
+
+def months_between(first: date, last: date):
+    out = []
+    while first <= last:
+        out.append(first)
+        first = month_of(first, 1)
+    return out
+
+def ts(d: date):
+    return datetime.combine(d, time.min)
+
+def closed_through(db: Session):
+    # Latest closed month (first day), or None before the first close
+    return db.query(func.max(HouseBalanceSnapshot.period)).scalar()
+
+def first_closed(db: Session):
+    return db.query(func.min(HouseBalanceSnapshot.period)).scalar()
+
+def movements(db: Session, lo: date | None, hi: date, tenants: bool = False, house_ids=None, tenant_id: int | None = None, by_month: bool = False):
+    # {(house_id, tenant_id, period): [charged, paid]} for invoices with period_start in
+    # [lo, hi) and confirmed payments with paid_at in [lo, hi); lo None means from the
+    # start. House totals (tenant_id None) unless tenants; period is None unless by_month.
+    out = {}
+    invoice_window = [Invoice.period_start < hi] + ([Invoice.period_start >= lo] if lo else [])
+    payment_window = [Payment.status == "confirmed", Payment.paid_at < ts(hi)] + ([Payment.paid_at >= ts(lo)] if lo else [])
+    if house_ids is not None:
+        invoice_window.append(Invoice.house_id.in_(house_ids))
+        payment_window.append(Payment.house_id.in_(house_ids))
+    y, m = extract("year", Payment.paid_at), extract("month", Payment.paid_at)
+    paid_month = [y, m] if by_month else []
+
+    def add(key, i, amount):
+        out.setdefault(key, [0, 0])[i] += int(amount)
+
+    if not tenants:
+        charge_month = [Invoice.period_start] if by_month else []
+        for house_id, *rest in db.query(Invoice.house_id, *charge_month, func.sum(Invoice.amount_due)).filter(
+            *invoice_window
+        ).group_by(Invoice.house_id, *charge_month).all():
+            add((house_id, None, rest[0] if by_month else None), 0, rest[-1])
+        for house_id, *rest in db.query(Payment.house_id, *paid_month, func.sum(Payment.amount)).filter(
+            *payment_window
+        ).group_by(Payment.house_id, *paid_month).all():
+            add((house_id, None, date(int(rest[0]), int(rest[1]), 1) if by_month else None), 1, rest[-1])
+        return out
+
+    # each invoice once per tenant who lived in the house at some point in its month
+    occupancy = select(
+        Invoice.id, Invoice.period_start, Invoice.amount_due, HouseTenant.house_id, HouseTenant.tenant_id
+    ).join(HouseTenant, and_(
+        HouseTenant.house_id == Invoice.house_id,
+        HouseTenant.start_date <= Invoice.period_end,
+        or_(HouseTenant.end_date.is_(None), HouseTenant.end_date >= Invoice.period_start)
+    )).where(*invoice_window, *([HouseTenant.tenant_id == tenant_id] if tenant_id is not None else [])).distinct().subquery()
+    charge_month = [occupancy.c.period_start] if by_month else []
+    for house_id, tenant, *rest in db.query(occupancy.c.house_id, occupancy.c.tenant_id, *charge_month, func.sum(occupancy.c.amount_due)).group_by(
+        occupancy.c.house_id, occupancy.c.tenant_id, *charge_month
+    ).all():
+        add((house_id, tenant, rest[0] if by_month else None), 0, rest[-1])
+    if tenant_id is not None:
+        payment_window.append(Payment.tenant_id == tenant_id)
+    for house_id, tenant, *rest in db.query(Payment.house_id, Payment.tenant_id, *paid_month, func.sum(Payment.amount)).filter(
+        *payment_window
+    ).group_by(Payment.house_id, Payment.tenant_id, *paid_month).all():
+        add((house_id, tenant, date(int(rest[0]), int(rest[1]), 1) if by_month else None), 1, rest[-1])
+    return out
+
+def snapshot_rows(db: Session, period: date, tenants: bool = False, house_ids=None, tenant_id: int | None = None):
+    # The snapshots of one closed month, keyed like movements()
+    if not tenants:
+        q = db.query(HouseBalanceSnapshot.house_id, HouseBalanceSnapshot.charged, HouseBalanceSnapshot.paid).filter(
+            HouseBalanceSnapshot.period == period
+        )
+        if house_ids is not None:
+            q = q.filter(HouseBalanceSnapshot.house_id.in_(house_ids))
+        return {(house_id, None, None): [charged, paid] for house_id, charged, paid in q.all()}
+    q = db.query(TenantBalanceSnapshot.house_id, TenantBalanceSnapshot.tenant_id, TenantBalanceSnapshot.charged, TenantBalanceSnapshot.paid).filter(
+        TenantBalanceSnapshot.period == period
+    )
+    if house_ids is not None:
+        q = q.filter(TenantBalanceSnapshot.house_id.in_(house_ids))
+    if tenant_id is not None:
+        q = q.filter(TenantBalanceSnapshot.tenant_id == tenant_id)
+    return {(house_id, tenant, None): [charged, paid] for house_id, tenant, charged, paid in q.all()}
+
+def close_range(db: Session, first: date, last: date, house_ids=None):
+    # (Re)writes the snapshots of months first..last (first days), for all houses or just
+    # house_ids, from the snapshot before `first` (or the full history if there is none)
+    # plus each month's movements. Returns the number of rows written. Does not commit.
+    prev = month_of(first, -1)
+    oldest, through = first_closed(db), closed_through(db)
+    running = {}
+    for tenants in (False, True):
+        if through is not None and oldest <= prev <= through:
+            running.update(snapshot_rows(db, prev, tenants, house_ids))
+        else:
+            running.update(movements(db, None, first, tenants, house_ids))
+    moves = {}
+    for tenants in (False, True):
+        for (house_id, tenant, period), amounts in movements(db, first, month_of(last, 1), tenants, house_ids, by_month=True).items():
+            moves.setdefault(period, []).append(((house_id, tenant, None), amounts))
+
+    houses = db.query(House.id)
+    starts = db.query(HouseTenant.house_id, HouseTenant.tenant_id, func.min(HouseTenant.start_date)).group_by(HouseTenant.house_id, HouseTenant.tenant_id)
+    if house_ids is not None:
+        houses = houses.filter(House.id.in_(house_ids))
+        starts = starts.filter(HouseTenant.house_id.in_(house_ids))
+    houses = [h for h, in houses.order_by(House.id.asc()).all()]
+    starts = {(house_id, tenant): start for house_id, tenant, start in starts.all()}
+    pairs = set(starts) | {(h, t) for h, t, _ in running if t is not None}
+    pairs |= {(h, t) for entries in moves.values() for (h, t, _), _ in entries if t is not None}
+
+    stamp = now_ts()
+    house_rows, tenant_rows = [], []
+    for period in months_between(first, last):
+        for key, (charged, paid) in moves.get(period, []):
+            total = running.setdefault(key, [0, 0])
+            total[0] += charged
+            total[1] += paid
+        period_end = make_month(period.year, period.month)[1]
+        for house_id in houses:
+            charged, paid = running.get((house_id, None, None), (0, 0))
+            house_rows.append({"period": period, "house_id": house_id, "charged": charged, "paid": paid, "balance": charged - paid, "closed_at": stamp})
+        for house_id, tenant in pairs:
+            charged, paid = running.get((house_id, tenant, None), (0, 0))
+            start = starts.get((house_id, tenant))
+            if charged == paid == 0 and (start is None or start > period_end):
+                continue  # not moved in yet
+            tenant_rows.append({"period": period, "house_id": house_id, "tenant_id": tenant, "charged": charged, "paid": paid, "balance": charged - paid, "closed_at": stamp})
+
+    stale_houses = delete(HouseBalanceSnapshot).where(HouseBalanceSnapshot.period.between(first, last))
+    stale_tenants = delete(TenantBalanceSnapshot).where(TenantBalanceSnapshot.period.between(first, last))
+    if house_ids is not None:
+        stale_houses = stale_houses.where(HouseBalanceSnapshot.house_id.in_(house_ids))
+        stale_tenants = stale_tenants.where(TenantBalanceSnapshot.house_id.in_(house_ids))
+    db.execute(stale_houses)
+    db.execute(stale_tenants)
+    if house_rows:
+        db.execute(insert(HouseBalanceSnapshot), house_rows)
+    if tenant_rows:
+        db.execute(insert(TenantBalanceSnapshot), tenant_rows)
+    return len(house_rows) + len(tenant_rows)
+
+def earliest_activity(db: Session):
+    # First month with an invoice or a payment, or None
+    first_invoice = db.query(func.min(Invoice.period_start)).scalar()
+    first_payment = db.query(func.min(Payment.paid_at)).scalar()
+    firsts = [d for d in (first_invoice, first_payment.date() if first_payment else None) if d]
+    return month_of(min(firsts)) if firsts else None
+
+def close_periods(db: Session, through: date | None = None):
+    # Closes every finished month after the last closed one, up to and including
+    # `through` (default: last month). Returns the months closed. Does not commit.
+    current = month_of(today_date())
+    through = month_of(through) if through else month_of(current, -1)
+    if through >= current:
+        raise ValueError("Only finished months can be closed")
+    last = closed_through(db)
+    start = month_of(last, 1) if last else earliest_activity(db)
+    if start is None:
+        return []
+    periods = months_between(start, through)
+    for period in periods:
+        close_range(db, period, period)
+    return periods
+
+def reclose(db: Session, changes: dict):
+    # changes: {house_id: earliest date touched}. Rewrites those houses' snapshots from
+    # the earliest closed month touched on; nothing happens for open months. Returns
+    # the number of rows written. Does not commit.
+    current = month_of(today_date())
+    changes = {house_id: month_of(d) for house_id, d in changes.items() if month_of(d) < current}
+    if not changes:
+        return 0
+    through = closed_through(db)
+    if through is None:
+        return 0
+    changes = {house_id: period for house_id, period in changes.items() if period <= through}
+    if not changes:
+        return 0
+    first = max(min(changes.values()), first_closed(db))
+    return close_range(db, first, through, sorted(changes))
+
+def reclose_all(db: Session, since: date):
+    # As reclose(), for every house (e.g. after a backfill of past invoices)
+    through = closed_through(db)
+    if through is None or month_of(since) > through:
+        return 0
+    return close_range(db, max(month_of(since), first_closed(db)), through)
+
+def balances_as_of(db: Session, as_of: date, tenants: bool = False, house_ids=None, tenant_id: int | None = None):
+    # ({(house_id, tenant_id): (charged, paid)}, snapshot month used or None): the latest
+    # snapshot of a month that had ended by as_of, plus everything after it up to as_of
+    period = closed_through(db)
+    if period is not None:
+        period = min(period, month_of(as_of, -1))
+        if period < first_closed(db):
+            period = None
+    totals = {}
+    if period is not None:
+        for (house_id, tenant, _), amounts in snapshot_rows(db, period, tenants, house_ids, tenant_id).items():
+            totals[(house_id, tenant)] = amounts
+    lo = month_of(period, 1) if period is not None else None
+    for (house_id, tenant, _), (charged, paid) in movements(db, lo, as_of + timedelta(days=1), tenants, house_ids, tenant_id).items():
+        total = totals.setdefault((house_id, tenant), [0, 0])
+        total[0] += charged
+        total[1] += paid
+    return {key: tuple(amounts) for key, amounts in totals.items()}, period
+
+def balance_entry(charged: int, paid: int):
+    return {"charged": charged, "paid": paid, "balance": charged - paid}
+
+def house_balance(db: Session, house_id: int, as_of: date):
+    # What the house (and each tenant who lived there) owes as of a day; None if no such house
+    house = db.query(House.id, House.number).filter(House.id == house_id).first()
+    if house is None:
+        return None
+    totals, period = balances_as_of(db, as_of, house_ids=[house_id])
+    by_tenant, _ = balances_as_of(db, as_of, tenants=True, house_ids=[house_id])
+    names = dict(db.query(Tenant.id, Tenant.full_name).filter(Tenant.id.in_([t for _, t in by_tenant])).all())
+    return {
+        "house_id": house.id, "house_number": house.number, "as_of": as_of.isoformat(),
+        "snapshot_period": period.isoformat() if period else None,
+        **balance_entry(*totals.get((house_id, None), (0, 0))),
+        "tenants": [
+            {"tenant_id": t, "full_name": names.get(t), **balance_entry(*amounts)}
+            for (_, t), amounts in sorted(by_tenant.items(), key=lambda kv: kv[0][1])
+        ],
+    }
+
+def tenant_balance(db: Session, tenant_id: int, as_of: date):
+    # A tenant's balance per house lived in; None if no such tenant
+    tenant = db.query(Tenant.id, Tenant.full_name).filter(Tenant.id == tenant_id).first()
+    if tenant is None:
+        return None
+    by_house, period = balances_as_of(db, as_of, tenants=True, tenant_id=tenant_id)
+    numbers = dict(db.query(House.id, House.number).filter(House.id.in_([h for h, _ in by_house])).all())
+    houses = [{"house_id": h, "house_number": numbers.get(h), **balance_entry(*amounts)} for (h, _), amounts in sorted(by_house.items())]
+    return {
+        "tenant_id": tenant.id, "full_name": tenant.full_name, "as_of": as_of.isoformat(),
+        "snapshot_period": period.isoformat() if period else None,
+        **balance_entry(sum(x["charged"] for x in houses), sum(x["paid"] for x in houses)),
+        "houses": houses,
+    }
+
+def age_bucket(days_overdue: int):
+    if days_overdue < 0:
+        return "not_due"
+    if days_overdue <= 30:
+        return "0-30"
+    if days_overdue <= 60:
+        return "31-60"
+    if days_overdue <= 90:
+        return "61-90"
+    return "90+"
+
+def arrears_aging(db: Session, as_of: date):
+    # Each house's balance as of the day, aged by due date: what is owed is taken to be
+    # the most recent invoices (older ones count as paid first), so only invoices due in
+    # the last 90 days are read and anything beyond them is 90+. Houses in credit are
+    # left out and summed under "credit".
+    totals, period = balances_as_of(db, as_of)
+    owing = {house_id: charged - paid for (house_id, _), (charged, paid) in totals.items() if charged > paid}
+    credit = sum(paid - charged for charged, paid in totals.values() if paid > charged)
+
+    recent = {}
+    for house_id, due_date, amount_due in db.query(Invoice.house_id, Invoice.due_date, Invoice.amount_due).filter(
+        Invoice.period_start <= as_of,
+        Invoice.due_date >= as_of - timedelta(days=90)
+    ).order_by(Invoice.house_id.asc(), Invoice.period_start.desc()).all():
+        if house_id in owing:
+            recent.setdefault(house_id, []).append((due_date, amount_due))
+    numbers = dict(db.query(House.id, House.number).all())
+    names = {}
+    for house_id, name in db.query(HouseTenant.house_id, Tenant.full_name).join(Tenant, Tenant.id == HouseTenant.tenant_id).filter(
+        HouseTenant.status == "active"
+    ).order_by(HouseTenant.id.asc()).all():
+        names.setdefault(house_id, []).append(name)
+
+    summary = dict.fromkeys(BUCKETS, 0)
+    houses = []
+    for house_id, balance in owing.items():
+        buckets = dict.fromkeys(BUCKETS, 0)
+        remaining = balance
+        for due_date, amount_due in recent.get(house_id, []):
+            if remaining <= 0:
+                break
+            take = min(remaining, amount_due)
+            buckets[age_bucket((as_of - due_date).days)] += take
+            remaining -= take
+        buckets["90+"] += remaining
+        for k, v in buckets.items():
+            summary[k] += v
+        houses.append({"house_id": house_id, "house_number": numbers.get(house_id), "tenants": names.get(house_id, []), "balance": balance, "buckets": buckets})
+    houses.sort(key=lambda h: (-h["balance"], h["house_number"]))
+    return {
+        "as_of": as_of.isoformat(),
+        "snapshot_period": period.isoformat() if period else None,
+        "balance": sum(owing.values()),
+        "credit": credit,
+        "buckets": summary,
+        "houses": houses,
+    }
@@ -0,0 +1,295 @@
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import Context, ContextVar
+from datetime import datetime
+from functools import lru_cache
+from itertools import count
+from threading import Lock, Thread, get_ident
+from urllib.parse import parse_qsl, urlencode
+import hmac
+import json
+import logging
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+from sqlalchemy import event
+from starlette.datastructures import MutableHeaders
+
+logger = logging.getLogger("rentals.profiling")
+
+# Opt-in request profiling. A request is profiled when it carries
+# "X-Profile: <PROFILE_TOKEN>", or at random with probability PROFILE_SAMPLE_RATE.
+# While a profiled request runs, a sampler thread records the stacks of the threads
+# working on it every PROFILE_INTERVAL_MS: the event loop, and the threadpool worker
+# that runs a sync endpoint. That is why this samples instead of using cProfile, which
+# only sees the thread that enabled it. It also costs the request much less. The profile
+# keeps the route, the time split by function, and the SQL statements it ran (text,
+# count, time). Requests faster than PROFILE_MIN_MS are dropped. The rest are written
+# to PROFILE_DIR, which keeps the latest PROFILE_KEEP, and are read back through
+# GET /admin/profiles, which also requires the X-Profile token.
+#
+# With neither setting, main.py does not install the middleware and no engine listeners
+# are added, so requests pay nothing. With only the token set, the cost is a header
+# lookup per request and a context variable read per SQL statement.
+#
+# With DB_ASYNC=1 the query code runs in SQLAlchemy greenlets. The sampler cannot tie
+# their stacks to a request, so those profiles show the SQL but not the Python around it.
+
+UNPROFILED = ("/events", "/admin/profiles", "/metrics", "/healthz", "/readyz")
+PROFILE_ID = re.compile(r"^[0-9]{8}-[0-9]{6}-[0-9]{6}-[0-9]+-[0-9]+$")
+TOP_FUNCTIONS = 40
+
+# The profile of the current request, if it is being profiled; copied into the
+# threadpool with the rest of the context, like metrics.current_request
+current = ContextVar("current_profile", default=None)
+
+def sample_rate():
+    return float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+
+def profile_token():
+    return os.getenv("PROFILE_TOKEN", "")
+
+def check_token(value: str | None):
+    # Reading profiles (GET /admin/profiles) takes the same X-Profile token; with no
+    # token configured they cannot be read at all
+    expected = profile_token()
+    return bool(expected) and hmac.compare_digest(expected, value or "")
+
+def enabled():
+    return sample_rate() > 0 or bool(profile_token())
+
+def interval():
+    return int(os.getenv("PROFILE_INTERVAL_MS", "2")) / 1000
+
+def min_ms():
+    return int(os.getenv("PROFILE_MIN_MS", "0"))
+
+def profile_dir():
+    return os.getenv("PROFILE_DIR") or os.path.join(tempfile.gettempdir(), "rentals-profiles")
+
+def keep():
+    return int(os.getenv("PROFILE_KEEP", "100"))
+
+def redact(query: str):
+    # The M-Pesa callback carries its shared secret in ?token=
+    pairs = parse_qsl(query, keep_blank_values=True)
+    return urlencode([(k, "***" if k == "token" else v) for k, v in pairs])
+
+@lru_cache(maxsize=8192)
+def label(code):
+    path = code.co_filename
+    for prefix in sorted(sys.path, key=len, reverse=True):
+        if prefix and path.startswith(prefix + os.sep):
+            path = path[len(prefix) + 1:]
+            break
+    return f"{code.co_qualname} ({path}:{code.co_firstlineno})"
+
+class Profile:
+    _ids = count(1)
+
+    def __init__(self, scope):
+        self.started = datetime.now()
+        self.id = f"{self.started:%Y%m%d-%H%M%S-%f}-{os.getpid()}-{next(self._ids)}"
+        self.method = scope["method"]
+        self.path = scope["path"]
+        self.query = redact(scope.get("query_string", b"").decode("latin-1"))
+        self.start = time.perf_counter()
+        self.elapsed = 0.0
+        self.stacks = Counter()  # (code, ...) root first -> samples
+        self.sql = {}            # statement -> [count, seconds]
+
+    def add_statement(self, statement: str, elapsed: float):
+        # Called from whichever thread ran it; the GIL makes the update safe enough for counts
+        entry = self.sql.setdefault(statement, [0, 0.0])
+        entry[0] += 1
+        entry[1] += elapsed
+
+    def to_json(self, route: str, status: int, interval_ms: float):
+        samples = sum(self.stacks.values())
+        own, total = Counter(), Counter()
+        for stack, n in self.stacks.items():
+            own[stack[-1]] += n
+            for code in set(stack):
+                total[code] += n
+        sql = sorted(self.sql.items(), key=lambda kv: kv[1][1], reverse=True)
+        return {
+            "id": self.id, "method": self.method, "path": self.path, "query": self.query, "route": route,
+            "status": status, "started_at": self.started.isoformat(timespec="milliseconds"),
+            "duration_ms": round(self.elapsed * 1000, 2), "interval_ms": interval_ms, "samples": samples,
+            "statements": sum(c for c, _ in self.sql.values()),
+            "db_ms": round(sum(s for _, s in self.sql.values()) * 1000, 2),
+            # Share of samples in each function (total) and with it on top of the stack (self)
+            "functions": [
+                {"function": label(code), "total": n, "self": own[code]}
+                for code, n in total.most_common(TOP_FUNCTIONS)
+            ],
+            "sql": [{"statement": s, "count": c, "ms": round(t * 1000, 2)} for s, (c, t) in sql],
+            # Folded stacks ("root;...;leaf samples"), the input of flamegraph.pl and speedscope
+            "stacks": [";".join(label(code) for code in stack) + f" {n}" for stack, n in self.stacks.most_common()],
+        }
+
+class Sampler:
+    # One thread, running only while some request is being profiled
+    def __init__(self):
+        self.lock = Lock()
+        self.active = set()
+        self.thread = None
+
+    def start(self, profile: Profile):
+        with self.lock:
+            self.active.add(profile)
+            if self.thread is None:
+                self.thread = Thread(target=self.run, name="profiler", daemon=True)
+                self.thread.start()
+
+    def stop(self, profile: Profile):
+        with self.lock:
+            self.active.discard(profile)
+
+    def run(self):
+        me = get_ident()
+        pause = interval()
+        while True:
+            time.sleep(pause)
+            with self.lock:
+                if not self.active:
+                    self.thread = None
+                    return
+                for ident, frame in sys._current_frames().items():
+                    if ident != me:
+                        self.sample(frame)
+
+    def sample(self, frame):
+        # Walks the stack from the leaf; the innermost frame that names a profiled
+        # request (the middleware's call on the loop, or the context a threadpool worker
+        # runs the endpoint in) decides whose sample it is
+        stack = []
+        owner = None
+        while frame is not None:
+            code = frame.f_code
+            if owner is None:
+                if code is MIDDLEWARE_CODE:
+                    owner = frame.f_locals.get("profile")
+                elif "context" in code.co_varnames:
+                    ctx = frame.f_locals.get("context")
+                    if isinstance(ctx, Context):
+                        owner = ctx.get(current)
+            stack.append(code)
+            frame = frame.f_back
+        if owner in self.active:
+            stack.reverse()
+            owner.stacks[tuple(stack)] += 1
+
+class ProfileStore:
+    # Profiles on disk, one JSON file each, named so that they sort oldest first
+    def __init__(self):
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="profiles")
+
+    def save(self, profile: Profile, route: str, status: int):
+        # Summarising and writing happen on the writer thread, after the response
+        self.writer.submit(self.write, profile, route, status, interval() * 1000)
+
+    def write(self, profile: Profile, route: str, status: int, interval_ms: float):
+        try:
+            data = profile.to_json(route, status, interval_ms)
+            folder = profile_dir()
+            os.makedirs(folder, exist_ok=True)
+            path = os.path.join(folder, f"{data['id']}.json")
+            with open(path + ".tmp", "w") as f:
+                json.dump(data, f)
+            os.replace(path + ".tmp", path)
+            for name in self.names()[:-keep()]:
+                try:
+                    os.remove(os.path.join(folder, name))
+                except FileNotFoundError:
+                    pass  # another worker pruned it
+        except Exception:
+            logger.exception("Could not write profile %s", profile.id)
+
+    def names(self):
+        try:
+            return sorted(n for n in os.listdir(profile_dir()) if n.endswith(".json"))
+        except FileNotFoundError:
+            return []
+
+    def list(self, limit: int):
+        out = []
+        for name in reversed(self.names()):
+            if len(out) >= limit:
+                break
+            try:
+                with open(os.path.join(profile_dir(), name)) as f:
+                    data = json.load(f)
+            except (FileNotFoundError, ValueError):
+                continue  # pruned meanwhile
+            out.append({k: v for k, v in data.items() if k not in ("functions", "sql", "stacks")})
+        return out
+
+    def path(self, profile_id: str):
+        if not PROFILE_ID.match(profile_id):
+            return None
+        path = os.path.join(profile_dir(), f"{profile_id}.json")
+        return path if os.path.exists(path) else None
+
+sampler = Sampler()
+store = ProfileStore()
+
+def instrument_engine(engine):
+    # Records each profiled request's statements; no listeners when profiling is off
+    if not enabled():
+        return
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if current.get() is not None:
+            conn.info.setdefault("profile_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        profile = current.get()
+        if profile is not None:
+            profile.add_statement(statement, time.perf_counter() - conn.info["profile_start"].pop())
+
+class ProfilingMiddleware:
+    # Pure ASGI, like the metrics middleware. Answers carry X-Profile-Id when profiled.
+    def __init__(self, app):
+        self.app = app
+        self.rate = sample_rate()
+        token = profile_token()
+        self.header = (b"x-profile", token.encode()) if token else None
+
+    def wanted(self, scope):
+        if self.header and self.header in scope["headers"]:
+            # also sent to read profiles, which should not push real ones out of the ring
+            return not scope["path"].startswith(UNPROFILED)
+        return self.rate > 0 and random.random() < self.rate and not scope["path"].startswith(UNPROFILED)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.wanted(scope):
+            return await self.app(scope, receive, send)
+        profile = Profile(scope)
+        status = 500
+
+        async def send_with_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                MutableHeaders(scope=message).append("X-Profile-Id", profile.id)
+            await send(message)
+
+        token = current.set(profile)
+        sampler.start(profile)
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            sampler.stop(profile)
+            current.reset(token)
+            profile.elapsed = time.perf_counter() - profile.start
+            if profile.elapsed * 1000 >= min_ms():
+                route = getattr(scope.get("route"), "path", "unmatched")
+                store.save(profile, route, status)
+
+MIDDLEWARE_CODE = ProfilingMiddleware.__call__.__code__
@@ -0,0 +1,146 @@
+from datetime import date, timedelta
+from sqlalchemy import func, case, and_, true
+from sqlalchemy.orm import Session
+from models import House, Tenant, HouseTenant, Invoice, Payment
+from services import day_start, received_between, received_by_month
+from utils import shift_month
+
+# Daily / monthly / yearly finance reports. Every figure comes from a GROUP BY over
+# payments.paid_at (cash received in the period) or invoices (expected rent).
+# "expected" for a month is each invoice's amount_due, plus monthly_rent for active
+# houses that have no invoice for that month yet.
+
+def confirmed_between(since: date, until: date):
+    return and_(
+        Payment.status == "confirmed",
+        Payment.paid_at >= day_start(since),
+        Payment.paid_at < day_start(until)
+    )
+
+def breakdown(db: Session, since: date, until: date):
+    # Received in [since, until) by method, by house number and by target month
+    window = confirmed_between(since, until)
+    by_method = db.query(Payment.method, func.sum(Payment.amount)).filter(window).group_by(Payment.method).all()
+    by_house = db.query(House.number, func.sum(Payment.amount)).join(House, House.id == Payment.house_id).filter(
+        window
+    ).group_by(House.number).order_by(House.number.asc()).all()
+    by_target = db.query(Payment.target_year, Payment.target_month, func.sum(Payment.amount)).filter(
+        window
+    ).group_by(Payment.target_year, Payment.target_month).order_by(Payment.target_year, Payment.target_month).all()
+    return {
+        "by_method": {method: int(total) for method, total in by_method},
+        "by_house": [{"house_number": number, "received": int(total)} for number, total in by_house],
+        "by_target_month": [
+            {"year": y, "month": m, "for_month": f"{y}-{str(m).zfill(2)}", "received": int(total)} for y, m, total in by_target
+        ],
+    }
+
+def active_rent_total(db: Session):
+    return int(db.query(func.coalesce(func.sum(House.monthly_rent), 0)).filter(House.is_active == true()).scalar())
+
+def expected_by_month(db: Session, since: date, until: date):
+    # {(year, month): expected} for invoice months in [since, until). Months without any
+    # invoice are absent; callers fall back to active_rent_total().
+    rows = db.query(
+        Invoice.period_start,
+        func.sum(Invoice.amount_due),
+        func.sum(case((House.is_active == true(), House.monthly_rent), else_=0))
+    ).join(House, House.id == Invoice.house_id).filter(
+        Invoice.period_start >= since,
+        Invoice.period_start < until
+    ).group_by(Invoice.period_start).all()
+    active_total = active_rent_total(db)
+    return {(ps.year, ps.month): int(invoiced) + active_total - int(invoiced_active_rent) for ps, invoiced, invoiced_active_rent in rows}, active_total
+
+def collected_for_months(db: Session, since: date, until: date):
+    # {(year, month): confirmed amount allocated to that month's invoices}, whenever paid
+    rows = db.query(Invoice.period_start, func.sum(Invoice.paid_total)).filter(
+        Invoice.period_start >= since,
+        Invoice.period_start < until
+    ).group_by(Invoice.period_start).all()
+    out = {}
+    for ps, total in rows:
+        out[(ps.year, ps.month)] = out.get((ps.year, ps.month), 0) + int(total)
+    return out
+
+def daily_report(db: Session, day: date):
+    next_day = day + timedelta(days=1)
+    month_start = day.replace(day=1)
+    ny, nm = shift_month(day.year, day.month, 1)
+    expected, active_total = expected_by_month(db, month_start, date(ny, nm, 1))
+
+    houses = {}
+    for number in db.query(House.number).filter(House.is_active == true()).order_by(House.number.asc()).all():
+        houses[str(number[0])] = {"received": 0, "paid": [], "unpaid": []}
+    rows = db.query(House.number, Tenant.full_name, func.sum(Payment.amount)).join(
+        House, House.id == Payment.house_id
+    ).join(Tenant, Tenant.id == Payment.tenant_id).filter(
+        confirmed_between(day, next_day)
+    ).group_by(House.number, Tenant.id, Tenant.full_name).order_by(House.number.asc(), Tenant.full_name.asc()).all()
+    for number, name, total in rows:
+        entry = houses.setdefault(str(number), {"received": 0, "paid": [], "unpaid": []})
+        entry["received"] += int(total)
+        entry["paid"].append(name)
+    tenants = db.query(House.number, Tenant.full_name).join(HouseTenant, HouseTenant.house_id == House.id).join(
+        Tenant, Tenant.id == HouseTenant.tenant_id
+    ).filter(HouseTenant.status == "active", House.is_active == true()).order_by(House.number.asc(), HouseTenant.id.asc()).all()
+    for number, name in tenants:
+        entry = houses[str(number)]
+        if name not in entry["paid"]:
+            entry["unpaid"].append(name)
+
+    received = received_between(db, day, next_day)
+    return {
+        "date": day.isoformat(),
+        "received_today": received,
+        "expected_monthly": expected.get((day.year, day.month), active_total),
+        "houses": houses,
+        **breakdown(db, day, next_day),
+    }
+
+def monthly_report(db: Session, year: int, month: int):
+    start = date(year, month, 1)
+    ny, nm = shift_month(year, month, 1)
+    end = date(ny, nm, 1)
+    expected, active_total = expected_by_month(db, start, end)
+    expected_total = expected.get((year, month), active_total)
+    received = received_between(db, start, end)
+    collected = collected_for_months(db, start, end).get((year, month), 0)
+
+    rows = db.query(Payment, House.number, Tenant.full_name).join(House, House.id == Payment.house_id).join(
+        Tenant, Tenant.id == Payment.tenant_id
+    ).filter(confirmed_between(start, end)).order_by(Payment.paid_at.asc(), Payment.id.asc()).all()
+    payments = [{
+        "house": number, "tenant": name, "amount": p.amount, "method": p.method,
+        "paid_at": p.paid_at.strftime("%Y-%m-%d %H:%M:%S"), "tx_ref": p.tx_ref,
+        "for_month": f"{p.target_year}-{str(p.target_month).zfill(2)}"
+    } for p, number, name in rows]
+
+    return {
+        "year": year, "month": month,
+        "expected": expected_total,
+        "received": received,
+        "outstanding": max(expected_total - received, 0),
+        "collected_for_month": collected,
+        "payments": payments,
+        **breakdown(db, start, end),
+    }
+
+def yearly_report(db: Session, year: int):
+    start, end = date(year, 1, 1), date(year + 1, 1, 1)
+    expected, active_total = expected_by_month(db, start, end)
+    received = received_by_month(db, start, end)
+    collected = collected_for_months(db, start, end)
+    monthly = [{
+        "month": m,
+        "expected": expected.get((year, m), active_total),
+        "received": received.get((year, m), 0),
+        "collected_for_month": collected.get((year, m), 0),
+    } for m in range(1, 13)]
+    return {
+        "year": year,
+        "total_received": sum(x["received"] for x in monthly),
+        "total_expected": sum(x["expected"] for x in monthly),
+        "monthly": monthly,
+        **breakdown(db, start, end),
+    }
@@ -1,8 +1,49 @@
-from base import Base, engine, SessionLocal
-from models import House
+"""Seed the database.
+
+With no arguments, adds the ten real houses if they are missing. With --houses,
+generates a synthetic estate instead: houses, tenants, and years of invoices and
+payments, allocated with the same walk as POST /payments so invoice totals and
+statuses are consistent. The generator is reproducible for a given --seed.
+
+    python seed.py
+    python seed.py --houses 2000 --tenants-per-house 2 --years 3 --seed 7 --wipe
+
+Payment patterns are mixed per tenant: on time, late (after the due day),
+partial (part of the rent, the rest rolls over) and advance (a quarter at once).
+"""
+import argparse
+import os
+import random
+from datetime import date, datetime
+from sqlalchemy import insert, text, func
+from base import Base, get_engine, SessionLocal, database_url
+from models import House, Tenant, HouseTenant, Invoice, Payment
+from services import plan_allocation, invoice_status, invoice_balance
+from utils import make_month, shift_month, due_date_for_month, normalize_phone, today_date
+
+FIRST_NAMES = ("Wanjiru", "Otieno", "Akinyi", "Kamau", "Njeri", "Mwangi", "Chebet", "Kiptoo", "Achieng", "Mutua",
+               "Wambui", "Omondi", "Nyambura", "Kariuki", "Jepkosgei", "Mugo", "Atieno", "Ndungu", "Moraa", "Kibet")
+LAST_NAMES = ("Mwangi", "Odhiambo", "Kamau", "Wanjiku", "Kiprono", "Njoroge", "Ochieng", "Mutiso", "Kimani", "Were",
+              "Gitau", "Onyango", "Cheruiyot", "Maina", "Nduta", "Wekesa", "Koech", "Muthoni", "Owino", "Langat")
+PATTERNS = ("on_time", "late", "partial", "advance")
+INSERT_CHUNK = 5000
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+def migrate(wipe: bool = False):
+    # Brings the schema to head through Alembic, as deploys do, so the database is
+    # stamped and /readyz accepts it. wipe drops everything first.
+    from alembic import command
+    from alembic.config import Config
+    if wipe:
+        Base.metadata.drop_all(bind=get_engine())
+        with get_engine().begin() as conn:
+            conn.execute(text("DROP TABLE IF EXISTS alembic_version"))
+    cfg = Config(os.path.join(HERE, "alembic.ini"))
+    cfg.set_main_option("sqlalchemy.url", database_url().replace("%", "%%"))
+    command.upgrade(cfg, "head")
 
 def run():
-    Base.metadata.create_all(bind=engine)
+    migrate()
     db = SessionLocal()
     try:
         existing_numbers = {h.number for h in db.query(House).all()}
@@ -22,5 +63,152 @@ def run():
     finally:
         db.close()
 
+def house_payments(rng: random.Random, pattern: str, rent: int, months: list, today: date):
+    # [(paid_at, amount)] for one house over `months`
+    out = []
+    for i, (y, m) in enumerate(months):
+        if rng.random() < 0.03:
+            continue  # missed month
+        if pattern == "on_time":
+            out.append((datetime(y, m, rng.randint(1, 5), rng.randint(7, 20), rng.randint(0, 59)), rent))
+        elif pattern == "late":
+            out.append((datetime(y, m, rng.randint(8, 28), rng.randint(7, 20), rng.randint(0, 59)), rent))
+        elif pattern == "partial":
+            for _ in range(rng.randint(1, 3)):
+                out.append((datetime(y, m, rng.randint(1, 28), rng.randint(7, 20), rng.randint(0, 59)), rng.randint(5, 15) * rent // 20))
+        elif pattern == "advance" and i % 3 == 0:
+            out.append((datetime(y, m, rng.randint(1, 5), rng.randint(7, 20), rng.randint(0, 59)), rent * 3))
+    now = datetime.combine(today, datetime.min.time())
+    return [(ts, amount) for ts, amount in out if ts < now]
+
+def insert_chunked(conn, model, rows: list):
+    for i in range(0, len(rows), INSERT_CHUNK):
+        conn.execute(insert(model), rows[i:i + INSERT_CHUNK])
+
+def generate(houses: int, tenants_per_house: int = 1, years: int = 2, mix: dict | None = None, seed: int = 42,
+             bind=None, chunk_houses: int = 500, today: date | None = None):
+    # Bulk-inserts a synthetic estate into empty tables; returns row counts. Work is done
+    # `chunk_houses` houses at a time so memory stays flat as the estate grows.
+    bind = bind or get_engine()
+    rng = random.Random(seed)
+    today = today or today_date()
+    mix = mix or {"on_time": 0.55, "late": 0.2, "partial": 0.15, "advance": 0.1}
+    first = shift_month(today.year, today.month, -(years * 12 - 1))
+    months = [shift_month(*first, i) for i in range(years * 12)]
+    counts = {"houses": 0, "tenants": 0, "invoices": 0, "payments": 0}
+    ids = {"tenant": 0, "invoice": 0, "payment": 0}
+
+    for chunk_start in range(1, houses + 1, chunk_houses):
+        house_rows, tenant_rows, rel_rows, invoice_rows, payment_rows = [], [], [], [], []
+        for number in range(chunk_start, min(chunk_start + chunk_houses, houses + 1)):
+            kind = rng.choice(("bedsitter", "single"))
+            rent = (3500 if kind == "bedsitter" else 3000) + rng.choice((0, 0, 500, 1000))
+            house_rows.append({"id": number, "number": number, "type": kind, "monthly_rent": rent, "is_active": True})
+
+            phones = {}
+            for _ in range(tenants_per_house):
+                ids["tenant"] += 1
+                tid = ids["tenant"]
+                phone = f"+2547{tid:08d}"
+                tenant_rows.append({
+                    "id": tid, "full_name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}", "phone": phone,
+                    "phone_normalized": normalize_phone(phone), "gov_id": str(20000000 + tid), "email": None, "is_active": True
+                })
+                rel_rows.append({"house_id": number, "tenant_id": tid, "status": "active", "start_date": date(*months[0], 1)})
+                phones[tid] = phone
+
+            invoices = {}
+            pattern = rng.choices(PATTERNS, weights=[mix.get(p, 0) for p in PATTERNS])[0]
+            for paid_at, amount in house_payments(rng, pattern, rent, months, today):
+                # like POST /payments: start at the oldest month that is not fully paid
+                start = next(((y, m) for y, m in months if invoices.get((y, m), {"paid": 0})["paid"] < rent), None)
+                if start is None:
+                    start = shift_month(*months[-1], 1)
+                    while invoices.get(start, {"paid": 0})["paid"] >= rent:
+                        start = shift_month(*start, 1)
+                tenant_id = rng.choice(list(phones))
+                method = rng.choice(("mpesa", "mpesa", "cash"))
+                tx_ref = None
+                if method == "mpesa":
+                    tx_ref = f"S{ids['payment'] + 1:09d}"
+                for step in plan_allocation(amount, start[0], start[1], rent, invoices):
+                    key = (step["year"], step["month"])
+                    if step["invoice"] is None:
+                        ids["invoice"] += 1
+                        invoices[key] = {"id": ids["invoice"], "amount_due": rent, "paid": 0}
+                    invoices[key]["paid"] = step["paid_after"]
+                    ids["payment"] += 1
+                    payment_rows.append({
+                        "id": ids["payment"], "house_id": number, "invoice_id": invoices[key]["id"], "tenant_id": tenant_id,
+                        "method": method, "amount": step["applied"], "tx_ref": tx_ref,
+                        "mpesa_msisdn": phones[tenant_id] if method == "mpesa" else None,
+                        "target_year": step["year"], "target_month": step["month"], "paid_at": paid_at, "status": "confirmed", "notes": None
+                    })
+            for y, m in months:
+                if (y, m) not in invoices:
+                    ids["invoice"] += 1
+                    invoices[(y, m)] = {"id": ids["invoice"], "amount_due": rent, "paid": 0}
+            for (y, m), inv in invoices.items():
+                period_start, period_end = make_month(y, m)
+                status = invoice_status(inv["amount_due"], inv["paid"])
+                if status != "paid" and due_date_for_month(period_start) < today:
+                    status = "overdue"
+                invoice_rows.append({
+                    "id": inv["id"], "house_id": number, "period_start": period_start, "period_end": period_end,
+                    "amount_due": inv["amount_due"], "paid_total": inv["paid"], "balance": invoice_balance(inv["amount_due"], inv["paid"]),
+                    "due_date": due_date_for_month(period_start), "status": status, "created_at": datetime(y, m, 1)
+                })
+
+        with bind.begin() as conn:
+            insert_chunked(conn, House, house_rows)
+            insert_chunked(conn, Tenant, tenant_rows)
+            insert_chunked(conn, HouseTenant, rel_rows)
+            insert_chunked(conn, Invoice, invoice_rows)
+            insert_chunked(conn, Payment, payment_rows)
+        counts["houses"] += len(house_rows)
+        counts["tenants"] += len(tenant_rows)
+        counts["invoices"] += len(invoice_rows)
+        counts["payments"] += len(payment_rows)
+
+    if bind.dialect.name == "postgresql":
+        # ids were given explicitly; move the sequences past them
+        with bind.begin() as conn:
+            for table in ("houses", "tenants", "house_tenants", "invoices", "payments"):
+                conn.execute(text(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), COALESCE((SELECT MAX(id) FROM {table}), 1))"))
+    return counts
+
+def parse_mix(value: str):
+    # "on_time=0.5,late=0.2,partial=0.2,advance=0.1"
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in PATTERNS:
+            raise argparse.ArgumentTypeError(f"Unknown payment pattern: {name}")
+        mix[name.strip()] = float(weight)
+    return mix
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--houses", type=int, help="generate a synthetic estate of this many houses")
+    parser.add_argument("--tenants-per-house", type=int, default=1)
+    parser.add_argument("--years", type=int, default=2, help="years of invoice and payment history")
+    parser.add_argument("--mix", type=parse_mix, help="payment pattern weights, e.g. on_time=0.5,late=0.2,partial=0.2,advance=0.1")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--wipe", action="store_true", help="drop all tables and migrate from scratch first")
+    args = parser.parse_args()
+
+    if args.houses is None:
+        run()
+        return
+    migrate(wipe=args.wipe)
+    db = SessionLocal()
+    try:
+        if db.query(func.count(House.id)).scalar():
+            parser.error("the database already has houses; pass --wipe to replace them")
+    finally:
+        db.close()
+    counts = generate(args.houses, args.tenants_per_house, args.years, args.mix, args.seed)
+    print("Generated " + ", ".join(f"{v} {k}" for k, v in counts.items()))
+
 if __name__ == "__main__":
-    run()
+    main()
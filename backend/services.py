@@ -1,132 +1,511 @@
-from datetime import date
+from datetime import date, datetime, time
+import base64
+from sqlalchemy import func, extract, and_, case, insert, update, tuple_
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from models import House, Tenant, HouseTenant, Invoice, Payment, Notification
-from utils import month_bounds, make_month, now_ts, due_date_for_month, today_date
-
-def get_or_create_invoice_by_year_month(db: Session, house_id: int, year: int, month: int):
-    start, end = make_month(year, month)
-    inv = db.query(Invoice).filter(
-        Invoice.house_id == house_id,
-        Invoice.period_start == start,
-        Invoice.period_end == end
-    ).first()
-    if inv:
-        return inv
-    house = db.query(House).get(house_id)
-    inv = Invoice(
-        house_id=house_id,
-        period_start=start,
-        period_end=end,
-        amount_due=house.monthly_rent,
-        due_date=due_date_for_month(start),
-        status="pending",
-        created_at=now_ts()
-    )
-    db.add(inv)
-    db.commit()
-    db.refresh(inv)
-    return inv
+from base import SessionLocal
+import cache
+import events
+import period_close
+from utils import make_month, now_ts, due_date_for_month, today_date, shift_month
 
-def apply_payment_status(db: Session, invoice_id: int):
-    inv = db.query(Invoice).get(invoice_id)
-    total = sum(p.amount for p in inv.payments if p.status == "confirmed")
-    inv.status = "paid" if total >= inv.amount_due else ("partially_paid" if total > 0 else "pending")
-    db.commit()
-    return inv
+def add_to_invoice(db: Session, invoice_id: int, amount: int):
+    # Moves an invoice's paid_total by `amount` (negative for a reversal) in SQL, so it
+    # is atomic even without a lock; balance and status follow from the new total
+    paid = Invoice.paid_total + amount
+    db.execute(update(Invoice).where(Invoice.id == invoice_id).values(
+        paid_total=paid,
+        balance=case((Invoice.amount_due > paid, Invoice.amount_due - paid), else_=0),
+        status=invoice_status_sql(paid)
+    ).execution_options(synchronize_session=False))
 
-def record_payment_chunk(db: Session, house_id: int, tenant_id: int, invoice_id: int, method: str, amount: int, tx_ref: str | None, msisdn: str | None, year: int, month: int):
-    pay = Payment(
-        house_id=house_id,
-        invoice_id=invoice_id,
-        tenant_id=tenant_id,
-        method=method,
-        amount=amount,
-        tx_ref=tx_ref,
-        mpesa_msisdn=msisdn,
-        target_year=year,
-        target_month=month,
-        paid_at=now_ts(),
-        status="confirmed",
-        notes=None
+# The one status rule for every write path: paid once fully covered; an overdue invoice
+# stays overdue until then (only the sweep sets it); otherwise by whether anything is paid
+def invoice_status(amount_due: int, paid_total: int, current: str | None = None):
+    if paid_total >= amount_due:
+        return "paid"
+    if current == "overdue":
+        return "overdue"
+    return "partially_paid" if paid_total > 0 else "pending"
+
+def invoice_status_sql(paid):
+    # invoice_status() as a SQL expression over the row's amount_due and status
+    return case(
+        (paid >= Invoice.amount_due, "paid"),
+        (Invoice.status == "overdue", "overdue"),
+        (paid > 0, "partially_paid"),
+        else_="pending"
     )
-    db.add(pay)
-    db.commit()
-    db.refresh(pay)
-    return pay
 
-def allocate_payment(db: Session, house_id: int, tenant_id: int, method: str, amount: int, start_year: int, start_month: int, tx_ref: str | None, msisdn: str | None):
-    # verify tenant-house relation
-    rel = db.query(HouseTenant).filter(HouseTenant.house_id == house_id, HouseTenant.tenant_id == tenant_id, HouseTenant.status == "active").first()
-    if not rel:
-        raise ValueError("Tenant is not assigned to this house")
+def invoice_balance(amount_due: int, paid_total: int):
+    return max(amount_due - paid_total, 0)
 
-    allocations = []
+def plan_allocation(amount: int, start_year: int, start_month: int, monthly_rent: int, invoices: dict):
+    # Pure allocation walk. invoices maps (year, month) -> {"id", "amount_due", "paid"} for
+    # existing invoices; months without one get a new invoice at monthly_rent.
+    plan = []
     year, month = start_year, start_month
     remaining = amount
-
     while remaining > 0:
-        inv = get_or_create_invoice_by_year_month(db, house_id, year, month)
-        paid_so_far = sum(p.amount for p in inv.payments if p.status == "confirmed")
-        due_here = max(inv.amount_due - paid_so_far, 0)
-
-        if due_here == 0:
-            # already fully paid; roll forward
-            if month == 12:
-                year += 1; month = 1
-            else:
-                month += 1
-            continue
-
-        to_apply = min(remaining, due_here)
-        record_payment_chunk(db, house_id, tenant_id, inv.id, method, to_apply, tx_ref, msisdn, year, month)
-        inv = apply_payment_status(db, inv.id)
-
-        balance_after = max(inv.amount_due - sum(p.amount for p in inv.payments if p.status == "confirmed"), 0)
-        allocations.append({
-            "year": year,
-            "month": month,
-            "applied": to_apply,
-            "status_after": inv.status,
-            "remaining_balance": balance_after,
-            "invoice_id": inv.id
-        })
-        remaining -= to_apply
+        inv = invoices.get((year, month))
+        amount_due = inv["amount_due"] if inv else monthly_rent
+        paid_so_far = inv["paid"] if inv else 0
+        due_here = max(amount_due - paid_so_far, 0)
+        if due_here > 0:
+            to_apply = min(remaining, due_here)
+            plan.append({
+                "year": year, "month": month, "invoice": inv, "amount_due": amount_due,
+                "applied": to_apply, "paid_after": paid_so_far + to_apply
+            })
+            remaining -= to_apply
+        year, month = shift_month(year, month, 1)
+    return plan
 
-        if remaining > 0:
-            if month == 12:
-                year += 1; month = 1
-            else:
-                month += 1
+def lock_houses(db: Session, house_ids):
+    # Serialises allocations per house, including months with no invoice row yet.
+    # Postgres takes row locks (in id order, so concurrent batches cannot deadlock);
+    # SQLite has no FOR UPDATE, so a no-op UPDATE grabs the database write lock
+    # before the invoices are read.
+    ids = sorted(set(house_ids))
+    if db.get_bind().dialect.name == "sqlite":
+        db.execute(update(House).where(House.id.in_(ids)).values(number=House.number))
+    houses = db.query(House).filter(House.id.in_(ids)).order_by(House.id.asc()).with_for_update().all()
+    return {h.id: h for h in houses}
 
-    # Combined receipt message (stubbed to notifications)
-    tenant = db.query(Tenant).get(tenant_id)
-    house = db.query(House).get(house_id)
+def load_invoice_balances(db: Session, house_ids, since: date):
+    # {house_id: {(year, month): {"id", "amount_due", "paid", "status"}}} for invoices from `since` on
+    rows = db.query(Invoice.house_id, Invoice.id, Invoice.period_start, Invoice.amount_due, Invoice.paid_total, Invoice.status).filter(
+        Invoice.house_id.in_(sorted(set(house_ids))),
+        Invoice.period_start >= since
+    ).all()
+    out = {}
+    for house_id, invoice_id, period_start, amount_due, paid_total, status in rows:
+        out.setdefault(house_id, {})[(period_start.year, period_start.month)] = {
+            "id": invoice_id, "amount_due": amount_due, "paid": paid_total, "status": status
+        }
+    return out
+
+def allocate_batch(db: Session, items: list, houses: dict, ts):
+    # Allocates several payments in the caller's transaction with a fixed number of
+    # statements. items are dicts with house_id, tenant_id, method, amount, start_year,
+    # start_month, tx_ref, msisdn and optionally paid_at; houses must be locked (lock_houses).
+    # Returns one allocations list per item, in order.
+    since = min(date(i["start_year"], i["start_month"], 1) for i in items)
+    balances = load_invoice_balances(db, [i["house_id"] for i in items], since)
+
+    plans, new_invoices = [], []
+    for item in items:
+        invoices = balances.setdefault(item["house_id"], {})
+        plan = plan_allocation(item["amount"], item["start_year"], item["start_month"], houses[item["house_id"]].monthly_rent, invoices)
+        for step in plan:
+            inv = step["invoice"]
+            if inv is None:
+                # later items in the batch see this month as already invoiced
+                inv = {"id": None, "amount_due": step["amount_due"], "paid": 0, "new": True}
+                invoices[(step["year"], step["month"])] = inv
+                new_invoices.append((item["house_id"], step["year"], step["month"], inv))
+                step["invoice"] = inv
+            inv["paid"] = step["paid_after"]
+            step["status_after"] = invoice_status(step["amount_due"], step["paid_after"], inv.get("status"))
+        plans.append(plan)
+
+    if new_invoices:
+        objs = []
+        for house_id, year, month, inv in new_invoices:
+            start, end = make_month(year, month)
+            objs.append(Invoice(
+                house_id=house_id, period_start=start, period_end=end, amount_due=inv["amount_due"],
+                paid_total=inv["paid"], balance=invoice_balance(inv["amount_due"], inv["paid"]),
+                due_date=due_date_for_month(start), status=invoice_status(inv["amount_due"], inv["paid"]),
+                created_at=ts
+            ))
+        db.add_all(objs)
+        db.flush()  # one batched INSERT, ids come back for the payment rows
+        for (_, _, _, inv), obj in zip(new_invoices, objs):
+            inv["id"] = obj.id
+
+    results, payments, touched = [], [], {}
+    for item, plan in zip(items, plans):
+        allocations = []
+        for step in plan:
+            inv = step["invoice"]
+            if not inv.get("new"):
+                touched[inv["id"]] = inv
+            payments.append({
+                "house_id": item["house_id"], "invoice_id": inv["id"], "tenant_id": item["tenant_id"],
+                "method": item["method"], "amount": step["applied"], "tx_ref": item["tx_ref"],
+                "mpesa_msisdn": item["msisdn"], "target_year": step["year"], "target_month": step["month"],
+                "paid_at": item.get("paid_at") or ts, "status": "confirmed", "notes": None
+            })
+            allocations.append({
+                "year": step["year"],
+                "month": step["month"],
+                "applied": step["applied"],
+                "status_after": step["status_after"],
+                "remaining_balance": max(step["amount_due"] - step["paid_after"], 0),
+                "invoice_id": inv["id"]
+            })
+        results.append(allocations)
+    if payments:
+        db.execute(insert(Payment), payments)
+    if touched:
+        # houses are locked, so the totals computed here are current
+        db.execute(update(Invoice), [{
+            "id": i, "paid_total": inv["paid"], "balance": invoice_balance(inv["amount_due"], inv["paid"]),
+            "status": invoice_status(inv["amount_due"], inv["paid"], inv["status"])
+        } for i, inv in touched.items()])
+    # back-dated payments and invoices for past months change closed periods
+    changed = {}
+    for item in items:
+        if item.get("paid_at"):
+            changed[item["house_id"]] = min(changed.get(item["house_id"], item["paid_at"].date()), item["paid_at"].date())
+    for house_id, year, month, _ in new_invoices:
+        changed[house_id] = min(changed.get(house_id, date(year, month, 1)), date(year, month, 1))
+    period_close.reclose(db, changed)
+    return results
+
+def receipt_message(house_number: int, tenant_name: str, allocations: list, tx_ref: str | None, ts):
     summary = ", ".join([f"{a['year']}-{str(a['month']).zfill(2)}: KES {a['applied']}" for a in allocations])
-    msg = (
-        f"Murithi's Homes: Payment for House {house.number}.\n"
-        f"Payer: {tenant.full_name}\n"
+    return (
+        f"Murithi's Homes: Payment for House {house_number}.\n"
+        f"Payer: {tenant_name}\n"
         f"Allocations: {summary}\n"
         f"Ref: {tx_ref or 'N/A'}\n"
-        f"Time: {now_ts().strftime('%Y-%m-%d %H:%M:%S')}"
+        f"Time: {ts.strftime('%Y-%m-%d %H:%M:%S')}"
     )
+
+def allocate_payment(db: Session, house_id: int, tenant_id: int, method: str, amount: int, start_year: int, start_month: int, tx_ref: str | None, msisdn: str | None, attempts: int = 3):
+    # One transaction per payment; a unique-constraint clash on a new invoice (a concurrent
+    # payment created the same month first) rolls back and re-plans against the winner's rows.
+    for attempt in range(attempts):
+        try:
+            ts = now_ts()
+            allocations = allocate_payment_tx(db, house_id, tenant_id, method, amount, start_year, start_month, tx_ref, msisdn, ts)
+            db.commit()
+            cache.bump()
+            publish_payments([{
+                "house_id": house_id, "tenant_id": tenant_id, "method": method, "amount": amount, "tx_ref": tx_ref
+            }], [allocations], ts)
+            return allocations
+        except IntegrityError:
+            db.rollback()
+            if attempt == attempts - 1:
+                raise
+        except Exception:
+            db.rollback()
+            raise
+
+def allocate_payment_tx(db: Session, house_id: int, tenant_id: int, method: str, amount: int, start_year: int, start_month: int, tx_ref: str | None, msisdn: str | None, ts=None):
+    # Does not commit: callers own the transaction
+    if amount <= 0:
+        raise ValueError("Amount must be positive")
+    # verify tenant-house relation
+    rel = db.query(HouseTenant).filter(HouseTenant.house_id == house_id, HouseTenant.tenant_id == tenant_id, HouseTenant.status == "active").first()
+    if not rel:
+        raise ValueError("Tenant is not assigned to this house")
+
+    houses = lock_houses(db, [house_id])
+    house = houses[house_id]
+    if house.monthly_rent <= 0:
+        raise ValueError("House has no rent to allocate against")
+
+    ts = ts or now_ts()
+    item = {
+        "house_id": house_id, "tenant_id": tenant_id, "method": method, "amount": amount,
+        "start_year": start_year, "start_month": start_month, "tx_ref": tx_ref, "msisdn": msisdn
+    }
+    allocations = allocate_batch(db, [item], houses, ts)[0]
+
+    # Combined receipt message, queued for the SMS dispatcher
+    tenant = db.query(Tenant).get(tenant_id)
+    msg = receipt_message(house.number, tenant.full_name, allocations, tx_ref, ts)
     save_notification(db, tenant_id, msg, "receipt", f"house:{house_id}")
 
     return allocations
 
+def reverse_payment(db: Session, payment_id: int):
+    # Marks a confirmed payment reversed and takes its amount back off its invoice in the
+    # same transaction. Returns None if there is no such payment.
+    pay = db.query(Payment).get(payment_id)
+    if pay is None:
+        return None
+    # allocate_batch writes absolute totals for the invoices it read under this lock
+    lock_houses(db, [pay.house_id])
+    flipped = db.execute(update(Payment).where(Payment.id == payment_id, Payment.status == "confirmed").values(
+        status="reversed"
+    ).execution_options(synchronize_session=False)).rowcount
+    if not flipped:
+        db.rollback()
+        raise ValueError("Payment is not confirmed")
+    if pay.invoice_id is not None:
+        add_to_invoice(db, pay.invoice_id, -pay.amount)
+    period_close.reclose(db, {pay.house_id: pay.paid_at.date()})
+    db.commit()
+    cache.bump()
+    publish_change("payment_reversed", [pay.house_id], payment={"id": payment_id, "invoice_id": pay.invoice_id, "amount": pay.amount})
+    return {"id": payment_id, "status": "reversed", "invoice_id": pay.invoice_id}
+
 def save_notification(db: Session, tenant_id: int, msg: str, type_: str, ref_entity: str | None):
-    # Stub: saves to notifications; replace with actual SMS provider integration
+    # Queues an SMS in the outbox; notifications.py sends it after the commit.
+    # Added to the caller's transaction, not committed here.
+    ts = now_ts()
     notif = Notification(
         tenant_id=tenant_id,
         type=type_,
         channel="sms",
         message=msg,
-        status="sent",
+        status="queued",
         ref_entity=ref_entity,
-        sent_at=now_ts()
+        attempts=0,
+        next_attempt_at=ts,
+        created_at=ts
     )
     db.add(notif)
-    db.commit()
     return notif
 
-def house_total_received(db: Session, house_id: int):
-    return sum(p.amount for p in db.query(Payment).filter(Payment.house_id == house_id, Payment.status == "confirmed").all())
+def day_start(d: date):
+    return datetime.combine(d, time.min)
+
+def received_between(db: Session, start: date, end: date | None = None):
+    # confirmed payments with paid_at in [start, end); open-ended when end is None
+    q = db.query(func.coalesce(func.sum(Payment.amount), 0)).filter(Payment.status == "confirmed", Payment.paid_at >= day_start(start))
+    if end is not None:
+        q = q.filter(Payment.paid_at < day_start(end))
+    return int(q.scalar())
+
+def received_by_month(db: Session, start: date, end: date):
+    # {(year, month): received} for confirmed payments with paid_at in [start, end)
+    y = extract("year", Payment.paid_at)
+    m = extract("month", Payment.paid_at)
+    rows = db.query(y, m, func.sum(Payment.amount)).filter(
+        Payment.status == "confirmed",
+        Payment.paid_at >= day_start(start),
+        Payment.paid_at < day_start(end)
+    ).group_by(y, m).all()
+    return {(int(r[0]), int(r[1])): int(r[2]) for r in rows}
+
+def received_by_house(db: Session, since: date, active_only: bool = True):
+    # one row per house (including houses with nothing received) in id order
+    q = db.query(House.id, House.number, House.monthly_rent, func.coalesce(func.sum(Payment.amount), 0)).outerjoin(
+        Payment, and_(Payment.house_id == House.id, Payment.status == "confirmed", Payment.paid_at >= day_start(since))
+    )
+    if active_only:
+        q = q.filter(House.is_active == True)
+    rows = q.group_by(House.id, House.number, House.monthly_rent).order_by(House.id.asc()).all()
+    return [{"id": r[0], "number": r[1], "monthly_rent": r[2], "received": int(r[3])} for r in rows]
+
+RECENT_PAYMENTS = 10
+
+def recent_payments(db: Session, limit: int = RECENT_PAYMENTS):
+    rows = db.query(Payment, House.number, Tenant.full_name).join(House, House.id == Payment.house_id).join(
+        Tenant, Tenant.id == Payment.tenant_id
+    ).order_by(Payment.paid_at.desc()).limit(limit).all()
+    return [{
+        "house_number": number, "tenant_name": name,
+        "amount": p.amount, "method": p.method,
+        "paid_at": p.paid_at.strftime("%Y-%m-%d %H:%M:%S"),
+        "for_month": f"{p.target_year}-{str(p.target_month).zfill(2)}"
+    } for p, number, name in rows]
+
+def month_totals(db: Session, today: date):
+    # The dashboard's month-to-date figures (GET /stats, and every change event that
+    # touches houses or payments)
+    start = today.replace(day=1)
+    houses = received_by_house(db, start)
+    expected = sum(h["monthly_rent"] for h in houses)
+    received = received_between(db, start)
+    house_sums = [{"house_number": h["number"], "received": h["received"]} for h in houses]
+    return {
+        "units": len(houses),
+        "expected": expected,
+        "received": received,
+        "outstanding": max(expected - received, 0),
+        "top_houses": sorted(house_sums, key=lambda x: x["received"], reverse=True)[:3]
+    }
+
+def load_house_summaries(db: Session, today: date, house_ids=None):
+    # Batched loader behind GET /houses: a fixed number of queries for any number of houses.
+    # house_ids limits it to those houses (change events carry their entries).
+    year = today.year
+    q = db.query(House)
+    if house_ids is not None:
+        q = q.filter(House.id.in_(house_ids))
+    houses = q.order_by(House.number.asc()).all()
+    ids = [h.id for h in houses] if house_ids is not None else None
+
+    tenants_by_house = {}
+    q = db.query(HouseTenant.house_id, Tenant).join(Tenant, Tenant.id == HouseTenant.tenant_id).filter(
+        HouseTenant.status == "active"
+    )
+    if ids is not None:
+        q = q.filter(HouseTenant.house_id.in_(ids))
+    for house_id, t in q.order_by(HouseTenant.id.asc()).all():
+        tenants_by_house.setdefault(house_id, []).append(
+            {"id": t.id, "full_name": t.full_name, "phone": t.phone, "gov_id": t.gov_id, "email": t.email}
+        )
+
+    q = db.query(Payment.house_id, func.sum(Payment.amount)).filter(Payment.status == "confirmed")
+    if ids is not None:
+        q = q.filter(Payment.house_id.in_(ids))
+    totals = dict(q.group_by(Payment.house_id).all())
+
+    today_by_house = {}
+    q = db.query(Payment.house_id, Payment.amount, Tenant.full_name).join(Tenant, Tenant.id == Payment.tenant_id).filter(
+        Payment.status == "confirmed",
+        Payment.paid_at >= day_start(today),
+        Payment.paid_at < day_start(date.fromordinal(today.toordinal() + 1))
+    )
+    if ids is not None:
+        q = q.filter(Payment.house_id.in_(ids))
+    for house_id, amount, name in q.order_by(Payment.id.asc()).all():
+        entry = today_by_house.setdefault(house_id, {"received": 0, "names": []})
+        entry["received"] += amount
+        entry["names"].append(name)
+
+    # month -> (amount_due, paid_total) for this year's invoices, first invoice per month wins
+    invoices_by_house = {}
+    q = db.query(Invoice.house_id, Invoice.period_start, Invoice.amount_due, Invoice.paid_total).filter(
+        Invoice.period_start >= date(year, 1, 1),
+        Invoice.period_start <= date(year, 12, 31)
+    )
+    if ids is not None:
+        q = q.filter(Invoice.house_id.in_(ids))
+    for house_id, period_start, amount_due, paid_total in q.order_by(Invoice.id.asc()).all():
+        invoices_by_house.setdefault(house_id, {}).setdefault(period_start.month, (amount_due, paid_total))
+
+    # owed to date over all years (negative: in credit), from the latest period close
+    balances, _ = period_close.balances_as_of(db, today, house_ids=ids)
+
+    out = []
+    for h in houses:
+        tenants = tenants_by_house.get(h.id, [])
+        today_entry = today_by_house.get(h.id, {"received": 0, "names": []})
+        paid_names = today_entry["names"]
+        unpaid_names = [x["full_name"] for x in tenants if x["full_name"] not in paid_names]
+        months = invoices_by_house.get(h.id, {})
+        unpaid_months = [m for m in range(1, 13) if m not in months or months[m][1] < months[m][0]]
+        charged, paid = balances.get((h.id, None), (0, 0))
+        out.append({
+            "id": h.id, "number": h.number, "type": h.type,
+            "monthly_rent": h.monthly_rent, "tenants": tenants,
+            "total_received": int(totals.get(h.id) or 0),
+            "today_received": today_entry["received"],
+            "today_paid": paid_names,
+            "today_unpaid": unpaid_names,
+            "unpaid_months_year": year,
+            "unpaid_months": unpaid_months,
+            "balance": charged - paid
+        })
+    return out
+
+def load_tenant_rows(db: Session, tenant_ids=None):
+    # GET /tenants: every assignment row (oldest first), then tenants that were never
+    # assigned; tenant_ids limits it to those tenants
+    q = db.query(Tenant, HouseTenant, House.number).outerjoin(
+        HouseTenant, HouseTenant.tenant_id == Tenant.id
+    ).outerjoin(House, House.id == HouseTenant.house_id)
+    if tenant_ids is not None:
+        q = q.filter(Tenant.id.in_(tenant_ids))
+    rows = q.order_by(HouseTenant.id.is_(None), HouseTenant.id.asc(), Tenant.id.asc()).all()
+    merged = []
+    for t, rel, number in rows:
+        merged.append({
+            "id": t.id,
+            "full_name": t.full_name,
+            "phone": t.phone,
+            "gov_id": t.gov_id,
+            "email": t.email,
+            "status": rel.status if rel else "unassigned",
+            "house_number": number,
+            "start_date": rel.start_date.isoformat() if rel else None,
+            "end_date": rel.end_date.isoformat() if rel and rel.end_date else None
+        })
+    return merged
+
+def publish_change(type_: str, house_ids=(), tenant_ids=(), **fields):
+    # Change event for /events subscribers, sent after the commit: the affected houses'
+    # GET /houses entries and the dashboard totals, the affected tenants' GET /tenants
+    # rows, plus `fields`. Built only when someone is listening.
+    def build():
+        today = today_date()
+        data = dict(fields)
+        with SessionLocal() as db:
+            if house_ids:
+                data["houses"] = load_house_summaries(db, today, sorted(set(house_ids)))
+                data["totals"] = month_totals(db, today)
+            if tenant_ids:
+                data["tenants"] = load_tenant_rows(db, sorted(set(tenant_ids)))
+        return data
+    events.hub.publish(type_, build)
+
+def publish_payments(items: list, allocations: list, ts):
+    # 'payment' event for allocated items (allocate_batch's input and output): each
+    # payment with its month allocations, newest RECENT_PAYMENTS only, as the
+    # dashboard's recent list shows no more
+    def build():
+        today = today_date()
+        with SessionLocal() as db:
+            houses = load_house_summaries(db, today, sorted({i["house_id"] for i in items}))
+            numbers = {h["id"]: h["number"] for h in houses}
+            names = dict(db.query(Tenant.id, Tenant.full_name).filter(Tenant.id.in_({i["tenant_id"] for i in items})).all())
+            totals = month_totals(db, today)
+        payments = [{
+            "house_id": item["house_id"], "house_number": numbers.get(item["house_id"]),
+            "tenant_id": item["tenant_id"], "tenant_name": names.get(item["tenant_id"]),
+            "method": item["method"], "amount": item["amount"], "tx_ref": item["tx_ref"],
+            "paid_at": (item.get("paid_at") or ts).strftime("%Y-%m-%d %H:%M:%S"),
+            "allocations": allocs
+        } for item, allocs in zip(items, allocations)]
+        payments.sort(key=lambda p: p["paid_at"], reverse=True)
+        return {
+            "payments": payments[:RECENT_PAYMENTS], "payment_count": len(payments),
+            "houses": houses, "totals": totals
+        }
+    events.hub.publish("payment", build)
+
+def encode_cursor(paid_at: datetime, payment_id: int):
+    return base64.urlsafe_b64encode(f"{paid_at.isoformat()}|{payment_id}".encode()).decode()
+
+def decode_cursor(cursor: str):
+    try:
+        paid_at, payment_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(paid_at), int(payment_id)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid cursor")
+
+def list_payments(db: Session, limit: int = 50, cursor: str | None = None, house_id: int | None = None,
+                  tenant_id: int | None = None, method: str | None = None, status: str | None = None,
+                  date_from: date | None = None, date_to: date | None = None):
+    # Newest first, keyset-paginated on (paid_at, id): every page is an index range
+    # scan that starts where the previous one stopped, however deep the page.
+    q = db.query(Payment, House.number, Tenant.full_name).join(House, House.id == Payment.house_id).join(
+        Tenant, Tenant.id == Payment.tenant_id
+    )
+    if house_id is not None:
+        q = q.filter(Payment.house_id == house_id)
+    if tenant_id is not None:
+        q = q.filter(Payment.tenant_id == tenant_id)
+    if method is not None:
+        q = q.filter(Payment.method == method)
+    if status is not None:
+        q = q.filter(Payment.status == status)
+    if date_from is not None:
+        q = q.filter(Payment.paid_at >= day_start(date_from))
+    if date_to is not None:
+        q = q.filter(Payment.paid_at < day_start(date.fromordinal(date_to.toordinal() + 1)))
+    if cursor:
+        q = q.filter(tuple_(Payment.paid_at, Payment.id) < tuple_(*decode_cursor(cursor)))
+    rows = q.order_by(Payment.paid_at.desc(), Payment.id.desc()).limit(limit + 1).all()
+
+    items = [{
+        "id": p.id, "invoice_id": p.invoice_id,
+        "house_id": p.house_id, "house_number": number,
+        "tenant_id": p.tenant_id, "tenant_name": name,
+        "amount": p.amount, "method": p.method, "status": p.status,
+        "tx_ref": p.tx_ref, "mpesa_msisdn": p.mpesa_msisdn,
+        "paid_at": p.paid_at.strftime("%Y-%m-%d %H:%M:%S"),
+        "for_month": f"{p.target_year}-{str(p.target_month).zfill(2)}"
+    } for p, number, name in rows[:limit]]
+    next_cursor = encode_cursor(rows[limit - 1][0].paid_at, rows[limit - 1][0].id) if len(rows) > limit else None
+    return {"items": items, "next_cursor": next_cursor}
@@ -0,0 +1,120 @@
+import re
+from threading import Lock
+from sqlalchemy import func, case, or_, select, literal
+from sqlalchemy.orm import Session
+from models import House, Tenant, HouseTenant
+from utils import normalize_phone
+
+# Server-side tenant search (GET /tenants/search). One query matches gov_id exactly,
+# the phone on its normalized 2547... form by prefix, and full_name by prefix or
+# substring, ranks the hits and joins in the tenant's current house.
+#
+# On Postgres the name match is a LIKE '%q%' on lower(full_name), served by the
+# pg_trgm GIN index from migration 0004. SQLite has no such index, so a trigram index
+# over the names is kept in process; it narrows the name match to an id list. Names
+# are never edited, so the index is current while the tenant count and highest id are
+# unchanged, whichever process wrote; new tenants are added to it, anything else (rows
+# removed, a reseed) rebuilds it. Queries too short for a trigram, and names so common
+# that the id list would pass INDEX_MAX_IDS, fall back to a LIKE scan.
+
+PHONE_QUERY = re.compile(r"^\+?[\d\s-]{3,}$")
+INDEX_MAX_IDS = 500
+
+def trigrams(text: str):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def inner_trigrams(text: str):
+    # without the padding-only edges, which any name would match
+    return [g for g in trigrams(text) if g.strip() == g]
+
+class TenantIndex:
+    def __init__(self):
+        self.lock = Lock()
+        self.key = None  # (tenant count, highest tenant id) the index reflects
+        self.names = {}  # tenant id -> lower(full_name)
+        self.postings = {}  # trigram -> set of tenant ids
+
+    def refresh(self, db: Session):
+        count, top = db.query(func.count(Tenant.id), func.max(Tenant.id)).one()
+        with self.lock:
+            if self.key == (count, top):
+                return
+            if self.key is not None and (top or 0) > (self.key[1] or 0):
+                added = db.query(Tenant.id, Tenant.full_name).filter(Tenant.id > (self.key[1] or 0)).all()
+                if self.key[0] + len(added) == count:
+                    self.add(added)
+                    self.key = (count, top)
+                    return
+            self.names, self.postings = {}, {}
+            self.add(db.query(Tenant.id, Tenant.full_name).all())
+            self.key = (count, top)
+
+    def add(self, rows):
+        for tid, name in rows:
+            self.names[tid] = name.lower()
+            for g in trigrams(self.names[tid]):
+                self.postings.setdefault(g, set()).add(tid)
+
+    def matching(self, q: str):
+        # ids whose lowercased name contains q; q must have inner trigrams
+        with self.lock:
+            candidates = set.intersection(*(self.postings.get(g, set()) for g in inner_trigrams(q)))
+            return [tid for tid in candidates if q in self.names[tid]]
+
+tenant_index = TenantIndex()
+
+def escape_like(q: str):
+    return q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def phone_prefix_range(digits: str):
+    # [lo, hi) covering every digit string that starts with `digits`
+    return digits, digits[:-1] + chr(ord(digits[-1]) + 1)
+
+def current_house_number():
+    return select(func.min(House.number)).join(HouseTenant, HouseTenant.house_id == House.id).where(
+        HouseTenant.tenant_id == Tenant.id,
+        HouseTenant.status == "active"
+    ).correlate(Tenant).scalar_subquery()
+
+def search_tenants(db: Session, q: str, limit: int = 20, offset: int = 0):
+    q = q.strip()
+    name = q.lower()
+    lowered = func.lower(Tenant.full_name)
+    conditions = [Tenant.gov_id == q]
+    ranks = [(Tenant.gov_id == q, 0)]
+
+    phone = normalize_phone(q) if PHONE_QUERY.match(q) else ""
+    if phone:
+        lo, hi = phone_prefix_range(phone)
+        by_phone = (Tenant.phone_normalized >= lo) & (Tenant.phone_normalized < hi)
+        conditions.append(by_phone)
+        ranks.append((by_phone, 1))
+
+    ids = None
+    if db.get_bind().dialect.name != "postgresql" and inner_trigrams(name):
+        tenant_index.refresh(db)
+        ids = tenant_index.matching(name)
+    if ids is None or len(ids) > INDEX_MAX_IDS:
+        conditions.append(lowered.like(f"%{escape_like(name)}%", escape="\\"))
+    elif ids:
+        conditions.append(Tenant.id.in_(ids))
+    ranks.append((lowered.like(f"{escape_like(name)}%", escape="\\"), 2))
+
+    house_number = current_house_number().label("house_number")
+    rank = case(*ranks, else_=literal(3)).label("rank")
+    rows = db.query(Tenant, house_number, rank).filter(or_(*conditions)).order_by(
+        rank, Tenant.full_name.asc(), Tenant.id.asc()
+    ).limit(limit + 1).offset(offset).all()
+
+    items = [{
+        "id": t.id,
+        "full_name": t.full_name,
+        "phone": t.phone,
+        "gov_id": t.gov_id,
+        "email": t.email,
+        "is_active": t.is_active,
+        "status": "active" if number is not None else "unassigned",
+        "house_number": number,
+    } for t, number, _ in rows[:limit]]
+    return {"items": items, "limit": limit, "offset": offset, "has_more": len(rows) > limit}
@@ -0,0 +1,32 @@
+import os
+import sys
+import tempfile
+
+# The backend's modules import each other top-level, and read their settings from
+# the environment at import or first use
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/tests.db"
+os.environ["SCHEDULER_ENABLED"] = "0"
+os.environ["DB_ASYNC"] = "0"
+os.environ["RESPONSE_CACHE_SIZE"] = "0"
+os.environ["MPESA_CALLBACK_TOKEN"] = "test-token"
+
+import pytest
+from fastapi.testclient import TestClient
+from base import Base, get_engine
+import main
+import seed
+
+@pytest.fixture
+def estate():
+    # A fresh synthetic estate: 10 houses, one tenant each (phones +2547000000NN)
+    engine = get_engine()
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    seed.generate(10, 1, 1, seed=7)
+    return engine
+
+@pytest.fixture
+def client(estate):
+    with TestClient(main.app) as c:
+        yield c
@@ -0,0 +1,44 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+import pytest
+from base import SessionLocal
+from models import HouseTenant, House
+import main
+from utils import today_date
+
+# The DB_ASYNC=1 routes over sqlite+aiosqlite. DB_ASYNC is read at import, so rather than
+# reloading main these mount its async_router on an app of their own, with main's lifespan
+# (which disposes the async engine, bound to the test client's event loop, on exit).
+
+@pytest.fixture
+def async_client(estate):
+    app = FastAPI(lifespan=main.lifespan)
+    app.include_router(main.async_router)
+    with TestClient(app) as c:
+        yield c
+
+def test_async_reads_match_sync(client, async_client):
+    year = today_date().year
+    for path in ("/stats", "/houses", "/tenants", "/tenants/search?q=2547", "/houses/1/balance",
+                 "/reports/arrears", f"/houses/1/ledger/{year}", f"/ledger/{year}?details=true", "/payments?limit=5"):
+        r = async_client.get(path)
+        assert r.status_code == 200, path
+        assert r.json() == client.get(path).json(), path
+
+def test_async_payment(async_client):
+    db = SessionLocal()
+    try:
+        house_id, tenant_id, rent = db.query(HouseTenant.house_id, HouseTenant.tenant_id, House.monthly_rent).join(
+            House, House.id == HouseTenant.house_id
+        ).filter(HouseTenant.status == "active", House.monthly_rent > 0).order_by(HouseTenant.id).first()
+    finally:
+        db.close()
+    ny, nm = today_date().year + 1, 1
+    r = async_client.post("/payments", json={
+        "house_id": house_id, "tenant_id": tenant_id, "method": "cash", "amount": rent + 1,
+        "target_year": ny, "target_month": nm
+    })
+    assert r.status_code == 200
+    assert [(a["year"], a["month"], a["applied"]) for a in r.json()["allocations"]] == [(ny, 1, rent), (ny, 2, 1)]
+    listed = async_client.get(f"/payments?house_id={house_id}&limit=2").json()["items"]
+    assert sorted(p["amount"] for p in listed) == [1, rent]
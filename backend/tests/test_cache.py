@@ -0,0 +1,20 @@
+from cache import ResponseCache, response_cache
+from utils import today_date
+
+def test_etag_differs_across_processes():
+    # two caches stand in for two workers, or one process before and after a restart
+    a, b = ResponseCache(8), ResponseCache(8)
+    assert a.etag("/houses", 0) == a.etag("/houses", 0)
+    assert a.etag("/houses", 0) != b.etag("/houses", 0)
+    assert a.etag("/houses", 0) != a.etag("/houses", 1)
+
+def test_stale_tag_is_not_answered_with_304(client):
+    response_cache.max_entries = 8
+    try:
+        first = client.get("/houses")
+        assert first.status_code == 200
+        assert client.get("/houses", headers={"If-None-Match": first.headers["etag"]}).status_code == 304
+        restarted = ResponseCache(8).etag(("houses", today_date()), response_cache.version)
+        assert client.get("/houses", headers={"If-None-Match": restarted}).status_code == 200
+    finally:
+        response_cache.max_entries = 0
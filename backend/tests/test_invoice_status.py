@@ -0,0 +1,73 @@
+import json
+from sqlalchemy import update, delete
+from base import SessionLocal
+from models import Invoice, Payment, HouseTenant, House
+import invoice_totals
+from utils import today_date
+
+def overdue_invoice(n: int):
+    # The n-th assigned house's invoice for this month, reset to unpaid and overdue
+    db = SessionLocal()
+    try:
+        house_id, tenant_id, rent = db.query(HouseTenant.house_id, HouseTenant.tenant_id, House.monthly_rent).join(
+            House, House.id == HouseTenant.house_id
+        ).filter(HouseTenant.status == "active", House.monthly_rent > 0).order_by(HouseTenant.id).offset(n).first()
+        start = today_date().replace(day=1)
+        invoice_id = db.query(Invoice.id).filter(Invoice.house_id == house_id, Invoice.period_start == start).scalar()
+        db.execute(delete(Payment).where(Payment.invoice_id == invoice_id))
+        db.execute(update(Invoice).where(Invoice.id == invoice_id).values(paid_total=0, balance=Invoice.amount_due, status="overdue"))
+        db.commit()
+        return house_id, tenant_id, rent, invoice_id
+    finally:
+        db.close()
+
+def status_of(invoice_id: int):
+    db = SessionLocal()
+    try:
+        return db.query(Invoice.status).filter(Invoice.id == invoice_id).scalar()
+    finally:
+        db.close()
+
+def payment(house_id: int, tenant_id: int, amount: int):
+    today = today_date()
+    return {"house_id": house_id, "tenant_id": tenant_id, "method": "cash", "amount": amount,
+            "target_year": today.year, "target_month": today.month}
+
+def test_partial_payment_keeps_overdue_on_every_path(client):
+    house_id, tenant_id, rent, invoice_id = overdue_invoice(0)
+    assert client.post("/payments", json=payment(house_id, tenant_id, rent // 2)).status_code == 200
+    assert status_of(invoice_id) == "overdue"
+
+    house_id, tenant_id, rent, invoice_id = overdue_invoice(1)
+    r = client.post("/payments/bulk?format=ndjson", content=json.dumps(payment(house_id, tenant_id, rent // 2)) + "\n")
+    assert json.loads(r.text.splitlines()[-1])["summary"]["imported"] == 1
+    assert status_of(invoice_id) == "overdue"
+
+    house_id, tenant_id, rent, invoice_id = overdue_invoice(2)
+    db = SessionLocal()
+    try:
+        db.add(Payment(house_id=house_id, invoice_id=invoice_id, tenant_id=tenant_id, method="cash", amount=rent // 2,
+                       target_year=today_date().year, target_month=today_date().month, paid_at=today_date(), status="confirmed"))
+        db.commit()
+        assert invoice_totals.repair(db) == 1
+        db.commit()
+    finally:
+        db.close()
+    assert status_of(invoice_id) == "overdue"
+
+def test_full_payment_clears_overdue(client):
+    house_id, tenant_id, rent, invoice_id = overdue_invoice(0)
+    assert client.post("/payments", json=payment(house_id, tenant_id, rent)).status_code == 200
+    assert status_of(invoice_id) == "paid"
+
+def test_reversal_takes_the_amount_back_off_the_invoice(client):
+    house_id, tenant_id, rent, invoice_id = overdue_invoice(0)
+    assert client.post("/payments", json=payment(house_id, tenant_id, rent)).status_code == 200
+    payment_id = client.get(f"/payments?house_id={house_id}").json()["items"][0]["id"]
+    assert client.post(f"/payments/{payment_id}/reverse").status_code == 200
+    db = SessionLocal()
+    try:
+        inv = db.query(Invoice).get(invoice_id)
+        assert (inv.paid_total, inv.balance, inv.status) == (0, rent, "pending")
+    finally:
+        db.close()
@@ -0,0 +1,36 @@
+from sqlalchemy import event
+from base import SessionLocal
+from models import Payment
+from utils import today_date
+
+def test_estate_details_bind_a_fixed_number_of_parameters(client, estate):
+    bound = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        bound.append(len(parameters))
+
+    year = today_date().year
+    event.listen(estate, "before_cursor_execute", count)
+    try:
+        r = client.get(f"/ledger?from_year={year - 1}&to_year={year}&details=true")
+    finally:
+        event.remove(estate, "before_cursor_execute", count)
+    assert r.status_code == 200
+    # one per house or invoice would be 10 and more here
+    assert max(bound) < 10
+
+    details = {}
+    for row in r.json()["houses"]:
+        for cell in row["items"]:
+            for d in cell["details"]:
+                details.setdefault(row["house_id"], []).append(d["amount"])
+    db = SessionLocal()
+    try:
+        expected = {}
+        for house_id, amount in db.query(Payment.house_id, Payment.amount).filter(
+            Payment.status == "confirmed", Payment.target_year >= year - 1, Payment.target_year <= year
+        ).order_by(Payment.id):
+            expected.setdefault(house_id, []).append(amount)
+    finally:
+        db.close()
+    assert {h: sorted(a) for h, a in details.items()} == {h: sorted(a) for h, a in expected.items()}
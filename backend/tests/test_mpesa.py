@@ -0,0 +1,99 @@
+from datetime import datetime
+from sqlalchemy import func
+from base import SessionLocal
+from models import MpesaCallback, Payment, Tenant, HouseTenant
+import mpesa
+
+URL = "/mpesa/c2b/confirmation?token=test-token"
+
+def confirmation(tx_ref: str, msisdn: str, amount: int = 1000):
+    return {
+        "TransactionType": "Pay Bill", "TransID": tx_ref, "TransTime": datetime.now().strftime("%Y%m%d%H%M%S"),
+        "TransAmount": str(amount), "BusinessShortCode": "600000", "BillRefNumber": "", "MSISDN": msisdn,
+        "FirstName": "Test", "MiddleName": "", "LastName": "Payer",
+    }
+
+def payers(n: int):
+    db = SessionLocal()
+    try:
+        return [phone.lstrip("+") for phone, in db.query(Tenant.phone).join(HouseTenant, HouseTenant.tenant_id == Tenant.id).filter(
+            HouseTenant.status == "active"
+        ).order_by(Tenant.id).limit(n).all()]
+    finally:
+        db.close()
+
+def callbacks():
+    db = SessionLocal()
+    try:
+        return {cb.tx_ref: (cb.status, cb.last_error) for cb in db.query(MpesaCallback).all()}
+    finally:
+        db.close()
+
+def payment_count(tx_ref: str):
+    db = SessionLocal()
+    try:
+        return db.query(func.count(Payment.id)).filter(Payment.tx_ref == tx_ref).scalar()
+    finally:
+        db.close()
+
+def test_confirmation_is_staged_and_acknowledged(client):
+    r = client.post(URL, json=confirmation("ACK0001", payers(1)[0]))
+    assert r.status_code == 200
+    assert r.json()["ResultCode"] == 0
+    # acknowledged means committed: the row is there before any worker runs
+    assert callbacks() == {"ACK0001": ("staged", None)}
+    assert payment_count("ACK0001") == 0
+
+def test_confirmation_needs_the_token(client, monkeypatch):
+    assert client.post("/mpesa/c2b/confirmation?token=wrong", json=confirmation("TOK0001", payers(1)[0])).status_code == 403
+    monkeypatch.delenv("MPESA_CALLBACK_TOKEN")
+    assert client.post("/mpesa/c2b/confirmation", json=confirmation("TOK0002", payers(1)[0])).status_code == 403
+    monkeypatch.setenv("MPESA_ALLOW_UNAUTHENTICATED", "1")
+    assert client.post("/mpesa/c2b/confirmation", json=confirmation("TOK0003", payers(1)[0])).status_code == 200
+    assert set(callbacks()) == {"TOK0003"}
+
+def test_invalid_confirmation_is_rejected(client):
+    body = confirmation("BAD0001", payers(1)[0], amount=0)
+    r = client.post(URL, json=body)
+    assert r.status_code == 400
+    assert r.json()["ResultCode"] == 1
+    assert callbacks() == {}
+
+def test_replayed_confirmation_is_paid_once(client):
+    body = confirmation("RPL0001", payers(1)[0])
+    for _ in range(3):
+        assert client.post(URL, json=body).json()["ResultCode"] == 0
+    assert len(callbacks()) == 1
+    assert client.post("/admin/mpesa/process").json()["allocated"] == 1
+    # a retry after allocation is acknowledged again and changes nothing
+    assert client.post(URL, json=body).json()["ResultCode"] == 0
+    assert client.post("/admin/mpesa/process").json()["claimed"] == 0
+    assert callbacks() == {"RPL0001": ("allocated", None)}
+    assert payment_count("RPL0001") >= 1
+    db = SessionLocal()
+    try:
+        assert db.query(func.sum(Payment.amount)).filter(Payment.tx_ref == "RPL0001").scalar() == 1000
+    finally:
+        db.close()
+
+def test_failing_callback_does_not_block_the_queue(client, monkeypatch):
+    phones = payers(3)
+    for i, phone in enumerate(phones):
+        client.post(URL, json=confirmation(f"PSN000{i}", phone))
+    allocate_batch = mpesa.allocate_batch
+
+    def poisoned(db, items, houses, ts):
+        if any(i["tx_ref"] == "PSN0001" for i in items):
+            raise RuntimeError("poisoned row")
+        return allocate_batch(db, items, houses, ts)
+
+    monkeypatch.setattr(mpesa, "allocate_batch", poisoned)
+    totals = client.post("/admin/mpesa/process").json()
+    assert (totals["claimed"], totals["allocated"], totals["failed"]) == (3, 2, 1)
+    status = callbacks()
+    assert status["PSN0000"] == ("allocated", None)
+    assert status["PSN0002"] == ("allocated", None)
+    assert status["PSN0001"] == ("failed", "RuntimeError: poisoned row")
+    assert payment_count("PSN0001") == 0
+    # nothing is left staged, so the next run does not pick the bad row up again
+    assert client.post("/admin/mpesa/process").json()["claimed"] == 0
@@ -0,0 +1,137 @@
+import asyncio
+from datetime import timedelta
+import pytest
+from sqlalchemy import update
+from base import SessionLocal
+from models import Tenant, Notification
+import notifications
+from services import save_notification
+from utils import now_ts
+
+class LoopBoundProvider(notifications.SmsProvider):
+    # Like an async HTTP client: bound to the loop it was first used on
+    def __init__(self):
+        self.loop = None
+        self.sent = 0
+
+    async def send(self, phone: str, message: str):
+        loop = asyncio.get_running_loop()
+        if self.loop is None:
+            self.loop = loop
+        if loop is not self.loop:
+            raise RuntimeError("used on a second event loop")
+        self.sent += 1
+
+def test_provider_is_abstract():
+    with pytest.raises(TypeError):
+        notifications.SmsProvider()
+
+def test_batches_share_one_loop(client):
+    db = SessionLocal()
+    try:
+        tenant_ids = [t for t, in db.query(Tenant.id).order_by(Tenant.id).limit(5).all()]
+        for tenant_id in tenant_ids:
+            save_notification(db, tenant_id, "Receipt", "receipt", "test")
+        db.commit()
+    finally:
+        db.close()
+    queued = len(tenant_ids)
+    provider = LoopBoundProvider()
+    totals = notifications.dispatch_pending(provider, batch_size=2)
+    assert totals["failed"] == totals["retrying"] == 0
+    assert totals["sent"] == provider.sent == queued == 5
+    # a later run reuses the same loop too
+    for _ in range(2):
+        notifications.send_loop.run(provider.send("+254700000000", "ping"))
+    assert provider.sent == queued + 2
+
+def queue_one():
+    db = SessionLocal()
+    try:
+        tenant_id = db.query(Tenant.id).order_by(Tenant.id).first()[0]
+        notif = save_notification(db, tenant_id, "Receipt", "receipt", "test")
+        db.commit()
+        return notif.id
+    finally:
+        db.close()
+
+def row(notification_id: int):
+    db = SessionLocal()
+    try:
+        return db.query(Notification).get(notification_id)
+    finally:
+        db.close()
+
+def make_due(notification_id: int):
+    # as if the retry time, or the lease, had run out
+    db = SessionLocal()
+    try:
+        db.execute(update(Notification).where(Notification.id == notification_id).values(
+            next_attempt_at=now_ts() - timedelta(seconds=1)
+        ))
+        db.commit()
+    finally:
+        db.close()
+
+def test_failed_send_is_retried_with_backoff(client, monkeypatch):
+    monkeypatch.setenv("SMS_RETRY_BASE_SECONDS", "60")
+    notification_id = queue_one()
+    before = now_ts()
+    assert notifications.dispatch_pending(notifications.FakeProvider(failure_rate=1))["retrying"] == 1
+    n = row(notification_id)
+    assert (n.status, n.attempts, n.last_error) == ("queued", 1, "fake provider failure")
+    assert before + timedelta(seconds=48) <= n.next_attempt_at <= now_ts() + timedelta(seconds=72)
+    # not due again until then
+    assert notifications.dispatch_pending(notifications.FakeProvider())["claimed"] == 0
+
+    make_due(notification_id)
+    before = now_ts()
+    assert notifications.dispatch_pending(notifications.FakeProvider(failure_rate=1))["retrying"] == 1
+    n = row(notification_id)
+    assert n.attempts == 2
+    assert before + timedelta(seconds=96) <= n.next_attempt_at <= now_ts() + timedelta(seconds=144)
+
+    make_due(notification_id)
+    provider = notifications.FakeProvider()
+    assert notifications.dispatch_pending(provider)["sent"] == 1
+    n = row(notification_id)
+    assert (n.status, n.attempts, n.next_attempt_at) == ("sent", 3, None)
+    assert len(provider.sent) == 1
+
+def test_gives_up_at_max_attempts(client, monkeypatch):
+    monkeypatch.setenv("SMS_MAX_ATTEMPTS", "2")
+    notification_id = queue_one()
+    failing = notifications.FakeProvider(failure_rate=1)
+    assert notifications.dispatch_pending(failing)["retrying"] == 1
+    make_due(notification_id)
+    assert notifications.dispatch_pending(failing)["failed"] == 1
+    n = row(notification_id)
+    assert (n.status, n.attempts, n.next_attempt_at) == ("failed", 2, None)
+    make_due(notification_id)
+    assert notifications.dispatch_pending(notifications.FakeProvider())["claimed"] == 0
+
+def test_permanent_error_is_not_retried(client):
+    class Rejecting(notifications.SmsProvider):
+        async def send(self, phone: str, message: str):
+            raise notifications.SendError("invalid number", retryable=False)
+
+    notification_id = queue_one()
+    assert notifications.dispatch_pending(Rejecting())["failed"] == 1
+    assert (row(notification_id).status, row(notification_id).attempts) == ("failed", 1)
+
+def test_expired_lease_is_reclaimed(client):
+    notification_id = queue_one()
+    # a worker claims the row, then dies before recording the outcome
+    db = SessionLocal()
+    try:
+        assert [r.id for r in notifications.claim_batch(db, 10, now_ts())] == [notification_id]
+        db.commit()
+    finally:
+        db.close()
+    assert row(notification_id).status == "sending"
+    provider = notifications.FakeProvider()
+    assert notifications.dispatch_pending(provider)["claimed"] == 0
+
+    make_due(notification_id)
+    assert notifications.dispatch_pending(provider)["sent"] == 1
+    assert (row(notification_id).status, len(provider.sent)) == ("sent", 1)
@@ -0,0 +1,46 @@
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import func
+from base import SessionLocal
+from models import HouseTenant, House, Invoice, Payment
+from utils import today_date
+
+THREADS = 8
+PAYMENTS = 40
+
+def test_parallel_payments_for_one_house(client):
+    db = SessionLocal()
+    try:
+        house_id, tenant_id, rent = db.query(HouseTenant.house_id, HouseTenant.tenant_id, House.monthly_rent).join(
+            House, House.id == HouseTenant.house_id
+        ).filter(HouseTenant.status == "active", House.monthly_rent > 0).order_by(HouseTenant.id).first()
+    finally:
+        db.close()
+    today = today_date()
+
+    def pay(n: int):
+        # amounts that split across months, so payments race to create the same new invoices
+        return client.post("/payments", json={
+            "house_id": house_id, "tenant_id": tenant_id, "method": "cash", "amount": rent // 3 + n,
+            "target_year": today.year, "target_month": today.month
+        }).status_code
+
+    with ThreadPoolExecutor(THREADS) as pool:
+        assert set(pool.map(pay, range(PAYMENTS))) == {200}
+
+    db = SessionLocal()
+    try:
+        duplicates = db.query(Invoice.period_start).filter(Invoice.house_id == house_id).group_by(
+            Invoice.period_start
+        ).having(func.count() > 1).all()
+        assert duplicates == []
+        assert db.query(Invoice).filter(Invoice.house_id == house_id, Invoice.paid_total > Invoice.amount_due).count() == 0
+        invoiced = db.query(func.sum(Invoice.paid_total)).filter(Invoice.house_id == house_id).scalar()
+        paid = db.query(func.sum(Payment.amount)).filter(Payment.house_id == house_id, Payment.status == "confirmed").scalar()
+        assert invoiced == paid
+        per_invoice = dict(db.query(Payment.invoice_id, func.sum(Payment.amount)).filter(
+            Payment.house_id == house_id, Payment.status == "confirmed"
+        ).group_by(Payment.invoice_id).all())
+        for invoice_id, paid_total in db.query(Invoice.id, Invoice.paid_total).filter(Invoice.house_id == house_id):
+            assert paid_total == per_invoice.get(invoice_id, 0)
+    finally:
+        db.close()
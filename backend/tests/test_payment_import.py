@@ -0,0 +1,52 @@
+import json
+from base import SessionLocal
+from models import HouseTenant
+import payment_import
+from utils import today_date
+
+def assignment():
+    db = SessionLocal()
+    try:
+        return db.query(HouseTenant.house_id, HouseTenant.tenant_id).filter(HouseTenant.status == "active").order_by(HouseTenant.id).first()
+    finally:
+        db.close()
+
+def upload(client, rows: list, batch_size: int = 500):
+    body = "".join(json.dumps(r) + "\n" for r in rows)
+    r = client.post(f"/payments/bulk?format=ndjson&batch_size={batch_size}", content=body)
+    assert r.status_code == 200
+    lines = [json.loads(line) for line in r.text.splitlines()]
+    return lines[:-1], lines[-1]["summary"]
+
+def row(tx_ref: str, **fields):
+    house_id, tenant_id = assignment()
+    today = today_date()
+    return {"house_id": house_id, "tenant_id": tenant_id, "method": "cash", "amount": 1000,
+            "target_year": today.year, "target_month": today.month, "tx_ref": tx_ref, **fields}
+
+def test_out_of_range_rows_are_row_errors(client):
+    results, summary = upload(client, [
+        row("IMP0001"),
+        row("IMP0002", target_year=0),
+        row("IMP0003", paid_at="1899-12-31T10:00:00"),
+        row("IMP0004", paid_at="not a date"),
+        row("IMP0005", paid_at=f"{today_date().isoformat()}T08:00:00+03:00"),
+    ])
+    assert [r["status"] for r in results] == ["imported", "error", "error", "error", "imported"]
+    assert results[1]["detail"] == "Invalid target year"
+    assert results[2]["detail"] == "paid_at is out of range"
+    assert summary == {"imported": 2, "skipped": 0, "error": 3}
+
+def test_failed_batch_does_not_end_the_report(client, monkeypatch):
+    allocate_batch = payment_import.allocate_batch
+
+    def failing(db, items, houses, ts):
+        if any(i["tx_ref"] == "IMP0102" for i in items):
+            raise RuntimeError("boom")
+        return allocate_batch(db, items, houses, ts)
+
+    monkeypatch.setattr(payment_import, "allocate_batch", failing)
+    results, summary = upload(client, [row("IMP0101"), row("IMP0102"), row("IMP0103")], batch_size=1)
+    assert [r["status"] for r in results] == ["imported", "error", "imported"]
+    assert results[1]["detail"] == "Batch failed: boom"
+    assert summary == {"imported": 2, "skipped": 0, "error": 1}
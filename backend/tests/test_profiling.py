@@ -0,0 +1,10 @@
+def test_profiles_need_the_token(client, monkeypatch, tmp_path):
+    monkeypatch.setenv("PROFILE_DIR", str(tmp_path))
+    # no token configured: profiles cannot be read at all
+    assert client.get("/admin/profiles", headers={"X-Profile": ""}).status_code == 403
+    monkeypatch.setenv("PROFILE_TOKEN", "secret")
+    assert client.get("/admin/profiles").status_code == 403
+    assert client.get("/admin/profiles", headers={"X-Profile": "wrong"}).status_code == 403
+    assert client.get("/admin/profiles/20260101-000000-000000-1-1").status_code == 403
+    assert client.get("/admin/profiles", headers={"X-Profile": "secret"}).json() == []
+    assert client.get("/admin/profiles/20260101-000000-000000-1-1", headers={"X-Profile": "secret"}).status_code == 404
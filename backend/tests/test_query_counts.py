@@ -0,0 +1,28 @@
+import pytest
+from fastapi.testclient import TestClient
+from base import Base, get_engine
+import main
+import seed
+
+def statements(path: str, houses: int, years: int = 1):
+    # Statements run by one GET on a fresh estate of `houses` houses and `years` of payments
+    engine = get_engine()
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    seed.generate(houses, 1, years, seed=7)
+    with TestClient(main.app) as c:
+        r = c.get(path)
+    assert r.status_code == 200
+    return int(r.headers["x-query-count"])
+
+@pytest.fixture(autouse=True)
+def query_count_header(monkeypatch):
+    monkeypatch.setenv("METRICS_QUERY_COUNT_HEADER", "1")
+
+def test_houses_statements_do_not_grow_with_houses():
+    counts = [statements("/houses", n) for n in (10, 100, 1000)]
+    assert counts == [8, 8, 8]
+
+def test_stats_statements_do_not_grow_with_payments():
+    counts = [statements("/stats", houses, years) for houses, years in ((10, 1), (100, 2), (300, 5))]
+    assert counts == [4, 4, 4]
@@ -0,0 +1,46 @@
+import tempfile
+import time
+from fastapi.testclient import TestClient
+import pytest
+from sqlalchemy import create_engine
+from base import Base
+import main
+import seed
+
+# A second SQLite file stands in for the replica. It is seeded with fewer houses than
+# the primary, so GET /houses shows which database answered.
+
+@pytest.fixture
+def replica(estate, monkeypatch):
+    url = f"sqlite:///{tempfile.mkdtemp()}/replica.db"
+    engine = create_engine(url)
+    Base.metadata.create_all(engine)
+    seed.generate(3, 1, 1, seed=7, bind=engine)
+    engine.dispose()
+    monkeypatch.setenv("DATABASE_REPLICA_URL", url)
+    monkeypatch.setenv("REPLICA_STICKY_SECONDS", "5")
+    with TestClient(main.app) as c:
+        yield c
+
+def house_count(client, **kwargs):
+    r = client.get("/houses", **kwargs)
+    assert r.status_code == 200
+    return len(r.json())
+
+def test_reads_go_to_the_replica(replica):
+    assert house_count(replica) == 3
+
+def test_read_after_write_goes_to_the_primary(replica):
+    r = replica.post("/houses", json={"number": 99, "type": "single", "monthly_rent": 3000})
+    assert r.status_code == 200
+    until = r.headers["x-read-primary-until"]
+    # the cookie set by the write, then the header the SPA echoes
+    assert house_count(replica) == 11
+    replica.cookies.clear()
+    assert house_count(replica) == 3
+    assert house_count(replica, headers={"X-Read-Primary-Until": until}) == 11
+
+def test_client_cannot_pin_reads_to_the_primary(replica):
+    assert house_count(replica, headers={"X-Read-Primary-Until": f"{time.time() + 3600}"}) == 3
+    assert house_count(replica, headers={"X-Read-Primary-Until": "inf"}) == 3
+    assert house_count(replica, headers={"X-Read-Primary-Until": f"{time.time() - 1}"}) == 3
@@ -0,0 +1,49 @@
+from base import SessionLocal
+from models import Tenant
+import tenant_search
+from tenant_search import tenant_index
+from utils import normalize_phone
+
+def insert_tenant(name: str, phone: str):
+    # Straight into the database, as another worker or seed.py would
+    db = SessionLocal()
+    try:
+        db.add(Tenant(full_name=name, phone=phone, phone_normalized=normalize_phone(phone), gov_id=phone[-8:], is_active=True))
+        db.commit()
+    finally:
+        db.close()
+
+def names(client, q: str):
+    r = client.get(f"/tenants/search?q={q}")
+    assert r.status_code == 200
+    return [t["full_name"] for t in r.json()["items"]]
+
+def test_finds_tenants_written_elsewhere(client):
+    assert names(client, "xylo") == []
+    insert_tenant("Xylophone Wanjiru", "+254799000001")
+    assert names(client, "xylo") == ["Xylophone Wanjiru"]
+    assert names(client, "phone wan") == ["Xylophone Wanjiru"]
+
+def test_new_tenants_extend_the_index(client):
+    names(client, "xylo")
+    built = tenant_index.names
+    insert_tenant("Xylo Kamau", "+254799000002")
+    assert names(client, "xylo") == ["Xylo Kamau"]
+    assert tenant_index.names is built
+
+def test_payments_do_not_rebuild_the_index(client):
+    names(client, "xylo")
+    built = tenant_index.names
+    house = client.get("/houses").json()[0]
+    tenant = house["tenants"][0]
+    assert client.post("/payments", json={"house_id": house["id"], "tenant_id": tenant["id"], "method": "cash",
+                                          "amount": 100, "target_year": 2030, "target_month": 1}).status_code == 200
+    names(client, "xylo")
+    assert tenant_index.names is built
+
+def test_short_and_common_queries_scan(client, monkeypatch):
+    insert_tenant("Xy Otieno", "+254799000003")
+    assert names(client, "xy") == ["Xy Otieno"]
+    monkeypatch.setattr(tenant_search, "INDEX_MAX_IDS", 0)
+    expected = {t["id"] for t in client.get("/tenants").json() if "otieno" in t["full_name"].lower()}
+    assert {t["id"] for t in client.get("/tenants/search?q=otieno&limit=100").json()["items"]} == expected
@@ -1,6 +1,7 @@
 from datetime import date, datetime
 import calendar
 import os
+import re
 
 def month_bounds(dt: date):
     start = dt.replace(day=1)
@@ -25,3 +26,18 @@ def due_date_for_month(dt: date):
     last_day = calendar.monthrange(dt.year, dt.month)[1]
     day = min(due_day, last_day)
     return dt.replace(day=day)
+
+def shift_month(year: int, month: int, delta: int):
+    idx = year * 12 + (month - 1) + delta
+    return idx // 12, idx % 12 + 1
+
+def normalize_phone(phone: str | None):
+    # Kenyan numbers to a bare 254XXXXXXXXX form: +254712..., 254712..., 0712... and 712... all match
+    digits = re.sub(r"\D", "", phone or "")
+    if digits.startswith("254"):
+        return digits
+    if digits.startswith("0"):
+        return "254" + digits[1:]
+    if digits[:1] in ("7", "1") and len(digits) <= 9:
+        return "254" + digits
+    return digits
@@ -4,9 +4,25 @@ import Dashboard from "./components/Dashboard.jsx";
 import Houses from "./components/Houses.jsx";
 import Tenants from "./components/Tenants.jsx";
 import Payments from "./components/Payments.jsx";
+import { subscribe, mergeRecent } from "./events.js";
 
 const API = import.meta.env.VITE_API_URL;
 
+// Read-your-writes: after a write the API says how long to keep reading from the
+// primary database; echo that back on every request until it passes.
+let readPrimaryUntil = 0;
+axios.interceptors.request.use(config => {
+  if (readPrimaryUntil > Date.now() / 1000) {
+    config.headers["X-Read-Primary-Until"] = String(readPrimaryUntil);
+  }
+  return config;
+});
+axios.interceptors.response.use(res => {
+  const until = parseFloat(res.headers["x-read-primary-until"]);
+  if (until) readPrimaryUntil = until;
+  return res;
+});
+
 const layout = {
   wrapper: { display: "flex", minHeight: "100vh", background: "#F8FAFC" },
   sidebar: { width: "260px", background: "#0A2540", color: "white", padding: "24px", display: "flex", flexDirection: "column", gap: "8px" },
@@ -38,6 +54,18 @@ export default function App() {
 
   useEffect(() => { fetchStats(); }, []);
 
+  // Patch the dashboard from change events: month totals, the current month's bar
+  // and the recent payments list
+  useEffect(() => subscribe(event => {
+    if (event.type === "resync" || event.type === "refresh") return fetchStats();
+    if (!event.totals) return;
+    setStats(prev => {
+      const trend = prev.trend.map((t, i) => i === prev.trend.length - 1 ? { ...t, received: event.totals.received } : t);
+      const recent = event.payments ? mergeRecent(prev.recent_payments, event.payments) : prev.recent_payments;
+      return { ...prev, ...event.totals, trend, recent_payments: recent };
+    });
+  }), []);
+
   const NavItem = ({ name }) => (
     <div onClick={() => setView(name)} style={{ ...layout.navItem, ...(view === name ? layout.navActive : {}) }}>
       {name}
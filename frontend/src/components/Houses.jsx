@@ -1,5 +1,6 @@
 import { useEffect, useState } from "react";
 import axios from "axios";
+import { subscribe, patchById, patchTenantRows } from "../events.js";
 
 const card = { background: "white", borderRadius: "12px", padding: "16px", border: "1px solid #E2E8F0", color: "#0F172A", boxShadow: "0 6px 18px rgba(10,37,64,0.06)" };
 const inputStyle = { padding: 8, border: "1px solid #E2E8F0", borderRadius: 8, color: "#0F172A", background: "white" };
@@ -32,6 +33,12 @@ export default function Houses({ api, onChanged }) {
 
   useEffect(() => { load(); }, []);
 
+  useEffect(() => subscribe(event => {
+    if (event.type === "resync" || event.type === "refresh") return load();
+    if (event.houses) setHouses(prev => patchById(prev, event.houses, (a, b) => a.number - b.number));
+    if (event.tenants) setTenants(prev => patchTenantRows(prev, event.tenants));
+  }), []);
+
   const addTenant = async (houseId, tenantId) => {
     await axios.post(`${api}/houses/${houseId}/tenants`, { tenant_id: tenantId });
     onChanged && onChanged();
@@ -1,5 +1,6 @@
 import { useEffect, useState } from "react";
 import axios from "axios";
+import { subscribe, patchById, mergeRecent } from "../events.js";
 
 const baseTable = {
   width: "100%",
@@ -99,6 +100,12 @@ export default function Payments({ api, onRecorded }) {
     load();
   }, []);
 
+  useEffect(() => subscribe(event => {
+    if (event.type === "resync" || event.type === "refresh") return load();
+    if (event.houses) setHouses(prev => patchById(prev, event.houses, (a, b) => a.number - b.number));
+    if (event.payments) setRecent(prev => mergeRecent(prev, event.payments));
+  }), []);
+
   const tenantsOfHouse = () => {
     const h = houses.find((h) => h.id === Number(form.house_id));
     return h ? h.tenants : [];
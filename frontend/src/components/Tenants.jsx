@@ -1,5 +1,6 @@
 import { useEffect, useState } from "react";
 import axios from "axios";
+import { subscribe, patchTenantRows } from "../events.js";
 
 const card = {
   background: "white",
@@ -59,6 +60,11 @@ export default function Tenants({ api, onChanged }) {
 
   useEffect(() => { load(); }, []);
 
+  useEffect(() => subscribe(event => {
+    if (event.type === "resync") return load();
+    if (event.tenants) setTenants(prev => patchTenantRows(prev, event.tenants));
+  }), []);
+
   const create = async () => {
     if (!form.full_name || !form.phone || !form.gov_id) return;
     try {
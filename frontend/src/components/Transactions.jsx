@@ -3,16 +3,18 @@ import axios from "axios";
 
 export default function Transactions({ api }) {
   const [txs, setTxs] = useState([]);
+  const [cursor, setCursor] = useState(null);
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState("");
 
-  const load = async () => {
+  // Keyset-paginated listing: pass next_cursor back to fetch the following page
+  const load = async (from = null) => {
     try {
       setLoading(true);
       setError("");
-      // Build transaction view from payments endpoint (we rely on ledger in Houses for deep details)
-      const res = await axios.get(`${api}/stats`); // recent payments in stats
-      setTxs(res.data.recent_payments || []);
+      const res = await axios.get(`${api}/payments`, { params: { limit: 50, ...(from ? { cursor: from } : {}) } });
+      setTxs(prev => (from ? [...prev, ...res.data.items] : res.data.items));
+      setCursor(res.data.next_cursor);
     } catch (e) { setError(e.response?.data?.detail || e.message); }
     finally { setLoading(false); }
   };
@@ -21,7 +23,7 @@ export default function Transactions({ api }) {
 
   return (
     <div>
-      <h2 style={{ fontWeight: 800, color: "#0A2540" }}>Transactions (recent)</h2>
+      <h2 style={{ fontWeight: 800, color: "#0A2540" }}>Transactions</h2>
       {loading && <div style={{ color: "#64748B" }}>Loading transactions...</div>}
       {error && <div style={{ color: "#C2410C" }}>Error: {error}</div>}
       <div style={{ background: "white", borderRadius: "12px", padding: "16px", border: "1px solid #E2E8F0", color: "#0F172A" }}>
@@ -32,8 +34,8 @@ export default function Transactions({ api }) {
             </tr>
           </thead>
           <tbody>
-            {txs.map((t, i) => (
-              <tr key={i}>
+            {txs.map(t => (
+              <tr key={t.id}>
                 <td>{t.house_number}</td>
                 <td>{t.tenant_name}</td>
                 <td>{t.method}</td>
@@ -44,6 +46,15 @@ export default function Transactions({ api }) {
             ))}
           </tbody>
         </table>
+        {cursor && (
+          <button
+            style={{ marginTop: 12, background: "#0A2540", color: "white", padding: "8px 12px", border: "none", borderRadius: 8 }}
+            disabled={loading}
+            onClick={() => load(cursor)}
+          >
+            Load more
+          </button>
+        )}
       </div>
     </div>
   );
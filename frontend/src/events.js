@@ -0,0 +1,58 @@
+// Live change events from GET /events (Server-Sent Events): one connection per tab,
+// shared by every view. Views patch their state from other users' writes as they are
+// published. "resync" (events were missed) and "refresh" (a change too broad to
+// describe) mean the view should refetch instead. A view still refetches after its own
+// writes: the hub is per server process, so with several workers the write may land on
+// one that this tab's stream is not connected to.
+const API = import.meta.env.VITE_API_URL;
+
+const handlers = new Set();
+let source = null;
+let lastId = "";
+
+function connect() {
+  // EventSource reconnects by itself (sending Last-Event-ID) when a stream ends; it
+  // gives up only when the server refuses, so then start over after a pause
+  source = new EventSource(`${API}/events${lastId ? `?last_event_id=${lastId}` : ""}`);
+  source.onmessage = (e) => {
+    lastId = e.lastEventId || lastId;
+    const event = JSON.parse(e.data);
+    handlers.forEach(h => h(event));
+  };
+  source.onerror = () => {
+    if (source.readyState === EventSource.CLOSED) {
+      source = null;
+      setTimeout(() => { if (handlers.size && !source) connect(); }, 5000);
+    }
+  };
+}
+
+export function subscribe(handler) {
+  handlers.add(handler);
+  if (!source) connect();
+  return () => { handlers.delete(handler); };
+}
+
+// Replace the entries with matching ids (and add new ones), keeping `order`
+export function patchById(list, items, order) {
+  const byId = new Map(items.map(x => [x.id, x]));
+  const out = list.map(x => byId.get(x.id) ?? x);
+  const seen = new Set(list.map(x => x.id));
+  const added = items.filter(x => !seen.has(x.id));
+  return order ? [...out, ...added].sort(order) : [...out, ...added];
+}
+
+// GET /tenants has one row per assignment: swap all of a tenant's rows for the event's
+export function patchTenantRows(rows, tenants) {
+  const ids = new Set(tenants.map(t => t.id));
+  return [...rows.filter(r => !ids.has(r.id)), ...tenants];
+}
+
+// The dashboard's recent payments (one row per month allocated), newest first
+export function mergeRecent(recent, payments, limit = 10) {
+  const rows = payments.flatMap(p => p.allocations.map(a => ({
+    house_number: p.house_number, tenant_name: p.tenant_name, amount: a.applied, method: p.method,
+    paid_at: p.paid_at, for_month: `${a.year}-${String(a.month).padStart(2, "0")}`
+  })));
+  return [...rows, ...recent].sort((a, b) => b.paid_at.localeCompare(a.paid_at)).slice(0, limit);
+}